@@ -4,16 +4,32 @@ import asyncio
 import json
 import logging
 import os
-from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
+import re
+import time
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
 
 from fastapi import HTTPException
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from pydantic import ValidationError
 
+from llm_policy import llm_policy
+from context import ContextWindow, build_context, compact_tool_message, message_tokens
+from concurrency import admission, session_turn
+from conversations import ConversationTurn, History, append_messages, has_history, messages_between, save_summary
 from db import get_db
+from tool_cache import TOOL_CACHE_ENABLED, tool_cache
 from tools import TOOL_SCHEMAS
-import tools as tool_impl
+from tool_registry import format_validation_error, get_tool
+import intent_router
+from answer_cache import ANSWER_CACHE_ENABLED, ANSWER_CACHE_TTL_SECONDS, answer_cache
+import metrics
+from streaming import sse_stream
+import tracing
 
 logger = logging.getLogger("campus_admin.agent")
 
@@ -22,27 +38,82 @@ SYSTEM_PROMPT = (
     "You are Campus Admin Agent, an AI assistant for campus administration. "
     "You can manage student records, provide analytics, answer FAQs, and send notifications. "
     "Use the available tools to fetch or update data rather than guessing. "
+    "When a request involves several students, use the batch tools (get_students, update_students, "
+    "send_emails) with all their ids in one call instead of one call per student. "
+    "Tool results from earlier in the conversation are included; reuse them instead of calling the "
+    "same tool again unless the data may have changed since. "
     "Be concise and include relevant details in your final answer."
 )
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a campus administrator and an assistant. "
+    "Merge the new messages into the current summary. Keep names, student ids, decisions, open requests "
+    "and figures the administrator may refer back to; drop pleasantries. Reply with the summary only."
+)
+MAX_TOOL_ROUNDS = 4
+# Prompt budget for system prompt + rolling summary + recent history
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", AGENT_MODEL)
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "400"))
+# Extra in-prompt messages folded into each refresh so the summary is not rebuilt every turn
+SUMMARY_LOOKAHEAD_MESSAGES = int(os.getenv("SUMMARY_LOOKAHEAD_MESSAGES", "8"))
+SUMMARY_MAX_SOURCE_MESSAGES = 200
+SUMMARY_MAX_MESSAGE_CHARS = 2000
+# Max read-only tools running at once within a single chat turn
+AGENT_TOOL_CONCURRENCY = int(os.getenv("AGENT_TOOL_CONCURRENCY", "4"))
+
+# Outbound HTTP pool for the LLM provider; every in-flight chat turn holds at most one connection
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+
+# Per-tool call counts and latency, reported under "tools" by GET /metrics
+tool_latency = metrics.LatencyStats()
+metrics.register("tools", tool_latency.snapshot)
+# Whole-turn latency: "agent" for LLM turns, "fast_path"/"answer_cache" for answers served locally
+turn_latency = metrics.LatencyStats()
+metrics.register("turns", turn_latency.snapshot)
+# Context size per turn (estimated and provider-reported tokens) and summary refreshes
+context_stats = metrics.Counters()
+metrics.register("context", context_stats.snapshot)
+
+# Sessions with a summary refresh in flight, and the tasks running them
+_summarizing: Set[str] = set()
+_summary_tasks: Set[asyncio.Task] = set()
 
-_client: Optional[OpenAI] = None
+_client: Optional[AsyncOpenAI] = None
 
-def get_openai_client() -> OpenAI:
+def get_openai_client() -> AsyncOpenAI:
     global _client
     if _client is None:
         try:
+            http_client = DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                ),
+                timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=10.0),
+            )
             # Check if we're using OpenRouter (detect by API key format)
             api_key = os.getenv("OPENAI_API_KEY")
-            if api_key and api_key.startswith("sk-or-"):
+            base_url = os.getenv("OPENAI_BASE_URL")
+            if base_url:
+                # Explicit endpoint (self-hosted gateway or the local mock server in bench/)
+                _client = AsyncOpenAI(
+                    api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0
+                )
+                logger.info("Initialized OpenAI client for %s", base_url)
+            elif api_key and api_key.startswith("sk-or-"):
                 # OpenRouter configuration
-                _client = OpenAI(
+                _client = AsyncOpenAI(
                     api_key=api_key,
                     base_url="https://openrouter.ai/api/v1",
+                    http_client=http_client,
+                    max_retries=0,
                 )
                 logger.info("Initialized OpenAI client for OpenRouter")
             else:
                 # Standard OpenAI configuration
-                _client = OpenAI()
+                _client = AsyncOpenAI(http_client=http_client, max_retries=0)
                 logger.info("Initialized OpenAI client for OpenAI")
         except Exception as e:
             logger.exception("Failed to initialize OpenAI client: %s", e)
@@ -50,213 +121,616 @@ def get_openai_client() -> OpenAI:
     return _client
 
 
-# -----------------------------
-# Conversation Memory (MongoDB)
-# -----------------------------
-async def _ensure_conversation(db: AsyncIOMotorDatabase, session_id: str) -> Dict[str, Any]:
-    conv = await db.conversations.find_one({"session_id": session_id})
-    if conv:
-        return conv
-    doc = {
-        "session_id": session_id,
-        "created_at": datetime.now(timezone.utc),
-        "updated_at": datetime.now(timezone.utc),
-        "messages": [],  # list of {role, content}
-    }
-    await db.conversations.insert_one(doc)
-    return doc
-
-
-async def _append_message(db: AsyncIOMotorDatabase, session_id: str, role: str, content: Any) -> None:
-    await db.conversations.update_one(
-        {"session_id": session_id},
-        {
-            "$push": {"messages": {"role": role, "content": content}},
-            "$set": {"updated_at": datetime.now(timezone.utc)},
-        },
-        upsert=True,
-    )
-
-
-async def _get_messages(db: AsyncIOMotorDatabase, session_id: str, limit: int = 10) -> List[Dict[str, Any]]:
-    conv = await _ensure_conversation(db, session_id)
-    messages: List[Dict[str, Any]] = conv.get("messages", [])[-limit:]
-    return messages
+async def close_openai_client() -> None:
+    """Close the shared LLM client and release its connection pool."""
+    global _client
+    try:
+        if _client is not None:
+            await _client.close()
+    finally:
+        _client = None
 
 
 # -----------------------------
 # Tool Invocation
 # -----------------------------
 async def _call_tool(db: AsyncIOMotorDatabase, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    with tracing.span("tool", tool=name) as span:
+        result = await _invoke_tool(db, name, arguments, span)
+        span.set(ok=bool(result.get("ok")))
+        return result
+
+
+async def _invoke_tool(
+    db: AsyncIOMotorDatabase, name: str, arguments: Dict[str, Any], span: tracing.Span
+) -> Dict[str, Any]:
+    spec = get_tool(name)
+    if spec is None:
+        return {"ok": False, "error": f"Unknown tool: {name}"}
     try:
-        if name == "add_student":
-            return await tool_impl.add_student(db, arguments)
-        if name == "get_student":
-            return await tool_impl.get_student(db, arguments["student_id"])
-        if name == "update_student_tool":
-            return await tool_impl.update_student_tool(db, arguments["student_id"], arguments.get("updates", {}))
-        if name == "delete_student_tool":
-            return await tool_impl.delete_student_tool(db, arguments["student_id"])
-        if name == "list_students_tool":
-            return await tool_impl.list_students_tool(db, arguments.get("department"), arguments.get("status"), arguments.get("limit", 20))
-        if name == "get_total_students":
-            return await tool_impl.get_total_students(db)
-        if name == "get_students_by_department":
-            return await tool_impl.get_students_by_department(db)
-        if name == "get_recent_onboarded_students":
-            return await tool_impl.get_recent_onboarded_students(db, arguments.get("limit", 5))
-        if name == "get_active_students_last_7_days":
-            return await tool_impl.get_active_students_last_7_days(db)
-        if name == "get_cafeteria_timings":
-            return await tool_impl.get_cafeteria_timings()
-        if name == "get_library_hours":
-            return await tool_impl.get_library_hours()
-        if name == "get_event_schedule":
-            return await tool_impl.get_event_schedule()
-        if name == "send_email":
-            return await tool_impl.send_email(arguments["student_id"], arguments["message"])
+        validated = spec.validate(arguments)
+    except ValidationError as e:
+        return {"ok": False, "error": f"Invalid arguments for tool {name}: {format_validation_error(e)}"}
+
+    use_cache = spec.cacheable and TOOL_CACHE_ENABLED
+    if use_cache:
+        cache_args = validated.model_dump(mode="json")
+        cached = tool_cache.get(name, cache_args)
+        span.set(cached=cached is not None)
+        if cached is not None:
+            return cached
+        generation = tool_cache.generation
+
+    kwargs = spec.bind(validated)
+    started = time.perf_counter()
+    ok = False
+    try:
+        call = spec.fn(db, **kwargs) if spec.needs_db else spec.fn(**kwargs)
+        result = await asyncio.wait_for(call, timeout=spec.timeout)
+        ok = bool(result.get("ok"))
+    except asyncio.TimeoutError:
+        logger.error("Tool '%s' timed out after %.1fs", name, spec.timeout)
+        return {"ok": False, "error": f"Tool {name} timed out"}
     except Exception as e:
         logger.exception("Tool '%s' failed: %s", name, e)
         return {"ok": False, "error": f"Tool {name} failed: {e}"}
-    return {"ok": False, "error": f"Unknown tool: {name}"}
+    finally:
+        tool_latency.observe(name, time.perf_counter() - started, ok)
+
+    if use_cache and ok:
+        tool_cache.put(name, cache_args, result, spec.ttl, generation)
+    return result
+
+
+class _ToolScheduler:
+    """Runs a turn's tool calls: read-only tools concurrently up to AGENT_TOOL_CONCURRENCY,
+    everything else one at a time in submission order.
+
+    A write waits for every call submitted before it, and later reads wait for that write,
+    so results match sequential execution while independent reads overlap.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase) -> None:
+        self._db = db
+        self._sem = asyncio.Semaphore(AGENT_TOOL_CONCURRENCY)
+        self._submitted: List[asyncio.Task] = []
+        self._last_write: Optional[asyncio.Task] = None
+        # Every tool requested this turn, in order (the turn's tool trace)
+        self.tool_names: List[str] = []
+
+    def submit(self, name: str, raw_arguments: Optional[str]) -> asyncio.Task:
+        self.tool_names.append(name)
+        spec = get_tool(name)
+        read_only = spec is not None and spec.read_only
+        if read_only:
+            wait_for = [self._last_write] if self._last_write is not None else []
+        else:
+            wait_for = list(self._submitted)
+        task = asyncio.create_task(self._run(name, raw_arguments, wait_for, read_only))
+        self._submitted.append(task)
+        if not read_only:
+            self._last_write = task
+        return task
+
+    async def _run(
+        self,
+        name: str,
+        raw_arguments: Optional[str],
+        wait_for: List[asyncio.Task],
+        read_only: bool,
+    ) -> Dict[str, Any]:
+        if wait_for:
+            await asyncio.wait(wait_for)
+        try:
+            args = json.loads(raw_arguments or "{}")
+        except json.JSONDecodeError as e:
+            return {"ok": False, "error": f"Invalid arguments for tool {name}: {e}"}
+        if read_only:
+            async with self._sem:
+                return await _call_tool(self._db, name, args)
+        return await _call_tool(self._db, name, args)
+
+    def cancel(self) -> None:
+        for task in self._submitted:
+            task.cancel()
+
+
+# -----------------------------
+# Context and rolling summary
+# -----------------------------
+def _entry(role: str, content: str, **extra: Any) -> Dict[str, Any]:
+    """A message to persist, carrying its token count so later turns need not re-tokenize it."""
+    msg: Dict[str, Any] = {"role": role, "content": content, **extra}
+    msg["tokens"] = message_tokens(msg, AGENT_MODEL)
+    return msg
+
+
+def _stored_tool_round(
+    assistant: Dict[str, Any], tool_messages: List[Dict[str, Any]]
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """The assistant ``tool_calls`` message and compacted tool results as persisted for later turns."""
+    names = {tc["id"]: tc["function"]["name"] for tc in assistant["tool_calls"]}
+    stored = {**assistant, "tokens": message_tokens(assistant, AGENT_MODEL)}
+    return stored, [compact_tool_message(m, names.get(m["tool_call_id"]), AGENT_MODEL) for m in tool_messages]
+
+
+async def _prepare_turn(turn: ConversationTurn, user_message: str) -> ContextWindow:
+    history = await turn.begin(_entry("user", user_message))
+    with tracing.span("build_context") as span:
+        window = build_context(SYSTEM_PROMPT, history.summary, history.messages, CONTEXT_TOKEN_BUDGET, AGENT_MODEL)
+        span.set(context_tokens=window.prompt_tokens, dropped=window.dropped)
+    context_stats.incr("turns")
+    context_stats.incr("context_tokens", window.prompt_tokens)
+    context_stats.incr("history_messages_dropped", window.dropped)
+    context_stats.incr("tool_messages_replayed", window.replayed_tool_messages)
+    _schedule_summary(turn.db, turn.session_id, history, window)
+    return window
+
+
+def _add_usage(totals: Dict[str, int], usage: Any) -> None:
+    if usage is None:
+        return
+    totals["llm_calls"] = totals.get("llm_calls", 0) + 1
+    totals["prompt_tokens"] = totals.get("prompt_tokens", 0) + (usage.prompt_tokens or 0)
+    totals["completion_tokens"] = totals.get("completion_tokens", 0) + (usage.completion_tokens or 0)
+
+
+def _trace_usage(span: tracing.Span, usage: Any) -> None:
+    if usage is not None:
+        span.set(prompt_tokens=usage.prompt_tokens or 0, completion_tokens=usage.completion_tokens or 0)
+
+
+def _turn_usage(window: ContextWindow, totals: Dict[str, int]) -> Dict[str, int]:
+    """Record the turn's token usage in metrics and return it for storage on the reply."""
+    for key, value in totals.items():
+        context_stats.incr(key, value)
+    return {"context_tokens": window.prompt_tokens, **totals}
+
+
+def _schedule_summary(db: AsyncIOMotorDatabase, session_id: str, history: History, window: ContextWindow) -> None:
+    """Refresh the rolling summary in the background when messages have left the prompt unsummarized."""
+    older_exist = window.dropped > 0 or history.message_count > len(history.messages)
+    if not older_exist or session_id in _summarizing:
+        return
+    before = history.messages[window.dropped].get("created_at")
+    if before is None or (history.summary_before is not None and history.summary_before >= before):
+        return
+    target_idx = min(window.dropped + SUMMARY_LOOKAHEAD_MESSAGES, len(history.messages) - 1)
+    target = history.messages[target_idx].get("created_at") or before
+    _summarizing.add(session_id)
+    task = asyncio.create_task(
+        _refresh_summary(db, session_id, history.summary, history.summary_before, target)
+    )
+    _summary_tasks.add(task)
+    task.add_done_callback(_summary_tasks.discard)
+
+
+async def _refresh_summary(
+    db: AsyncIOMotorDatabase,
+    session_id: str,
+    summary: Optional[str],
+    previous_before: Optional[datetime],
+    before: datetime,
+) -> None:
+    with tracing.trace("summary_refresh", session_id=session_id):
+        await _summarize(db, session_id, summary, previous_before, before)
+
+
+async def _summarize(
+    db: AsyncIOMotorDatabase,
+    session_id: str,
+    summary: Optional[str],
+    previous_before: Optional[datetime],
+    before: datetime,
+) -> None:
+    try:
+        source = await messages_between(db, session_id, previous_before, before, SUMMARY_MAX_SOURCE_MESSAGES)
+        new_summary = summary or ""
+        if source:
+            transcript = "\n".join(
+                f"{m['role']}: {str(m.get('content') or '')[:SUMMARY_MAX_MESSAGE_CHARS]}" for m in source
+            )
+            with tracing.span("llm", model=SUMMARY_MODEL) as span:
+                completion = await llm_policy.complete(lambda: get_openai_client().chat.completions.create(
+                    model=SUMMARY_MODEL,
+                    messages=[
+                        {"role": "system", "content": SUMMARY_PROMPT},
+                        {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"},
+                    ],
+                    temperature=0,
+                    max_tokens=SUMMARY_MAX_TOKENS,
+                ))
+                _trace_usage(span, completion.usage)
+            new_summary = (completion.choices[0].message.content or "").strip() or new_summary
+            if completion.usage is not None:
+                context_stats.incr("summary_prompt_tokens", completion.usage.prompt_tokens or 0)
+        with tracing.span("persist", summary=True):
+            saved = await save_summary(db, session_id, new_summary, before, previous_before)
+        if saved:
+            context_stats.incr("summaries_refreshed")
+    except Exception as e:
+        context_stats.incr("summary_failures")
+        logger.exception("Summary refresh failed for session %s: %s", session_id, e)
+    finally:
+        _summarizing.discard(session_id)
+
+
+# -----------------------------
+# Fast path
+# -----------------------------
+@dataclass
+class TurnResult:
+    """Outcome of one non-streamed chat turn."""
+
+    reply: str
+    # "agent", "fast_path" (intent router) or "answer_cache"
+    route: str
+    # Tools called for the reply, in request order
+    tool_names: List[str] = field(default_factory=list)
+    # False when the reply is an apology because the LLM failed or the tool loop ran out
+    ok: bool = True
+
+
+async def _answer_locally(db: AsyncIOMotorDatabase, session_id: str, user_message: str) -> Optional[TurnResult]:
+    """Answer without the LLM when possible: intent router first, then the answer cache.
+    Returns None when the message should go through the agent loop.
+    """
+    started = time.perf_counter()
+    with tracing.span("local_answer") as span:
+        result = await _answer_from_intent(db, user_message)
+        if result is None and ANSWER_CACHE_ENABLED:
+            cached = answer_cache.lookup(user_message)
+            # Cached answers were produced without prior context (see _remember_answer); mid-conversation
+            # the same words are usually a follow-up that means something else
+            if cached is not None and not await has_history(db, session_id):
+                result = TurnResult(reply=cached, route="answer_cache")
+        span.set(hit=result is not None)
+    if result is None:
+        return None
+    with tracing.span("persist", messages=2):
+        await append_messages(
+            db,
+            session_id,
+            [_entry("user", user_message), _entry("assistant", result.reply, route=result.route)],
+        )
+    elapsed = time.perf_counter() - started
+    turn_latency.observe(result.route, elapsed)
+    if result.route == "fast_path":
+        intent_router.record_saved_latency(turn_latency.mean("agent") - elapsed)
+    return result
+
+
+async def _answer_from_intent(db: AsyncIOMotorDatabase, user_message: str) -> Optional[TurnResult]:
+    """Answer FAQ and simple analytics questions from one tool call and a template."""
+    matched = intent_router.route(user_message)
+    if matched is None:
+        return None
+    result = await _call_tool(db, matched.intent.tool, {})
+    if not result.get("ok"):
+        return None
+    try:
+        reply = matched.intent.render(result)
+    except (KeyError, TypeError) as e:
+        logger.warning("Template for intent '%s' failed: %s", matched.intent.name, e)
+        return None
+    return TurnResult(reply=reply, route="fast_path", tool_names=[matched.intent.tool])
+
+
+def _remember_answer(
+    window: ContextWindow, generation: int, user_message: str, reply: str, tool_names: List[str]
+) -> None:
+    """Cache a reply for similar questions if every tool behind it is cacheable (and there was one).
+    Cached answers are served to any session, so only replies to a question asked without prior
+    context are kept; a follow-up ("and in CS?") means something else elsewhere."""
+    if not ANSWER_CACHE_ENABLED or not tool_names or not window.standalone:
+        return
+    specs = [get_tool(name) for name in tool_names]
+    if any(spec is None or not spec.cacheable for spec in specs):
+        return
+    ttl = min([ANSWER_CACHE_TTL_SECONDS] + [spec.ttl for spec in specs])
+    answer_cache.store(
+        user_message, reply, ttl, depends_on_students=any(spec.needs_db for spec in specs), generation=generation
+    )
+
+
+def _text_events(text: str):
+    """Chat events for an already-complete reply, chunked by word like a live stream."""
+    yield {"type": "message_start"}
+    for token in re.findall(r"\s*\S+\s*", text):
+        yield {"type": "token", "value": token}
+    yield {"type": "message_end"}
 
 
 # -----------------------------
 # Agent core
 # -----------------------------
 async def run_chat(session_id: str, user_message: str) -> str:
+    """Run one chat turn and return the reply (see ``run_chat_turn``)."""
+    return (await run_chat_turn(session_id, user_message)).reply
+
+
+async def run_chat_turn(session_id: str, user_message: str) -> TurnResult:
+    """Run one chat turn. Turns for the same session run one at a time, and LLM turns pass through
+    the global admission queue (HTTPException 429/503 when it is full or the wait is too long).
+    """
     db = get_db()
-    await _ensure_conversation(db, session_id)
-    await _append_message(db, session_id, "user", user_message)
+    with tracing.trace("chat_turn", session_id=session_id, stream=False) as root:
+        async with session_turn(session_id):
+            result = await _answer_locally(db, session_id, user_message)
+            if result is None:
+                async with admission.slot():
+                    started = time.perf_counter()
+                    result = await _run_agent(db, session_id, user_message)
+                turn_latency.observe("agent", time.perf_counter() - started)
+        root.set(route=result.route, tool_calls=len(result.tool_names), ok=result.ok)
+        return result
+
 
-    prior = await _get_messages(db, session_id)
+async def _run_agent(db: AsyncIOMotorDatabase, session_id: str, user_message: str) -> TurnResult:
+    # Read before any tool runs, so a student write during the turn keeps its answer out of the cache
+    cache_generation = answer_cache.generation
+    turn = ConversationTurn(db, session_id)
+    window = await _prepare_turn(turn, user_message)
 
     # Build OpenAI messages
-    oai_messages: List[Dict[str, Any]] = [{"role": "system", "content": SYSTEM_PROMPT}]
-    oai_messages.extend(prior)
+    oai_messages: List[Dict[str, Any]] = window.messages
+    usage: Dict[str, int] = {}
 
     client = get_openai_client()
+    scheduler = _ToolScheduler(db)
 
     # Loop for tool calls
-    for _ in range(4):  # up to 4 rounds of tool use
+    for round_no in range(MAX_TOOL_ROUNDS):
         try:
-            completion = client.chat.completions.create(
-                model=AGENT_MODEL,
-                messages=oai_messages,
-                tools=TOOL_SCHEMAS,
-                tool_choice="auto",
-                temperature=0.2,
-                max_tokens=1000,  # Limit tokens to reduce costs
-            )
+            with tracing.span("llm", model=AGENT_MODEL, round=round_no) as span:
+                # Deadline, retries, hedging and the circuit breaker live in llm_policy
+                completion = await llm_policy.complete(lambda: client.chat.completions.create(
+                    model=AGENT_MODEL,
+                    messages=oai_messages,
+                    tools=TOOL_SCHEMAS,
+                    tool_choice="auto",
+                    temperature=0.2,
+                    max_tokens=1000,  # Limit tokens to reduce costs
+                ))
+                _trace_usage(span, completion.usage)
+                span.set(tool_calls=len(completion.choices[0].message.tool_calls or []))
         except Exception as e:
             logger.error("OpenAI API error: %s", e)
             error_msg = "I apologize, but I'm currently experiencing technical difficulties. Please try again later."
-            await _append_message(db, session_id, "assistant", error_msg)
-            return error_msg
+            turn.add(_entry("assistant", error_msg))
+            await turn.commit()
+            return TurnResult(reply=error_msg, route="agent", tool_names=scheduler.tool_names, ok=False)
+        _add_usage(usage, completion.usage)
         msg = completion.choices[0].message
 
         # If tool calls
         if msg.tool_calls:
-            oai_messages.append({"role": msg.role, "content": msg.content or "", "tool_calls": [tc.model_dump() for tc in msg.tool_calls]})
-            for tc in msg.tool_calls:
-                name = tc.function.name
-                args = json.loads(tc.function.arguments or "{}")
-                result = await _call_tool(db, name, args)
-                # Provide tool result back to the model
-                oai_messages.append(
-                    {
-                        "role": "tool",
-                        "tool_call_id": tc.id,
-                        "content": json.dumps(result, ensure_ascii=False, default=str),
-                    }
-                )
+            assistant = {"role": msg.role, "content": msg.content or "", "tool_calls": [tc.model_dump() for tc in msg.tool_calls]}
+            tasks = [scheduler.submit(tc.function.name, tc.function.arguments) for tc in msg.tool_calls]
+            results = await asyncio.gather(*tasks)
+            # Provide tool results back to the model, in tool_call order
+            tool_messages = [_tool_message(tc.id, result) for tc, result in zip(msg.tool_calls, results)]
+            oai_messages.append(assistant)
+            oai_messages.extend(tool_messages)
+            turn.add_tool_round(*_stored_tool_round(assistant, tool_messages))
             # Continue loop to let model use results
             continue
         else:
             content = msg.content or ""
-            await _append_message(db, session_id, "assistant", content)
-            return content
+            turn.add(_entry("assistant", content, usage=_turn_usage(window, usage)))
+            await turn.commit()
+            _remember_answer(window, cache_generation, user_message, content, scheduler.tool_names)
+            return TurnResult(reply=content, route="agent", tool_names=scheduler.tool_names)
 
     # Fallback if tool loop exceeded
     fallback = "I'm sorry, I couldn't complete the request right now. Please try again."
-    await _append_message(db, session_id, "assistant", fallback)
-    return fallback
+    turn.add(_entry("assistant", fallback))
+    await turn.commit()
+    return TurnResult(reply=fallback, route="agent", tool_names=scheduler.tool_names, ok=False)
 
 
-async def stream_chat_tokens(session_id: str, user_message: str):
-    """Generator that yields SSE-formatted events for the assistant's reply tokens.
-    Strategy: execute any needed tool calls first (non-stream), then request a streamed final message.
+class _StreamedToolCalls:
+    """Assembles streamed ``tool_calls`` deltas and starts each tool once its arguments are complete.
+
+    A call is complete when its arguments parse as JSON, when the model moves on to the
+    next call index, or when the stream ends. Execution order is left to the turn's scheduler.
+    """
+
+    def __init__(self, scheduler: _ToolScheduler) -> None:
+        self._scheduler = scheduler
+        self._calls: Dict[int, Dict[str, Any]] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self._calls)
+
+    def feed(self, deltas: List[Any]) -> None:
+        for delta in deltas:
+            # A new index means every earlier call has received all of its argument fragments
+            for idx in list(self._calls):
+                if idx < delta.index:
+                    self._start(idx)
+            call = self._calls.setdefault(
+                delta.index,
+                {"id": "", "type": "function", "function": {"name": "", "arguments": ""}},
+            )
+            if delta.id:
+                call["id"] = delta.id
+            if delta.function:
+                if delta.function.name:
+                    call["function"]["name"] += delta.function.name
+                if delta.function.arguments:
+                    call["function"]["arguments"] += delta.function.arguments
+            if _is_complete_json(call["function"]["arguments"]):
+                self._start(delta.index)
+
+    def _start(self, idx: int) -> None:
+        if idx in self._tasks:
+            return
+        fn = self._calls[idx]["function"]
+        self._tasks[idx] = self._scheduler.submit(fn["name"], fn["arguments"])
+
+    def start_all(self) -> List[Dict[str, Any]]:
+        """Start every call not started yet; return all calls in ``tool_calls`` order."""
+        for idx in sorted(self._calls):
+            self._start(idx)
+        return [self._calls[idx] for idx in sorted(self._calls)]
+
+    async def results(self) -> AsyncIterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """Yield ``(call, result)`` in ``tool_calls`` order as the results become available."""
+        for idx in sorted(self._calls):
+            yield self._calls[idx], await self._tasks[idx]
+
+
+def _is_complete_json(text: str) -> bool:
+    if not text or not text.rstrip().endswith("}"):
+        return False
+    try:
+        json.loads(text)
+    except json.JSONDecodeError:
+        return False
+    return True
+
+
+def _tool_message(tool_call_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "role": "tool",
+        "tool_call_id": tool_call_id,
+        "content": json.dumps(result, ensure_ascii=False, default=str),
+    }
+
+
+def stream_chat_tokens(session_id: str, user_message: str) -> AsyncIterator[str]:
+    """SSE frames for one resumable chat turn (see ``chat_events`` and ``streaming.sse_stream``)."""
+    return sse_stream(session_id, chat_events(session_id, user_message))
+
+
+async def chat_events(session_id: str, user_message: str) -> AsyncIterator[Dict[str, Any]]:
+    """Yield the events of one streamed chat turn: message_start, token... (tool_start/tool_end around
+    each tool phase), message_end, or an error event.
+    Strategy: one streamed completion per round. Text deltas are forwarded as they arrive while
+    tool_call deltas are assembled and executed; if the round asked for tools, their results are
+    appended and the next round streams again. The last round is offered no tools.
     """
     db = get_db()
-    await _ensure_conversation(db, session_id)
-    await _append_message(db, session_id, "user", user_message)
-    prior = await _get_messages(db, session_id)
+    with tracing.trace("chat_turn", session_id=session_id, stream=True) as root:
+        try:
+            async with session_turn(session_id):
+                local = await _answer_locally(db, session_id, user_message)
+                if local is not None:
+                    root.set(route=local.route, tool_calls=len(local.tool_names), ok=True)
+                    for event in _text_events(local.reply):
+                        yield event
+                    return
+
+                root.set(route="agent")
+                async with admission.slot():
+                    # Closing this generator (the consumer stopped) must close the agent's too,
+                    # so it records the interrupted turn now rather than when it is collected
+                    async with aclosing(_stream_agent(db, session_id, user_message)) as events:
+                        async for event in events:
+                            yield event
+        except HTTPException as e:
+            # Headers are already sent, so queue and session rejections arrive as an error event
+            root.fail(str(e.detail))
+            yield {"type": "error", "message": e.detail}
+
+
+async def _stream_agent(db: AsyncIOMotorDatabase, session_id: str, user_message: str):
+    started = time.perf_counter()
+    # Read before any tool runs, so a student write during the turn keeps its answer out of the cache
+    cache_generation = answer_cache.generation
+    turn = ConversationTurn(db, session_id)
+    window = await _prepare_turn(turn, user_message)
 
     client = get_openai_client()
 
-    # First, resolve tool calls using a non-streaming pass
-    oai_messages: List[Dict[str, Any]] = [{"role": "system", "content": SYSTEM_PROMPT}]
-    oai_messages.extend(prior)
+    oai_messages: List[Dict[str, Any]] = window.messages
+    usage: Dict[str, int] = {}
 
-    for _ in range(4):
-        try:
-            completion = client.chat.completions.create(
+    yield {"type": "message_start"}
+
+    scheduler = _ToolScheduler(db)
+    full_text: List[str] = []
+    round_text: List[str] = []
+    try:
+        for round_no in range(MAX_TOOL_ROUNDS + 1):
+            tool_kwargs: Dict[str, Any] = {}
+            if round_no < MAX_TOOL_ROUNDS:
+                tool_kwargs = {"tools": TOOL_SCHEMAS, "tool_choice": "auto"}
+            pending = _StreamedToolCalls(scheduler)
+            round_text = []
+            # Retried/hedged until the first chunk; closing the generator (also on cancel)
+            # drops the upstream connection so the provider stops generating
+            stream = llm_policy.stream(lambda: client.chat.completions.create(
                 model=AGENT_MODEL,
                 messages=oai_messages,
-                tools=TOOL_SCHEMAS,
-                tool_choice="auto",
                 temperature=0.2,
+                stream=True,
                 max_tokens=1000,  # Limit tokens to reduce costs
-            )
-        except Exception as e:
-            logger.error("OpenAI API error in streaming: %s", e)
-            error_msg = "I apologize, but I'm currently experiencing technical difficulties. Please try again later."
-            await _append_message(db, session_id, "assistant", error_msg)
-            yield f"data: {{\"type\": \"error\", \"message\": {json.dumps(error_msg)}}}\n\n"
-            return
-        msg = completion.choices[0].message
-        if msg.tool_calls:
-            oai_messages.append({"role": msg.role, "content": msg.content or "", "tool_calls": [tc.model_dump() for tc in msg.tool_calls]})
-            for tc in msg.tool_calls:
-                name = tc.function.name
-                args = json.loads(tc.function.arguments or "{}")
-                result = await _call_tool(db, name, args)
-                oai_messages.append(
-                    {
-                        "role": "tool",
-                        "tool_call_id": tc.id,
-                        "content": json.dumps(result, ensure_ascii=False, default=str),
-                    }
-                )
-            continue
-        else:
-            # No tool calls needed; fall through to streaming directly
-            break
+                stream_options={"include_usage": True},
+                **tool_kwargs,
+            ))
+            with tracing.span("llm", model=AGENT_MODEL, round=round_no, stream=True) as span:
+                try:
+                    async for chunk in stream:
+                        if chunk.usage is not None:
+                            _add_usage(usage, chunk.usage)
+                            _trace_usage(span, chunk.usage)
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta
+                        if not delta:
+                            continue
+                        if delta.content:
+                            round_text.append(delta.content)
+                            yield {"type": "token", "value": delta.content}
+                        if delta.tool_calls:
+                            pending.feed(delta.tool_calls)
+                except (asyncio.CancelledError, GeneratorExit):
+                    await stream.aclose()
+                    raise
+                except Exception as e:
+                    await stream.aclose()
+                    span.fail(f"{type(e).__name__}: {e}")
+                    scheduler.cancel()
+                    logger.error("OpenAI API error in streaming: %s", e)
+                    error_msg = "I apologize, but I'm currently experiencing technical difficulties. Please try again later."
+                    turn.add(_entry("assistant", error_msg))
+                    await turn.commit()
+                    yield {"type": "error", "message": error_msg}
+                    return
 
-    # Now stream the final answer using the built context
-    yield "data: {\"type\": \"message_start\"}\n\n"
-
-    try:
-        stream = client.chat.completions.create(
-            model=AGENT_MODEL,
-            messages=oai_messages,
-            temperature=0.2,
-            stream=True,
-            max_tokens=500,  # Limit tokens for streaming response
-        )
-    except Exception as e:
-        logger.error("OpenAI API error in final streaming: %s", e)
-        error_msg = "I apologize, but I'm currently experiencing technical difficulties. Please try again later."
-        await _append_message(db, session_id, "assistant", error_msg)
-        yield f"data: {{\"type\": \"error\", \"message\": {json.dumps(error_msg)}}}\n\n"
-        return
-    full_text = []
-    for chunk in stream:
-        delta = chunk.choices[0].delta
-        if delta and delta.content:
-            full_text.append(delta.content)
-            yield f"data: {{\"type\": \"token\", \"value\": {json.dumps(delta.content)} }}\n\n"
+            full_text.extend(round_text)
+            round_content, round_text = "".join(round_text), []
+            if not pending:
+                break
+            tool_calls = pending.start_all()
+            for call in tool_calls:
+                yield {"type": "tool_start", "call_id": call["id"], "name": call["function"]["name"]}
+            tool_messages: List[Dict[str, Any]] = []
+            async for call, result in pending.results():
+                tool_messages.append(_tool_message(call["id"], result))
+                yield {"type": "tool_end", "call_id": call["id"], "name": call["function"]["name"], "ok": bool(result.get("ok"))}
+            assistant = {"role": "assistant", "content": round_content, "tool_calls": tool_calls}
+            oai_messages.append(assistant)
+            oai_messages.extend(tool_messages)
+            turn.add_tool_round(*_stored_tool_round(assistant, tool_messages))
+    except (asyncio.CancelledError, GeneratorExit):
+        # Client went away (the task was cancelled mid-generation, or the consumer was cancelled
+        # while handling an event and closed us): keep what was generated and any finished tool rounds
+        scheduler.cancel()
+        partial = "".join(full_text + round_text)
+        if partial:
+            turn.add(_entry("assistant", partial, interrupted=True, usage=_turn_usage(window, usage)))
+        await turn.commit()
+        turn_latency.observe("agent_interrupted", time.perf_counter() - started)
+        raise
 
     final_text = "".join(full_text)
-    await _append_message(db, session_id, "assistant", final_text)
-    yield "data: {\"type\": \"message_end\"}\n\n"
+    turn.add(_entry("assistant", final_text, usage=_turn_usage(window, usage)))
+    await turn.commit()
+    _remember_answer(window, cache_generation, user_message, final_text, scheduler.tool_names)
+    turn_latency.observe("agent", time.perf_counter() - started)
+    tracing.current_span().set(tool_calls=len(scheduler.tool_names), ok=True)
+    yield {"type": "message_end"}
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import logging
+import os
+import random
+import re
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+import metrics
+from tool_cache import on_students_changed
+
+logger = logging.getLogger("campus_admin.answer_cache")
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1").lower() in ("1", "true", "yes", "on")
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "300"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+# Minimum estimated Jaccard similarity of character 3-gram sets for a hit; the two questions
+# must also have the same content words (see _content_words)
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.85"))
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1337)  # fixed seed: signatures must be stable across restarts and workers
+_PERMS: List[Tuple[int, int]] = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_WORD = re.compile(r"[a-z0-9]+")
+_DIGITS = re.compile(r"\d+")
+
+# Question scaffolding that does not change the answer. Everything else, including negations
+# ("not", "no", "without"), department names and status words ("active", "inactive"), is a
+# content word and must match exactly
+_STOPWORDS = frozenset(
+    "a an the is are was were be been am do does did what whats which who how please "
+    "can could would will you me i we us our my tell show give get there it its of to for "
+    "on at currently right now today".split()
+)
+
+
+def normalize(message: str) -> str:
+    return " ".join(_WORD.findall(message.lower()))
+
+
+def _content_words(text: str) -> FrozenSet[str]:
+    return frozenset(w for w in text.split() if w not in _STOPWORDS)
+
+
+def _signature(text: str) -> Tuple[int, ...]:
+    padded = f"  {text}  "
+    shingles = {zlib.crc32(padded[i:i + 3].encode()) for i in range(len(padded) - 2)}
+    return tuple(min((a * s + b) % _PRIME for s in shingles) for a, b in _PERMS)
+
+
+def _similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_PERM
+
+
+@dataclass
+class _Entry:
+    signature: Tuple[int, ...]
+    # Numbers in the question ("top 3", "S102") must match exactly; n-grams alone would not tell them apart
+    numbers: Tuple[str, ...]
+    # n-gram similarity also rates "active" ~ "inactive", "cs students" ~ "students", "not active" ~
+    # "active" highly; only questions with the same content words can share an answer
+    words: FrozenSet[str]
+    answer: str
+    expires_at: float
+    depends_on_students: bool
+
+
+class AnswerCache:
+    """Chat answers keyed on a MinHash signature of the normalized question, with LSH bucketing
+    so a lookup only compares against entries that share at least one band.
+
+    Like ToolResultCache, student writes bump a generation number: an answer that read students
+    is only stored if no write happened since the turn that produced it started.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = {}
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._stale = 0
+        self._invalidations = 0
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def lookup(self, message: str) -> Optional[str]:
+        text = normalize(message)
+        if not text:
+            return None
+        signature = _signature(text)
+        numbers = tuple(_DIGITS.findall(text))
+        words = _content_words(text)
+        now = time.monotonic()
+        best: Optional[Tuple[float, str]] = None
+        for key in self._candidates(signature):
+            entry = self._entries[key]
+            if entry.expires_at <= now:
+                self._remove(key)
+                continue
+            if entry.numbers != numbers or entry.words != words:
+                continue
+            score = _similarity(signature, entry.signature)
+            if score >= ANSWER_CACHE_SIMILARITY and (best is None or score > best[0]):
+                best = (score, key)
+        if best is None:
+            self._misses += 1
+            return None
+        self._entries.move_to_end(best[1])
+        self._hits += 1
+        return self._entries[best[1]].answer
+
+    def store(self, message: str, answer: str, ttl: float, depends_on_students: bool, generation: int) -> None:
+        """``generation`` is ``self.generation`` read before the answer's data was fetched."""
+        text = normalize(message)
+        if not text or not answer:
+            return
+        if depends_on_students and generation != self._generation:
+            # A student write happened while the answer was being produced
+            self._stale += 1
+            return
+        if text in self._entries:
+            self._remove(text)
+        signature = _signature(text)
+        self._entries[text] = _Entry(
+            signature=signature,
+            numbers=tuple(_DIGITS.findall(text)),
+            words=_content_words(text),
+            answer=answer,
+            expires_at=time.monotonic() + ttl,
+            depends_on_students=depends_on_students,
+        )
+        for band in self._bands(signature):
+            self._buckets.setdefault(band, set()).add(text)
+        self._stores += 1
+        while len(self._entries) > self._max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_students(self) -> None:
+        self._generation += 1
+        stale = [key for key, entry in self._entries.items() if entry.depends_on_students]
+        for key in stale:
+            self._remove(key)
+        self._invalidations += 1
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self._hits + self._misses
+        return {
+            "enabled": ANSWER_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            "stores": self._stores,
+            "stale_dropped": self._stale,
+            "invalidations": self._invalidations,
+        }
+
+    @staticmethod
+    def _bands(signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+        return [(i, signature[i * ROWS:(i + 1) * ROWS]) for i in range(BANDS)]
+
+    def _candidates(self, signature: Tuple[int, ...]) -> Set[str]:
+        keys: Set[str] = set()
+        for band in self._bands(signature):
+            keys |= self._buckets.get(band, set())
+        return keys
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band in self._bands(entry.signature):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
+
+
+answer_cache = AnswerCache(ANSWER_CACHE_MAX_ENTRIES)
+metrics.register("answer_cache", answer_cache.stats)
+on_students_changed(answer_cache.invalidate_students)
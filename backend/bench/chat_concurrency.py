@@ -0,0 +1,96 @@
+"""
+Concurrency benchmark for POST /chat.
+
+Starts the mock LLM server and the backend as subprocesses (MongoDB must be
+reachable via MONGODB_URI), fires N parallel chat requests and reports whether
+they overlap or run one after another. A blocking LLM call shows a wall time
+close to N x the mock latency; a non-blocking one stays close to 1x.
+
+    python -m bench.chat_concurrency --requests 20 --latency-ms 500
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+
+import httpx
+
+from bench.common import mock_env, spawn, stop, wait_ready
+from bench.load import DEFAULT_MESSAGE
+
+
+async def _one_chat(client: httpx.AsyncClient, base_url: str, idx: int) -> float:
+    started = time.perf_counter()
+    resp = await client.post(
+        f"{base_url}/chat",
+        json={"session_id": f"bench-{uuid.uuid4().hex[:8]}-{idx}", "message": DEFAULT_MESSAGE},
+    )
+    resp.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def _probe_health(client: httpx.AsyncClient, base_url: str, stop: asyncio.Event) -> list[float]:
+    samples: list[float] = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get(f"{base_url}/health")
+        samples.append(time.perf_counter() - started)
+        await asyncio.sleep(0.05)
+    return samples
+
+
+async def run(base_url: str, n: int, latency_ms: float) -> int:
+    limits = httpx.Limits(max_connections=n + 5)
+    async with httpx.AsyncClient(timeout=120.0, limits=limits) as client:
+        await _one_chat(client, base_url, -1)  # warm-up: client init, indexes, pool
+
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_probe_health(client, base_url, stop))
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(_one_chat(client, base_url, i) for i in range(n)))
+        wall = time.perf_counter() - started
+        stop.set()
+        health = await probe
+
+    serial = n * latency_ms / 1000.0
+    overlap = sum(latencies) / wall if wall else 0.0
+    print(f"requests            : {n}")
+    print(f"mock LLM latency    : {latency_ms:.0f} ms")
+    print(f"wall time           : {wall:.2f} s (serial would be >= {serial:.2f} s)")
+    print(f"mean chat latency   : {sum(latencies) / n:.2f} s")
+    print(f"overlap factor      : {overlap:.1f}x (ideal {n}x)")
+    if health:
+        print(f"/health max latency : {max(health) * 1000:.0f} ms over {len(health)} probes")
+    # Overlapping requests finish in well under the serial time
+    return 0 if wall < serial / 2 else 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=500.0)
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--backend-port", type=int, default=8100)
+    args = parser.parse_args()
+
+    env = mock_env(args.mock_port, args.latency_ms)
+    # Every request must reach the (mock) LLM, or the overlap measured is that of local answers
+    env["INTENT_ROUTER_ENABLED"] = "0"
+    env["ANSWER_CACHE_ENABLED"] = "0"
+    mock = spawn(["bench.mock_llm:app", "--port", str(args.mock_port)], env)
+    backend = spawn(["main:app", "--port", str(args.backend_port)], env)
+    base_url = f"http://127.0.0.1:{args.backend_port}"
+    try:
+        asyncio.run(wait_ready(f"http://127.0.0.1:{args.mock_port}/docs"))
+        asyncio.run(wait_ready(f"{base_url}/health"))
+        code = asyncio.run(run(base_url, args.requests, args.latency_ms))
+    finally:
+        stop(backend, mock)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Process helpers shared by the benchmark scripts."""
+from __future__ import annotations
+
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def spawn(args: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    """Run ``uvicorn <args>`` from the backend directory."""
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", *args, "--log-level", "warning"],
+        cwd=str(BACKEND_DIR),
+        env=env,
+    )
+
+
+def stop(*procs: subprocess.Popen) -> None:
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        proc.wait()
+
+
+async def wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready in {timeout:.0f}s")
+
+
+def mock_env(
+    mock_port: int,
+    latency_ms: float,
+    tokens_per_second: float = 0.0,
+    script: Optional[str] = None,
+    faults: Optional[Dict[str, float]] = None,
+) -> Dict[str, str]:
+    """Environment that points the backend at the mock LLM and configures the mock.
+
+    ``faults`` maps mock fault settings (``error_rate``, ``hang_rate``, ...) to values.
+    """
+    env = dict(os.environ)
+    for key, value in (faults or {}).items():
+        env[f"MOCK_LLM_{key.upper()}"] = str(value)
+    env["MOCK_LLM_LATENCY_MS"] = str(latency_ms)
+    env["MOCK_LLM_TOKENS_PER_SECOND"] = str(tokens_per_second)
+    if script:
+        env["MOCK_LLM_SCRIPT"] = str(Path(script).resolve())
+    env["OPENAI_BASE_URL"] = f"http://127.0.0.1:{mock_port}/v1"
+    env["OPENAI_API_KEY"] = "sk-mock"
+    env.setdefault("MONGODB_DB", "campus_admin_bench")
+    return env
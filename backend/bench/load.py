@@ -0,0 +1,339 @@
+"""
+Open-loop load generator for /chat, /chat/stream and /analytics.
+
+Requests are started on a fixed schedule (--rps) whether or not earlier ones
+have finished, so queueing in the backend shows up as latency instead of
+silently lowering the offered load. Unless --base-url is given, the mock LLM
+and the backend are started as subprocesses (MongoDB must be reachable via
+MONGODB_URI).
+
+Reports p50/p95/p99 latency, time to first token (streaming only), throughput
+and error rate per scenario. With --baseline NAME the report is compared to
+bench/baselines/NAME.json and the run exits non-zero on a regression, and also
+when there is nothing valid to compare against: no such file (checked before
+any load is sent), a scenario the baseline does not cover, or a baseline
+recorded with different mock LLM or load settings. --save-baseline writes the
+current report there instead. No baselines are committed: numbers only compare
+on the machine that recorded them.
+
+    python -m bench.load --scenarios chat,stream,analytics --rps 20 --duration 30
+    python -m bench.load --rps 20 --script bench/scripts/total_students.json --baseline tools
+    python -m bench.load --scenarios chat --rps 10 --error-rate 0.1 --slow-rate 0.05
+
+The fault flags make the mock LLM fail, stall or lag on a fraction of calls, to
+check the backend's retries, deadlines, hedging and circuit breaker under load.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from bench.common import mock_env, spawn, stop, wait_ready
+
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+SCENARIOS = ("chat", "stream", "analytics")
+# Phrased so the intent router and the answer cache do not answer it locally
+DEFAULT_MESSAGE = "Give me a short overview of how the student records are organised."
+
+
+@dataclass
+class Sample:
+    scenario: str
+    latency: float
+    ok: bool
+    ttft: Optional[float] = None
+    status: Optional[int] = None
+
+
+# -----------------------------
+# Scenarios
+# -----------------------------
+
+def _chat_body(message: str, unique: bool) -> Dict[str, Any]:
+    # A fresh session per request keeps per-session ordering out of the measurement
+    session_id = f"load-{uuid.uuid4().hex[:12]}"
+    if unique:
+        message = f"{message} ({uuid.uuid4().hex[:6]})"
+    return {"session_id": session_id, "message": message}
+
+
+async def _chat(client: httpx.AsyncClient, base_url: str, message: str, unique: bool) -> Sample:
+    started = time.perf_counter()
+    try:
+        resp = await client.post(f"{base_url}/chat", json=_chat_body(message, unique))
+        ok = resp.status_code == 200
+        return Sample("chat", time.perf_counter() - started, ok, status=resp.status_code)
+    except httpx.HTTPError:
+        return Sample("chat", time.perf_counter() - started, False)
+
+
+async def _stream(client: httpx.AsyncClient, base_url: str, message: str, unique: bool) -> Sample:
+    started = time.perf_counter()
+    ttft: Optional[float] = None
+    ok = False
+    status: Optional[int] = None
+    try:
+        async with client.stream("POST", f"{base_url}/chat/stream", json=_chat_body(message, unique)) as resp:
+            status = resp.status_code
+            async for line in resp.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[6:])
+                kind = event.get("type")
+                if kind == "token" and ttft is None:
+                    ttft = time.perf_counter() - started
+                elif kind == "message_end":
+                    ok = status == 200
+                elif kind == "error":
+                    ok = False
+                    break
+    except (httpx.HTTPError, json.JSONDecodeError):
+        ok = False
+    return Sample("stream", time.perf_counter() - started, ok, ttft=ttft, status=status)
+
+
+async def _analytics(client: httpx.AsyncClient, base_url: str, message: str, unique: bool) -> Sample:
+    started = time.perf_counter()
+    try:
+        resp = await client.get(f"{base_url}/analytics")
+        return Sample("analytics", time.perf_counter() - started, resp.status_code == 200, status=resp.status_code)
+    except httpx.HTTPError:
+        return Sample("analytics", time.perf_counter() - started, False)
+
+
+_RUNNERS = {"chat": _chat, "stream": _stream, "analytics": _analytics}
+
+
+async def drive(
+    base_url: str,
+    scenarios: List[str],
+    rps: float,
+    duration: float,
+    message: str,
+    unique: bool,
+    timeout: float,
+) -> Dict[str, Any]:
+    """Offer ``rps`` requests per second for ``duration`` seconds, cycling through ``scenarios``."""
+    total = max(1, int(rps * duration))
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        tasks: List[asyncio.Task] = []
+        started = time.perf_counter()
+        for i in range(total):
+            delay = started + i / rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            runner = _RUNNERS[scenarios[i % len(scenarios)]]
+            tasks.append(asyncio.create_task(runner(client, base_url, message, unique)))
+        samples: List[Sample] = await asyncio.gather(*tasks)
+        wall = time.perf_counter() - started
+    return summarize(samples, wall, rps)
+
+
+# -----------------------------
+# Report
+# -----------------------------
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+
+def summarize(samples: List[Sample], wall: float, rps: float) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"offered_rps": rps, "wall_s": round(wall, 2), "scenarios": {}}
+    for name in SCENARIOS:
+        group = [s for s in samples if s.scenario == name]
+        if not group:
+            continue
+        ok = [s for s in group if s.ok]
+        latencies = [s.latency for s in ok]
+        entry: Dict[str, Any] = {
+            "requests": len(group),
+            "errors": len(group) - len(ok),
+            "error_rate": round((len(group) - len(ok)) / len(group), 4),
+            "throughput_rps": round(len(ok) / wall, 2) if wall else 0.0,
+            "p50_ms": _ms(_percentile(latencies, 0.50)),
+            "p95_ms": _ms(_percentile(latencies, 0.95)),
+            "p99_ms": _ms(_percentile(latencies, 0.99)),
+        }
+        ttfts = [s.ttft for s in ok if s.ttft is not None]
+        if ttfts:
+            entry["ttft_p50_ms"] = _ms(_percentile(ttfts, 0.50))
+            entry["ttft_p95_ms"] = _ms(_percentile(ttfts, 0.95))
+            entry["ttft_p99_ms"] = _ms(_percentile(ttfts, 0.99))
+        statuses: Dict[str, int] = {}
+        for s in group:
+            if not s.ok:
+                key = str(s.status) if s.status is not None else "transport"
+                statuses[key] = statuses.get(key, 0) + 1
+        if statuses:
+            entry["error_statuses"] = statuses
+        report["scenarios"][name] = entry
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"offered load: {report['offered_rps']} rps, wall time {report['wall_s']} s")
+    header = f"{'scenario':<10} {'reqs':>6} {'err%':>6} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'ttft50':>8} {'ttft95':>8}"
+    print(header)
+    for name, e in report["scenarios"].items():
+        print(
+            f"{name:<10} {e['requests']:>6} {e['error_rate'] * 100:>5.1f}% {e['throughput_rps']:>7.2f} "
+            f"{e['p50_ms']:>8} {e['p95_ms']:>8} {e['p99_ms']:>8} "
+            f"{e.get('ttft_p50_ms', '-'):>8} {e.get('ttft_p95_ms', '-'):>8}"
+        )
+        if e.get("error_statuses"):
+            print(f"{'':<10} errors by status: {e['error_statuses']}")
+
+
+# -----------------------------
+# Baselines
+# -----------------------------
+
+# Latency keys may grow by the relative tolerance plus this much before counting as a regression,
+# so sub-millisecond endpoints do not flap
+LATENCY_SLACK_MS = 5.0
+ERROR_RATE_SLACK = 0.01
+
+
+# Settings that must match for two runs to be comparable
+COMPARABLE_CONFIG = ("mock_latency_ms", "mock_tokens_per_second", "script")
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions of ``report`` against ``baseline``; empty when the run is within tolerance.
+    A scenario the baseline lacks, or a baseline recorded with other settings, is a problem too
+    (a run that was not compared must not pass as one that was)."""
+    problems: List[str] = []
+    config, base_config = report.get("config", {}), baseline.get("config", {})
+    for key in COMPARABLE_CONFIG:
+        if config.get(key) != base_config.get(key):
+            problems.append(f"config.{key}: {config.get(key)!r} != baseline {base_config.get(key)!r}")
+    if report.get("offered_rps") != baseline.get("offered_rps"):
+        problems.append(f"offered_rps: {report.get('offered_rps')} != baseline {baseline.get('offered_rps')}")
+    for name in report["scenarios"]:
+        if name not in baseline.get("scenarios", {}):
+            problems.append(f"{name}: no baseline for this scenario")
+    for name, base in baseline.get("scenarios", {}).items():
+        current = report["scenarios"].get(name)
+        if current is None:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms", "ttft_p95_ms"):
+            if key not in base or key not in current:
+                continue
+            limit = base[key] * (1 + tolerance) + LATENCY_SLACK_MS
+            if current[key] > limit:
+                problems.append(f"{name}.{key}: {current[key]} > {limit:.1f} (baseline {base[key]})")
+        if current["error_rate"] > base["error_rate"] + ERROR_RATE_SLACK:
+            problems.append(f"{name}.error_rate: {current['error_rate']} > baseline {base['error_rate']}")
+        floor = base["throughput_rps"] * (1 - tolerance)
+        if current["throughput_rps"] < floor:
+            problems.append(f"{name}.throughput_rps: {current['throughput_rps']} < {floor:.2f} (baseline {base['throughput_rps']})")
+    return problems
+
+
+def _baseline_path(name: str) -> Path:
+    return BASELINE_DIR / f"{name}.json"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="chat,stream,analytics", help="comma-separated: chat, stream, analytics")
+    parser.add_argument("--rps", type=float, default=10.0, help="offered requests per second across all scenarios")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load")
+    parser.add_argument("--message", default=DEFAULT_MESSAGE)
+    parser.add_argument("--repeat-message", action="store_true", help="send the same text every time so the answer cache can hit")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--base-url", help="drive an already running backend instead of spawning one")
+    parser.add_argument("--latency-ms", type=float, default=500.0, help="mock LLM time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="mock LLM generation rate")
+    parser.add_argument("--script", help="mock LLM script (see bench/mock_llm.py)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of mock LLM calls that fail")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of injected failures")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="fraction of mock LLM calls that stall")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of mock LLM calls with a latency tail")
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--backend-port", type=int, default=8100)
+    parser.add_argument("--baseline", help="compare against bench/baselines/NAME.json")
+    parser.add_argument("--save-baseline", metavar="NAME", help="write this run to bench/baselines/NAME.json")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown or not scenarios:
+        parser.error(f"unknown scenarios: {unknown}; choose from {', '.join(SCENARIOS)}")
+    if args.baseline and args.baseline != args.save_baseline and not _baseline_path(args.baseline).exists():
+        # Fail before sending any load; a missing baseline is never a pass
+        parser.error(f"baseline {_baseline_path(args.baseline)} not found; run with --save-baseline {args.baseline} first")
+
+    procs = []
+    base_url = args.base_url
+    if base_url is None:
+        faults = {
+            "error_rate": args.error_rate,
+            "error_status": args.error_status,
+            "hang_rate": args.hang_rate,
+            "slow_rate": args.slow_rate,
+        }
+        env = mock_env(args.mock_port, args.latency_ms, args.tokens_per_second, args.script, faults)
+        procs.append(spawn(["bench.mock_llm:app", "--port", str(args.mock_port)], env))
+        procs.append(spawn(["main:app", "--port", str(args.backend_port)], env))
+        base_url = f"http://127.0.0.1:{args.backend_port}"
+    try:
+        if procs:
+            asyncio.run(wait_ready(f"http://127.0.0.1:{args.mock_port}/docs"))
+        asyncio.run(wait_ready(f"{base_url}/health"))
+        report = asyncio.run(
+            drive(base_url, scenarios, args.rps, args.duration, args.message, not args.repeat_message, args.timeout)
+        )
+    finally:
+        stop(*procs)
+
+    report["config"] = {
+        "scenarios": scenarios,
+        "duration_s": args.duration,
+        "mock_latency_ms": args.latency_ms,
+        "mock_tokens_per_second": args.tokens_per_second,
+        "script": args.script,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    if args.save_baseline:
+        path = _baseline_path(args.save_baseline)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        print(f"baseline saved to {path}")
+
+    if args.baseline:
+        path = _baseline_path(args.baseline)
+        problems = compare(report, json.loads(path.read_text(encoding="utf-8")), args.tolerance)
+        if problems:
+            print(f"FAILED against baseline '{args.baseline}':")
+            for problem in problems:
+                print(f"  {problem}")
+            sys.exit(1)
+        print(f"within {args.tolerance:.0%} of baseline '{args.baseline}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Local OpenAI-compatible completion server for benchmarks.
+
+Serves POST /v1/chat/completions (plain and streamed) after a fixed delay so the
+backend can be load-tested without paying for real LLM calls. Point the backend
+at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 and any OPENAI_API_KEY.
+
+    uvicorn bench.mock_llm:app --port 9100
+
+Settings (environment):
+    MOCK_LLM_LATENCY_MS        delay before the first token (default 500)
+    MOCK_LLM_TOKENS_PER_SECOND generation rate after the first token; 0 = instant
+    MOCK_LLM_REPLY             reply text when no script step applies
+    MOCK_LLM_SCRIPT            path to a JSON file of scripted steps, e.g.
+
+        {"steps": [
+            {"tool_calls": [{"name": "get_total_students", "arguments": {}}]},
+            {"content": "There are 42 students."}
+        ]}
+
+    MOCK_LLM_ERROR_RATE        fraction of requests answered with MOCK_LLM_ERROR_STATUS (default 500)
+    MOCK_LLM_HANG_RATE         fraction of requests that stall MOCK_LLM_HANG_SECONDS (default 60)
+                               before answering, to exercise client deadlines
+    MOCK_LLM_SLOW_RATE         fraction of requests delayed by an extra MOCK_LLM_SLOW_MS (default 2000),
+                               a latency tail for hedging
+
+Faults can also be changed at runtime with POST /mock/faults (same keys, lower-case,
+without the prefix, e.g. {"error_rate": 0.2}); GET /mock/stats counts what was injected.
+
+The step is picked from the request itself: the number of assistant tool-call
+messages after the last user message. Requests without tools (final rounds,
+summaries) skip tool-call steps and get the next content step.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+MOCK_LLM_LATENCY_MS = float(os.getenv("MOCK_LLM_LATENCY_MS", "500"))
+MOCK_LLM_TOKENS_PER_SECOND = float(os.getenv("MOCK_LLM_TOKENS_PER_SECOND", "0"))
+MOCK_LLM_REPLY = os.getenv("MOCK_LLM_REPLY", "This is a mock reply from the local benchmark server.")
+MOCK_LLM_SCRIPT = os.getenv("MOCK_LLM_SCRIPT", "")
+
+FAULTS: Dict[str, float] = {
+    "error_rate": float(os.getenv("MOCK_LLM_ERROR_RATE", "0")),
+    "error_status": float(os.getenv("MOCK_LLM_ERROR_STATUS", "500")),
+    "hang_rate": float(os.getenv("MOCK_LLM_HANG_RATE", "0")),
+    "hang_seconds": float(os.getenv("MOCK_LLM_HANG_SECONDS", "60")),
+    "slow_rate": float(os.getenv("MOCK_LLM_SLOW_RATE", "0")),
+    "slow_ms": float(os.getenv("MOCK_LLM_SLOW_MS", "2000")),
+}
+STATS: Dict[str, int] = {"requests": 0, "errors": 0, "hangs": 0, "slow": 0}
+
+
+def _load_script(path: str) -> List[Dict[str, Any]]:
+    if not path:
+        return []
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    steps = data.get("steps", []) if isinstance(data, dict) else data
+    for step in steps:
+        if "content" not in step and "tool_calls" not in step:
+            raise ValueError(f"Script step needs 'content' or 'tool_calls': {step}")
+    return steps
+
+
+SCRIPT_STEPS = _load_script(MOCK_LLM_SCRIPT)
+
+app = FastAPI(title="Mock LLM")
+
+
+# -----------------------------
+# Response selection
+# -----------------------------
+
+def _step_index(messages: List[Dict[str, Any]]) -> int:
+    """Tool-call rounds already completed in the current turn."""
+    rounds = 0
+    for msg in reversed(messages):
+        if msg.get("role") == "user":
+            break
+        if msg.get("role") == "assistant" and msg.get("tool_calls"):
+            rounds += 1
+    return rounds
+
+
+def _pick_step(payload: Dict[str, Any]) -> Dict[str, Any]:
+    index = _step_index(payload.get("messages", []))
+    allow_tools = bool(payload.get("tools"))
+    for step in SCRIPT_STEPS[index:]:
+        if "tool_calls" in step and not allow_tools:
+            continue
+        return step
+    return {"content": MOCK_LLM_REPLY}
+
+
+def _tool_calls(step: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": f"call_{uuid.uuid4().hex[:12]}",
+            "type": "function",
+            "function": {"name": call["name"], "arguments": json.dumps(call.get("arguments", {}))},
+        }
+        for call in step.get("tool_calls", [])
+    ]
+
+
+def _words(text: str) -> List[str]:
+    words = text.split(" ")
+    return [w + " " for w in words[:-1]] + words[-1:]
+
+
+def _usage(payload: Dict[str, Any], completion_tokens: int) -> Dict[str, int]:
+    # Rough chars/4 estimate; only needs to be stable for token accounting in the backend
+    prompt_chars = sum(len(str(m.get("content") or "")) for m in payload.get("messages", []))
+    prompt_tokens = prompt_chars // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+async def _pace(tokens: int) -> None:
+    if MOCK_LLM_TOKENS_PER_SECOND > 0 and tokens:
+        await asyncio.sleep(tokens / MOCK_LLM_TOKENS_PER_SECOND)
+
+
+# -----------------------------
+# Wire format
+# -----------------------------
+
+def _completion(model: str, message: Dict[str, Any], finish_reason: str, usage: Dict[str, int]) -> Dict[str, Any]:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": usage,
+    }
+
+
+def _chunk(
+    model: str,
+    cid: str,
+    delta: Optional[Dict[str, Any]],
+    finish_reason: Optional[str] = None,
+    usage: Optional[Dict[str, int]] = None,
+) -> str:
+    body: Dict[str, Any] = {
+        "id": cid,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage is not None:
+        body["usage"] = usage
+    return f"data: {json.dumps(body)}\n\n"
+
+
+# -----------------------------
+# Fault injection
+# -----------------------------
+
+@app.post("/mock/faults")
+async def set_faults(request: Request):
+    updates = await request.json()
+    unknown = sorted(set(updates) - set(FAULTS))
+    if unknown:
+        return JSONResponse({"error": f"unknown fault setting(s): {', '.join(unknown)}"}, status_code=400)
+    FAULTS.update({key: float(value) for key, value in updates.items()})
+    return FAULTS
+
+
+@app.get("/mock/stats")
+async def get_stats():
+    return {"faults": FAULTS, **STATS}
+
+
+async def _inject_fault() -> Optional[JSONResponse]:
+    """Apply the configured faults to one request; returns an error response when one is due."""
+    STATS["requests"] += 1
+    if random.random() < FAULTS["hang_rate"]:
+        STATS["hangs"] += 1
+        await asyncio.sleep(FAULTS["hang_seconds"])
+    elif random.random() < FAULTS["slow_rate"]:
+        STATS["slow"] += 1
+        await asyncio.sleep(FAULTS["slow_ms"] / 1000.0)
+    if random.random() < FAULTS["error_rate"]:
+        STATS["errors"] += 1
+        status = int(FAULTS["error_status"])
+        headers = {"retry-after": "1"} if status == 429 else None
+        body = {"error": {"message": "Injected mock failure", "type": "server_error", "code": status}}
+        return JSONResponse(body, status_code=status, headers=headers)
+    return None
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    payload = await request.json()
+    failure = await _inject_fault()
+    if failure is not None:
+        return failure
+    model = payload.get("model", "mock")
+    step = _pick_step(payload)
+    tool_calls = _tool_calls(step)
+    content = step.get("content", "")
+    words = _words(content) if content else []
+    finish_reason = "tool_calls" if tool_calls else "stop"
+    usage = _usage(payload, len(words) + sum(len(c["function"]["arguments"]) // 4 for c in tool_calls))
+
+    await asyncio.sleep(MOCK_LLM_LATENCY_MS / 1000.0)
+
+    if not payload.get("stream"):
+        await _pace(usage["completion_tokens"])
+        message: Dict[str, Any] = {"role": "assistant", "content": content or None}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        return _completion(model, message, finish_reason, usage)
+
+    cid = f"chatcmpl-{uuid.uuid4().hex}"
+    include_usage = bool((payload.get("stream_options") or {}).get("include_usage"))
+
+    async def gen():
+        yield _chunk(model, cid, {"role": "assistant", "content": ""})
+        for word in words:
+            await _pace(1)
+            yield _chunk(model, cid, {"content": word})
+        for index, call in enumerate(tool_calls):
+            # Split the arguments like real providers do, to exercise delta assembly
+            arguments = call["function"]["arguments"]
+            half = len(arguments) // 2
+            yield _chunk(model, cid, {"tool_calls": [{
+                "index": index, "id": call["id"], "type": "function",
+                "function": {"name": call["function"]["name"], "arguments": arguments[:half]},
+            }]})
+            await _pace(len(arguments) // 4)
+            yield _chunk(model, cid, {"tool_calls": [{"index": index, "function": {"arguments": arguments[half:]}}]})
+        yield _chunk(model, cid, {}, finish_reason=finish_reason)
+        if include_usage:
+            yield _chunk(model, cid, None, usage=usage)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(gen(), media_type="text/event-stream")
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from fastapi import HTTPException
+
+import metrics
+from agent import run_chat_turn
+from models.chat import ChatBatchItem, ChatBatchRequest
+
+logger = logging.getLogger("campus_admin.chat_batch")
+
+CHAT_BATCH_MAX_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "200"))
+# Items of one batch running at once (default), and the most a request may ask for
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "4"))
+CHAT_BATCH_MAX_CONCURRENCY = int(os.getenv("CHAT_BATCH_MAX_CONCURRENCY", "8"))
+
+_counters = metrics.Counters()
+metrics.register("chat_batch", _counters.snapshot)
+
+
+def _line(obj: Dict[str, Any]) -> str:
+    return json.dumps(obj, ensure_ascii=False, default=str) + "\n"
+
+
+def _sessions(request: ChatBatchRequest, batch_id: str) -> "OrderedDict[str, List[Tuple[int, ChatBatchItem]]]":
+    """Items grouped by the session they run in; each group runs in item order."""
+    shared = request.session_id or f"batch-{batch_id}"
+    groups: "OrderedDict[str, List[Tuple[int, ChatBatchItem]]]" = OrderedDict()
+    for index, item in enumerate(request.items):
+        if item.session_id:
+            session_id = item.session_id
+        elif request.session_policy == "shared":
+            session_id = shared
+        else:
+            session_id = f"batch-{batch_id}-{index}"
+        groups.setdefault(session_id, []).append((index, item))
+    return groups
+
+
+async def _run_item(index: int, session_id: str, item: ChatBatchItem) -> Dict[str, Any]:
+    started = time.perf_counter()
+    out: Dict[str, Any] = {"type": "item", "index": index, "session_id": session_id}
+    try:
+        result = await run_chat_turn(session_id, item.message)
+        out.update(
+            ok=result.ok,
+            route=result.route,
+            reply=result.reply,
+            tool_calls=len(result.tool_names),
+            tools=result.tool_names,
+        )
+    except HTTPException as e:
+        out.update(ok=False, status=e.status_code, error=e.detail, tool_calls=0, tools=[])
+    except Exception as e:
+        logger.exception("Batch item %d failed: %s", index, e)
+        out.update(ok=False, status=500, error="The item failed. Please retry it.", tool_calls=0, tools=[])
+    out["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    _counters.incr("items")
+    if not out["ok"]:
+        _counters.incr("item_errors")
+    return out
+
+
+def _summary(batch_id: str, results: List[Dict[str, Any]], wall: float, concurrency: int) -> Dict[str, Any]:
+    latencies = sorted(r["latency_ms"] for r in results)
+    tools: Counter = Counter(name for r in results for name in r["tools"])
+    routes: Counter = Counter(r.get("route", "error") for r in results)
+
+    def pct(q: float) -> float:
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else 0.0
+
+    return {
+        "type": "summary",
+        "batch_id": batch_id,
+        "items": len(results),
+        "ok": sum(1 for r in results if r["ok"]),
+        "errors": sum(1 for r in results if not r["ok"]),
+        "concurrency": concurrency,
+        "wall_ms": round(wall * 1000, 1),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 1) if latencies else 0.0,
+            "p50": pct(0.50),
+            "p95": pct(0.95),
+            "max": latencies[-1] if latencies else 0.0,
+        },
+        "tool_calls": sum(tools.values()),
+        "tools": dict(tools.most_common()),
+        "routes": dict(routes),
+        "per_item": [
+            {"index": r["index"], "ok": r["ok"], "latency_ms": r["latency_ms"], "tool_calls": r["tool_calls"]}
+            for r in sorted(results, key=lambda r: r["index"])
+        ],
+    }
+
+
+def validate_batch(request: ChatBatchRequest) -> int:
+    """Reject oversized batches (HTTPException 400); return the concurrency to use."""
+    if len(request.items) > CHAT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch may contain at most {CHAT_BATCH_MAX_ITEMS} items")
+    return min(request.concurrency or CHAT_BATCH_CONCURRENCY, CHAT_BATCH_MAX_CONCURRENCY)
+
+
+async def run_batch(request: ChatBatchRequest, concurrency: int) -> AsyncIterator[str]:
+    """Run the batch and yield NDJSON lines: one ``item`` line per message as it finishes (not in
+    input order), then a ``summary`` line.
+
+    Sessions run in parallel up to ``concurrency`` items at once; items sharing a session run one
+    after another in input order. Closing the iterator early cancels the remaining items.
+    """
+    batch_id = uuid.uuid4().hex[:12]
+    sem = asyncio.Semaphore(concurrency)
+    queue: asyncio.Queue = asyncio.Queue()
+    started = time.perf_counter()
+    _counters.incr("batches")
+
+    async def run_session(session_id: str, items: List[Tuple[int, ChatBatchItem]]) -> None:
+        for index, item in items:
+            async with sem:
+                queue.put_nowait(await _run_item(index, session_id, item))
+
+    groups = _sessions(request, batch_id)
+    tasks = [asyncio.create_task(run_session(sid, items)) for sid, items in groups.items()]
+    results: List[Dict[str, Any]] = []
+    try:
+        yield _line({"type": "batch_start", "batch_id": batch_id, "items": len(request.items), "sessions": len(groups)})
+        while len(results) < len(request.items):
+            result = await queue.get()
+            results.append(result)
+            yield _line(result)
+        yield _line(_summary(batch_id, results, time.perf_counter() - started, concurrency))
+    finally:
+        for task in tasks:
+            task.cancel()
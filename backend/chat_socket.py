@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+from contextlib import aclosing
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+
+import metrics
+from agent import chat_events
+from concurrency import admission
+
+logger = logging.getLogger("campus_admin.chat_socket")
+
+# Chat requests one connection may have running at once; more are rejected with a "busy" error
+WS_MAX_INFLIGHT = int(os.getenv("WS_MAX_INFLIGHT", "4"))
+# Outgoing events buffered per connection; when full, generation for that connection waits
+WS_SEND_QUEUE_MAX = int(os.getenv("WS_SEND_QUEUE_MAX", "256"))
+WS_MAX_MESSAGE_CHARS = int(os.getenv("WS_MAX_MESSAGE_CHARS", "8000"))
+
+_counters = metrics.Counters()
+metrics.register("websocket", _counters.snapshot)
+
+
+class ChatSocket:
+    """One /chat/ws connection carrying chat turns for any number of sessions.
+
+    Client frames (JSON):
+        {"type": "chat", "id": "<request id>", "session_id": "...", "message": "..."}
+        {"type": "cancel", "id": "<request id>"}
+        {"type": "ping"}
+
+    Server frames are the agent's chat events (message_start, token, tool_start, tool_end,
+    message_end, error) tagged with the request ``id`` and ``session_id``, ``cancelled`` when a
+    request was cancelled, and ``pong``.
+    Events go through one bounded send queue drained by a single writer, which merges
+    queued tokens of the same request into one frame.
+    """
+
+    def __init__(self, websocket: WebSocket) -> None:
+        self.ws = websocket
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_MAX)
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def run(self) -> None:
+        await self.ws.accept()
+        _counters.incr("connections")
+        writer = asyncio.create_task(self._write())
+        try:
+            while True:
+                try:
+                    raw = await self.ws.receive_text()
+                except WebSocketDisconnect:
+                    break
+                self._handle(raw)
+        finally:
+            for task in self._inflight.values():
+                task.cancel()
+            if self._inflight:
+                await asyncio.gather(*self._inflight.values(), return_exceptions=True)
+            writer.cancel()
+            _counters.incr("disconnects")
+
+    def _handle(self, raw: str) -> None:
+        """Dispatch one client frame. Replies never wait on the send queue, so a cancel is read
+        even while the client is behind on output."""
+        try:
+            frame = json.loads(raw)
+        except json.JSONDecodeError:
+            frame = None
+        if not isinstance(frame, dict):
+            self._send_nowait({"type": "error", "message": "Frames must be JSON objects"})
+            return
+        kind = frame.get("type")
+        request_id = frame.get("id")
+        if kind == "ping":
+            self._send_nowait({"type": "pong"})
+        elif kind == "cancel":
+            task = self._inflight.get(str(request_id))
+            if task is not None:
+                _counters.incr("cancelled")
+                task.cancel()
+        elif kind == "chat":
+            self._start(frame)
+        else:
+            self._send_nowait({"type": "error", "id": request_id, "message": f"Unknown frame type: {kind}"})
+
+    def _start(self, frame: Dict[str, Any]) -> None:
+        request_id = frame.get("id")
+        session_id = frame.get("session_id")
+        message = frame.get("message")
+        base = {"id": request_id, "session_id": session_id}
+        error: Optional[Dict[str, Any]] = None
+        if not isinstance(request_id, str) or not request_id:
+            error = {"message": "id is required"}
+        elif not isinstance(session_id, str) or not session_id or not isinstance(message, str) or not message:
+            error = {"message": "session_id and message are required"}
+        elif len(message) > WS_MAX_MESSAGE_CHARS:
+            error = {"message": f"message is longer than {WS_MAX_MESSAGE_CHARS} characters"}
+        elif request_id in self._inflight:
+            error = {"message": "A request with this id is still running"}
+        elif len(self._inflight) >= WS_MAX_INFLIGHT:
+            _counters.incr("rejected_busy")
+            error = {"code": "busy", "message": f"At most {WS_MAX_INFLIGHT} requests may run per connection"}
+        else:
+            try:
+                admission.ensure_capacity()
+            except HTTPException as e:
+                error = {"code": e.status_code, "message": e.detail}
+        if error is not None:
+            self._send_nowait({"type": "error", **base, **error})
+            return
+        _counters.incr("requests")
+        task = asyncio.create_task(self._run_turn(request_id, session_id, message))
+        self._inflight[request_id] = task
+        task.add_done_callback(lambda t: self._finished(t, request_id, session_id))
+
+    def _finished(self, task: asyncio.Task, request_id: str, session_id: str) -> None:
+        self._inflight.pop(request_id, None)
+        if task.cancelled():
+            # Any partial answer has been recorded by the agent; tell the client the request is over
+            self._send_nowait({"type": "cancelled", "id": request_id, "session_id": session_id})
+
+    async def _run_turn(self, request_id: str, session_id: str, message: str) -> None:
+        base = {"id": request_id, "session_id": session_id}
+        try:
+            # A cancel usually lands in _send (waiting on a full queue), outside the generator;
+            # aclosing then closes it right away so the agent records the partial turn
+            async with aclosing(chat_events(session_id, message)) as events:
+                async for event in events:
+                    await self._send({**event, **base})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("WebSocket chat turn %s failed: %s", request_id, e)
+            await self._send({"type": "error", **base, "message": "The response failed. Please try again."})
+
+    async def _send(self, frame: Dict[str, Any]) -> None:
+        # Waits while the client is not reading, which in turn pauses that request's generation
+        await self._queue.put(frame)
+
+    def _send_nowait(self, frame: Dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            _counters.incr("dropped_replies")
+
+    async def _write(self) -> None:
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                while not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                for frame in _coalesce(batch):
+                    await self.ws.send_text(json.dumps(frame, ensure_ascii=False))
+                _counters.incr("frames_sent", len(batch))
+        except (WebSocketDisconnect, RuntimeError):
+            # Connection closed under us; the reader loop cleans up
+            pass
+
+
+def _coalesce(frames: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge adjacent token frames of the same request."""
+    out: List[Dict[str, Any]] = []
+    for frame in frames:
+        prev = out[-1] if out else None
+        if (
+            prev is not None
+            and frame.get("type") == "token"
+            and prev.get("type") == "token"
+            and prev.get("id") == frame.get("id")
+        ):
+            out[-1] = {**prev, "value": prev.get("value", "") + frame.get("value", "")}
+        else:
+            out.append(frame)
+    return out
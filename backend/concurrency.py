@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+
+import metrics
+import tracing
+from db import get_db
+
+logger = logging.getLogger("campus_admin.concurrency")
+
+# Global admission: chat turns allowed to talk to the LLM at once, and how many may wait
+LLM_MAX_CONCURRENT_TURNS = int(os.getenv("LLM_MAX_CONCURRENT_TURNS", "16"))
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "64"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "30"))
+
+# Per-session ordering: how long a message waits for the previous one in the same session
+SESSION_LOCK_TIMEOUT_SECONDS = float(os.getenv("SESSION_LOCK_TIMEOUT_SECONDS", "120"))
+# Cross-worker ordering through a Mongo lease (needed when running several uvicorn workers)
+SESSION_LEASE_ENABLED = os.getenv("SESSION_LEASE_ENABLED", "0").lower() in ("1", "true", "yes", "on")
+SESSION_LEASE_TTL_SECONDS = float(os.getenv("SESSION_LEASE_TTL_SECONDS", "30"))
+SESSION_LEASE_POLL_SECONDS = 0.1
+
+wait_latency = metrics.LatencyStats()
+metrics.register("queue_wait", wait_latency.snapshot)
+
+
+def _session_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Another message for this session is still being processed",
+        headers={"Retry-After": "2"},
+    )
+
+
+class AdmissionQueue:
+    """Bounded FIFO admission for LLM work.
+
+    Up to ``max_active`` holders run at once and up to ``max_queue`` wait. A full queue is rejected
+    at once with 429; a waiter not admitted within ``max_wait`` seconds gets 503.
+    """
+
+    def __init__(self, max_active: int, max_queue: int, max_wait: float) -> None:
+        self._sem = asyncio.Semaphore(max_active)
+        self._max_active = max_active
+        self._max_queue = max_queue
+        self._max_wait = max_wait
+        self._active = 0
+        self._waiting = 0
+        self._max_waiting_seen = 0
+        self._counters = metrics.Counters()
+
+    def ensure_capacity(self) -> None:
+        """Reject up front when the queue is already full (for responses that cannot fail later)."""
+        if self._waiting >= self._max_queue:
+            self._counters.incr("rejected_full")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many chat requests in progress; please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        started = time.perf_counter()
+        if self._sem.locked():
+            self.ensure_capacity()
+            self._waiting += 1
+            self._max_waiting_seen = max(self._max_waiting_seen, self._waiting)
+            try:
+                await asyncio.wait_for(self._sem.acquire(), timeout=self._max_wait)
+            except asyncio.TimeoutError:
+                self._counters.incr("rejected_timeout")
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="The assistant is busy; please retry shortly",
+                    headers={"Retry-After": "5"},
+                )
+            finally:
+                self._waiting -= 1
+        else:
+            await self._sem.acquire()
+        waited = time.perf_counter() - started
+        wait_latency.observe("admission", waited)
+        tracing.add_span("admission_wait", waited)
+        self._counters.incr("admitted")
+        self._active += 1
+        try:
+            yield
+        finally:
+            self._active -= 1
+            self._sem.release()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "active": self._active,
+            "max_active": self._max_active,
+            "queue_depth": self._waiting,
+            "max_queue": self._max_queue,
+            "max_queue_depth_seen": self._max_waiting_seen,
+            **self._counters.snapshot(),
+        }
+
+
+# Callback for session turns started in this context once they hold the session
+_on_wanted: ContextVar[Optional[Callable[[], None]]] = ContextVar("campus_admin_on_wanted", default=None)
+
+
+class SessionLocks:
+    """In-process mutex per session_id; entries exist only while a turn holds or waits for them.
+
+    The holder may register a callback that runs whenever another turn of its session starts
+    waiting, e.g. to give up early when nobody is reading its answer any more.
+    """
+
+    def __init__(self) -> None:
+        self._locks: Dict[str, List] = {}  # session_id -> [lock, holders + waiters]
+        self._wanted: Dict[str, List[Callable[[], None]]] = {}
+
+    @contextmanager
+    def _registered(self, session_id: str, callback: Optional[Callable[[], None]]) -> Iterator[None]:
+        if callback is None:
+            yield
+            return
+        callbacks = self._wanted.setdefault(session_id, [])
+        callbacks.append(callback)
+        try:
+            yield
+        finally:
+            callbacks.remove(callback)
+            if not callbacks:
+                self._wanted.pop(session_id, None)
+
+    @asynccontextmanager
+    async def hold(self, session_id: str, timeout: float) -> AsyncIterator[None]:
+        entry = self._locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            if entry[0].locked():
+                for callback in list(self._wanted.get(session_id, ())):
+                    callback()
+            try:
+                await asyncio.wait_for(entry[0].acquire(), timeout=timeout)
+            except asyncio.TimeoutError:
+                raise _session_busy()
+            try:
+                with self._registered(session_id, _on_wanted.get()):
+                    yield
+            finally:
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class SessionLease:
+    """Mongo-backed lease so turns for one session are serialized across worker processes.
+
+    A lease document ``{_id: session_id, owner, expires_at}`` is taken by upserting over an expired
+    or absent lease; a live lease held by someone else makes the upsert hit the unique ``_id``.
+    Holders renew it while the turn runs, so a crashed worker only blocks the session for one TTL.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self._ttl = ttl
+        self._counters = metrics.Counters()
+
+    async def acquire(self, db: AsyncIOMotorDatabase, session_id: str, timeout: float) -> str:
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        while True:
+            now = datetime.now(timezone.utc)
+            try:
+                await db.session_leases.update_one(
+                    {"_id": session_id, "expires_at": {"$lt": now}},
+                    {"$set": {"owner": token, "expires_at": now + timedelta(seconds=self._ttl)}},
+                    upsert=True,
+                )
+                return token
+            except DuplicateKeyError:
+                pass
+            if time.monotonic() >= deadline:
+                raise _session_busy()
+            await asyncio.sleep(SESSION_LEASE_POLL_SECONDS)
+
+    async def renew(self, db: AsyncIOMotorDatabase, session_id: str, token: str) -> None:
+        """Extend the lease every TTL/3 until cancelled. A failed renewal is retried after TTL/10,
+        so one transient database error does not let the lease lapse mid-turn."""
+        delay = self._ttl / 3
+        while True:
+            await asyncio.sleep(delay)
+            expires_at = datetime.now(timezone.utc) + timedelta(seconds=self._ttl)
+            try:
+                res = await db.session_leases.update_one(
+                    {"_id": session_id, "owner": token}, {"$set": {"expires_at": expires_at}}
+                )
+            except Exception as e:
+                self._counters.incr("renew_failures")
+                logger.warning("Failed to renew session lease %s, retrying: %s", session_id, e)
+                delay = self._ttl / 10
+                continue
+            if res.matched_count == 0:
+                # Expired and taken over (e.g. renewals failed for a whole TTL); nothing left to renew
+                self._counters.incr("lost")
+                logger.warning("Session lease %s was lost before the turn finished", session_id)
+                return
+            self._counters.incr("renewals")
+            delay = self._ttl / 3
+
+    async def release(self, db: AsyncIOMotorDatabase, session_id: str, token: str) -> None:
+        await db.session_leases.delete_one({"_id": session_id, "owner": token})
+
+    def stats(self) -> Dict[str, object]:
+        return self._counters.snapshot()
+
+
+admission = AdmissionQueue(LLM_MAX_CONCURRENT_TURNS, LLM_QUEUE_MAX, LLM_QUEUE_TIMEOUT_SECONDS)
+metrics.register("admission", admission.stats)
+
+_session_locks = SessionLocks()
+_lease = SessionLease(SESSION_LEASE_TTL_SECONDS)
+metrics.register("session_lease", _lease.stats)
+
+
+@contextmanager
+def on_session_wanted(callback: Callable[[], None]) -> Iterator[None]:
+    """Session turns run inside this block call ``callback`` whenever, while they hold the
+    session, another turn in this process starts waiting for it (turns on other workers,
+    queued on the lease, do not trigger it)."""
+    token = _on_wanted.set(callback)
+    try:
+        yield
+    finally:
+        _on_wanted.reset(token)
+
+
+@asynccontextmanager
+async def session_turn(session_id: str) -> AsyncIterator[None]:
+    """Serialize chat turns for one session: in-process lock, plus the Mongo lease when enabled.
+    Raises 503 if the previous turn does not finish within SESSION_LOCK_TIMEOUT_SECONDS.
+    """
+    started = time.perf_counter()
+    async with _session_locks.hold(session_id, SESSION_LOCK_TIMEOUT_SECONDS):
+        if not SESSION_LEASE_ENABLED:
+            waited = time.perf_counter() - started
+            wait_latency.observe("session", waited)
+            tracing.add_span("session_wait", waited)
+            yield
+            return
+
+        db = get_db()
+        remaining = SESSION_LOCK_TIMEOUT_SECONDS - (time.perf_counter() - started)
+        token = await _lease.acquire(db, session_id, max(0.0, remaining))
+        waited = time.perf_counter() - started
+        wait_latency.observe("session", waited)
+        tracing.add_span("session_wait", waited, lease=True)
+        renewer = asyncio.create_task(_lease.renew(db, session_id, token))
+        try:
+            yield
+        finally:
+            renewer.cancel()
+            try:
+                await _lease.release(db, session_id, token)
+            except Exception as e:
+                logger.warning("Failed to release session lease %s: %s", session_id, e)
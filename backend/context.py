@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("campus_admin.context")
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a character-based estimate
+    tiktoken = None
+
+# Per-message framing overhead charged by chat models (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Stored tool results are cut to this many characters; the hash still identifies the full result
+TOOL_RESULT_MAX_CHARS = int(os.getenv("TOOL_RESULT_MAX_CHARS", "1500"))
+# Part of CONTEXT_TOKEN_BUDGET that tool calls/results from earlier turns may take when replayed
+TOOL_REPLAY_TOKEN_BUDGET = int(os.getenv("TOOL_REPLAY_TOKEN_BUDGET", "1200"))
+
+
+@lru_cache(maxsize=16)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    # OpenRouter style ids ("openai/gpt-4o-mini") name the upstream model after the slash
+    name = model.rsplit("/", 1)[-1]
+    try:
+        try:
+            return tiktoken.encoding_for_model(name)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # Encodings are downloaded on first use; offline hosts fall back to the estimate
+        logger.warning("No tiktoken encoding for model '%s' (%s); estimating token counts", model, e)
+        return None
+
+
+def preload_tokenizer(model: str) -> None:
+    """Load (and on first use, download) the encoding for ``model``; blocking, run it off the event loop."""
+    _encoding(model)
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Tokens in ``text`` for ``model``; roughly len/4 when no tokenizer is available."""
+    if not text:
+        return 0
+    enc = _encoding(model)
+    if enc is None:
+        return (len(text) + 3) // 4
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def message_tokens(message: Dict[str, Any], model: str) -> int:
+    """Prompt tokens taken by one chat message, using its stored ``tokens`` count when present."""
+    stored = message.get("tokens")
+    if isinstance(stored, int):
+        return stored
+    content = message.get("content") or ""
+    if not isinstance(content, str):
+        content = json.dumps(content, ensure_ascii=False, default=str)
+    total = count_tokens(content, model) + MESSAGE_OVERHEAD_TOKENS
+    for tc in message.get("tool_calls") or []:
+        fn = tc.get("function", {})
+        total += count_tokens(fn.get("name", ""), model) + count_tokens(fn.get("arguments", ""), model)
+    return total
+
+
+# -----------------------------
+# Stored tool results
+# -----------------------------
+
+def _fit_list(value: Any, max_chars: int) -> Optional[str]:
+    """JSON for ``value`` with its longest list cut to the leading items that fit, or None."""
+    if isinstance(value, list):
+        holder, key = None, None
+        items = value
+    elif isinstance(value, dict):
+        lists = [(k, v) for k, v in value.items() if isinstance(v, list)]
+        if not lists:
+            return None
+        key, items = max(lists, key=lambda kv: len(kv[1]))
+        holder = value
+    else:
+        return None
+
+    def render(keep: int) -> str:
+        kept: List[Any] = list(items[:keep])
+        if keep < len(items):
+            kept.append(f"... {len(items) - keep} more item(s) omitted")
+        out = kept if holder is None else {**holder, key: kept}
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+    lo, hi = 0, len(items)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if len(render(mid)) <= max_chars:
+            lo = mid
+        else:
+            hi = mid - 1
+    text = render(lo)
+    return text if len(text) <= max_chars else None
+
+
+def compact_tool_result(content: str, max_chars: int = TOOL_RESULT_MAX_CHARS) -> Tuple[str, bool]:
+    """Shorten a tool result for storage; returns ``(content, truncated)``.
+
+    JSON results keep their shape with the longest list cut to its leading items,
+    anything else is cut at ``max_chars``.
+    """
+    if len(content) <= max_chars:
+        return content, False
+    try:
+        fitted = _fit_list(json.loads(content), max_chars)
+    except json.JSONDecodeError:
+        fitted = None
+    if fitted is None:
+        fitted = content[:max_chars] + " ... [truncated]"
+    return fitted, True
+
+
+def compact_tool_message(message: Dict[str, Any], name: Optional[str], model: str) -> Dict[str, Any]:
+    """The stored form of a ``tool`` message: tool name, compacted content and a hash of the full result."""
+    content = message.get("content") or ""
+    compact, truncated = compact_tool_result(content)
+    stored: Dict[str, Any] = {
+        "role": "tool",
+        "tool_call_id": message.get("tool_call_id", ""),
+        "name": name,
+        "content": compact,
+        "result_sha256": hashlib.sha256(content.encode("utf-8")).hexdigest(),
+        "truncated": truncated,
+    }
+    stored["tokens"] = message_tokens(stored, model)
+    return stored
+
+
+def _tool_group_start(history: List[Dict[str, Any]], idx: int) -> Tuple[int, Optional[int]]:
+    """For the ``tool`` message at ``idx``: the index of the first of its contiguous tool messages and
+    of the assistant message that requested them (None when the window cut it off)."""
+    start = idx
+    while start > 0 and history[start - 1].get("role") == "tool":
+        start -= 1
+    owner = start - 1
+    if owner >= 0 and history[owner].get("role") == "assistant" and history[owner].get("tool_calls"):
+        return start, owner
+    return start, None
+
+
+def _replay_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    if message.get("role") == "tool":
+        return {"role": "tool", "tool_call_id": message["tool_call_id"], "content": message["content"]}
+    return {
+        "role": "assistant",
+        "content": message.get("content") or "",
+        "tool_calls": [
+            {
+                "id": tc["id"],
+                "type": "function",
+                "function": {"name": tc["function"]["name"], "arguments": tc["function"].get("arguments") or "{}"},
+            }
+            for tc in message["tool_calls"]
+        ],
+    }
+
+
+def _is_complete_group(group: List[Dict[str, Any]]) -> bool:
+    requested = {tc.get("id") for tc in group[0]["tool_calls"]}
+    answered = {m.get("tool_call_id") for m in group[1:]}
+    return bool(requested) and requested == answered
+
+
+# -----------------------------
+# Prompt assembly
+# -----------------------------
+
+@dataclass
+class ContextWindow:
+    """Prompt messages chosen for one turn."""
+
+    messages: List[Dict[str, Any]]
+    prompt_tokens: int
+    # Leading history messages (from the loaded window) that did not fit the budget
+    dropped: int
+    # Stored tool call/result messages from earlier turns included in ``messages``
+    replayed_tool_messages: int = 0
+    # The prompt is only the system prompt and the new message: no rolling summary, earlier
+    # messages or replayed tool rounds the reply could depend on
+    standalone: bool = False
+
+
+def build_context(
+    system_prompt: str,
+    summary: Optional[str],
+    history: List[Dict[str, Any]],
+    budget: int,
+    model: str,
+) -> ContextWindow:
+    """Fill ``budget`` tokens newest-first from ``history`` (oldest first, last item is the new user
+    message, which is always included). The system prompt and rolling summary always come first.
+
+    Stored tool rounds (an assistant ``tool_calls`` message and its ``tool`` results) are replayed
+    as one unit, all or nothing, while they fit both ``budget`` and TOOL_REPLAY_TOKEN_BUDGET;
+    rounds that do not fit, or that the history window cut in half, are left out.
+    """
+    head: List[Dict[str, Any]] = [{"role": "system", "content": system_prompt}]
+    if summary:
+        head.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    used = sum(message_tokens(m, model) for m in head)
+
+    groups: List[List[Dict[str, Any]]] = []  # newest first
+    replay_used = 0
+    replayed = 0
+    first = len(history)
+    idx = len(history) - 1
+    while idx >= 0:
+        msg = history[idx]
+        if msg.get("role") == "tool":
+            start, owner = _tool_group_start(history, idx)
+            if owner is not None:
+                group = history[owner : idx + 1]
+                cost = sum(message_tokens(m, model) for m in group)
+                fits = used + cost <= budget and replay_used + cost <= TOOL_REPLAY_TOKEN_BUDGET
+                if fits and _is_complete_group(group):
+                    groups.append([_replay_message(m) for m in group])
+                    used += cost
+                    replay_used += cost
+                    replayed += len(group)
+                    first = owner
+            idx = (owner if owner is not None else start) - 1
+            continue
+        if msg.get("tool_calls"):
+            # A tool request whose results were never stored
+            idx -= 1
+            continue
+        cost = message_tokens(msg, model)
+        if used + cost > budget and idx < len(history) - 1:
+            break
+        used += cost
+        first = idx
+        groups.append([{"role": msg["role"], "content": msg["content"]}])
+        idx -= 1
+
+    messages = head + [m for group in reversed(groups) for m in group]
+    return ContextWindow(
+        messages=messages,
+        prompt_tokens=used,
+        dropped=first,
+        replayed_tool_messages=replayed,
+        standalone=len(messages) == 2,
+    )
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import tracing
+
+logger = logging.getLogger("campus_admin.conversations")
+
+# Most recent messages loaded per turn; the context builder then trims them to the token budget
+CONVERSATION_HISTORY_LIMIT = int(os.getenv("CONVERSATION_HISTORY_LIMIT", "40"))
+# Messages kept inline on the conversation document; older ones live only in conversation_messages
+CONVERSATION_WINDOW = int(os.getenv("CONVERSATION_WINDOW", "100"))
+# Store each agent turn's tool calls and (compacted) results so later turns can reuse them
+CONVERSATION_STORE_TOOL_MESSAGES = os.getenv("CONVERSATION_STORE_TOOL_MESSAGES", "1").lower() in ("1", "true", "yes", "on")
+# Storage layout marker; documents without it predate the bounded window (see migrations/)
+STORAGE_VERSION = 2
+
+
+@dataclass
+class History:
+    """Recent messages (oldest first, with their stored metadata) and the rolling summary."""
+
+    messages: List[Dict[str, Any]]
+    message_count: int
+    summary: Optional[str] = None
+    # The summary covers every message created before this instant
+    summary_before: Optional[datetime] = None
+
+
+def _stamp(message: Dict[str, Any]) -> Dict[str, Any]:
+    return {**message, "created_at": datetime.now(timezone.utc)}
+
+
+def _push(docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Update appending ``docs`` to a bounded (STORAGE_VERSION) conversation, creating it if needed."""
+    return {
+        "$push": {"messages": {"$each": docs, "$slice": -CONVERSATION_WINDOW}},
+        "$inc": {"message_count": len(docs)},
+        "$set": {"updated_at": docs[-1]["created_at"]},
+        "$setOnInsert": {"created_at": docs[0]["created_at"], "storage_version": STORAGE_VERSION},
+    }
+
+
+def _legacy_push(docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Update appending ``docs`` to a conversation that predates the bounded window. Its inline
+    array is the only full copy of the history, so nothing is trimmed or counted until
+    migrations/bound_conversations.py has archived it."""
+    return {"$push": {"messages": {"$each": docs}}, "$set": {"updated_at": docs[-1]["created_at"]}}
+
+
+# Bounded documents (and new ones, via upsert); a legacy document with the same session_id
+# makes the upsert fail on uid_session_id and the write goes through _legacy_push instead
+_BOUNDED = {"storage_version": {"$exists": True}}
+_LEGACY = {"storage_version": {"$exists": False}}
+
+
+async def start_turn(
+    db: AsyncIOMotorDatabase,
+    session_id: str,
+    message: Dict[str, Any],
+    limit: int = CONVERSATION_HISTORY_LIMIT,
+) -> History:
+    """Create the conversation if needed, append the user ``message`` and return the last ``limit``
+    messages (the new one included) plus the rolling summary.
+    """
+    msg = _stamp(message)
+    await _archive(db, session_id, [msg])
+    projection = {
+        "_id": 0,
+        "messages": {"$slice": -limit},
+        "message_count": 1,
+        "summary": 1,
+        "summary_before": 1,
+    }
+    conv = None
+    # A second pass only if a legacy document was migrated between the two writes
+    for _ in range(2):
+        try:
+            conv = await db.conversations.find_one_and_update(
+                {"session_id": session_id, **_BOUNDED},
+                _push([msg]),
+                projection=projection,
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            break
+        except DuplicateKeyError:
+            conv = await db.conversations.find_one_and_update(
+                {"session_id": session_id, **_LEGACY},
+                _legacy_push([msg]),
+                projection=projection,
+                return_document=ReturnDocument.AFTER,
+            )
+            if conv is not None:
+                break
+    if conv is None:
+        raise RuntimeError(f"Could not append to conversation {session_id!r}")
+    messages = conv.get("messages", [])
+    return History(
+        messages=messages,
+        message_count=conv.get("message_count", len(messages)),
+        summary=conv.get("summary"),
+        summary_before=conv.get("summary_before"),
+    )
+
+
+async def append_messages(db: AsyncIOMotorDatabase, session_id: str, messages: List[Dict[str, Any]]) -> None:
+    """Append ``{role, content, ...}`` messages to the conversation in one write."""
+    if not messages:
+        return
+    docs = [_stamp(m) for m in messages]
+    await _archive(db, session_id, docs)
+    for _ in range(2):
+        try:
+            await db.conversations.update_one({"session_id": session_id, **_BOUNDED}, _push(docs), upsert=True)
+            break
+        except DuplicateKeyError:
+            res = await db.conversations.update_one({"session_id": session_id, **_LEGACY}, _legacy_push(docs))
+            if res.matched_count:
+                break
+    else:
+        raise RuntimeError(f"Could not append to conversation {session_id!r}")
+
+
+async def has_history(db: AsyncIOMotorDatabase, session_id: str) -> bool:
+    """Whether the session already has messages (and so possibly a summary) stored."""
+    return await db.conversations.find_one({"session_id": session_id}, {"_id": 1}) is not None
+
+
+async def append_message(db: AsyncIOMotorDatabase, session_id: str, role: str, content: Any) -> None:
+    await append_messages(db, session_id, [{"role": role, "content": content}])
+
+
+class ConversationTurn:
+    """Write buffer for one agent turn.
+
+    ``begin`` persists the user message and reads the history, so the message survives a crash
+    mid-turn. Everything produced afterwards is buffered and written by ``commit`` in one
+    archive insert plus one update, however many tool rounds ran.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, session_id: str) -> None:
+        self.db = db
+        self.session_id = session_id
+        self.history: Optional[History] = None
+        self._buffer: List[Dict[str, Any]] = []
+
+    async def begin(self, message: Dict[str, Any], limit: int = CONVERSATION_HISTORY_LIMIT) -> History:
+        with tracing.span("history_load") as span:
+            self.history = await start_turn(self.db, self.session_id, message, limit)
+            span.set(messages=len(self.history.messages))
+        return self.history
+
+    def add(self, message: Dict[str, Any]) -> None:
+        self._buffer.append(message)
+
+    def add_tool_round(self, assistant: Dict[str, Any], results: List[Dict[str, Any]]) -> None:
+        """Buffer an assistant ``tool_calls`` message and its tool results, if tool messages are stored."""
+        if CONVERSATION_STORE_TOOL_MESSAGES:
+            self._buffer.append(assistant)
+            self._buffer.extend(results)
+
+    async def commit(self) -> None:
+        """Write everything buffered since ``begin`` (or the last commit) in one update."""
+        pending, self._buffer = self._buffer, []
+        with tracing.span("persist", messages=len(pending)):
+            await append_messages(self.db, self.session_id, pending)
+
+
+async def messages_between(
+    db: AsyncIOMotorDatabase,
+    session_id: str,
+    after: Optional[datetime],
+    before: datetime,
+    limit: int,
+) -> List[Dict[str, Any]]:
+    """Archived messages created in ``[after, before)``, oldest first, at most the newest ``limit``."""
+    created: Dict[str, Any] = {"$lt": before}
+    if after is not None:
+        created["$gte"] = after
+    cursor = (
+        db.conversation_messages.find(
+            {"session_id": session_id, "created_at": created, "role": {"$ne": "tool"}, "tool_calls": {"$exists": False}},
+            {"_id": 0, "role": 1, "content": 1, "created_at": 1},
+        )
+        .sort([("created_at", -1)])
+        .limit(limit)
+    )
+    docs = [doc async for doc in cursor]
+    docs.reverse()
+    return docs
+
+
+async def save_summary(
+    db: AsyncIOMotorDatabase,
+    session_id: str,
+    summary: str,
+    summary_before: datetime,
+    previous_before: Optional[datetime],
+) -> bool:
+    """Store a refreshed summary unless another worker already advanced it."""
+    res = await db.conversations.update_one(
+        {"session_id": session_id, "summary_before": previous_before},
+        {"$set": {"summary": summary, "summary_before": summary_before}},
+    )
+    return res.modified_count == 1
+
+
+async def _archive(db: AsyncIOMotorDatabase, session_id: str, messages: List[Dict[str, Any]]) -> None:
+    """Copy messages into the append-only conversation_messages collection. Awaited before the
+    inline ``$push``, whose ``$slice`` may drop older messages: once a message can leave the
+    window it is already archived, and a failed archive write fails the append instead."""
+    await db.conversation_messages.insert_many(
+        [{"session_id": session_id, **m} for m in messages], ordered=True
+    )
@@ -5,6 +5,8 @@ from typing import Optional
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from pymongo.errors import PyMongoError
 
+from student_search import SEARCH_KEY_SOURCES
+
 logger = logging.getLogger("campus_admin.db")
 
 # Client state
@@ -62,6 +64,7 @@ async def ensure_indexes() -> None:
     users = db.get_collection("users")
     students = db.get_collection("students")
     conversations = db.get_collection("conversations")
+    conversation_messages = db.get_collection("conversation_messages")
 
     try:
         # Users
@@ -77,14 +80,45 @@ async def ensure_indexes() -> None:
         await students.create_index("email", unique=True, name="uid_email")
         await students.create_index([("department", 1)], name="idx_department")
         await students.create_index([("status", 1)], name="idx_status")
-        await students.create_index([("joined_at", -1)], name="idx_joined_at_desc")
+        # Listing order and keyset cursors: (joined_at desc, _id desc); supersedes idx_joined_at_desc
+        await students.create_index([("joined_at", -1), ("_id", -1)], name="idx_joined_at_id_desc")
         await students.create_index([("last_active_at", -1)], name="idx_last_active_at_desc")
+        # Search (student_search.py): prefix keys are multikey arrays, names also get a text index
+        for key in SEARCH_KEY_SOURCES:
+            await students.create_index([(key, 1)], name=f"idx_{key}")
+        # No stemming or stop words: these are names, not prose
+        await students.create_index([("name", "text")], name="txt_name", default_language="none")
         logger.info("Indexes ensured for 'students' collection")
 
         # Conversations
         await conversations.create_index("session_id", unique=True, name="uid_session_id")
         await conversations.create_index([("updated_at", -1)], name="idx_updated_at_desc")
         logger.info("Indexes ensured for 'conversations' collection")
+
+        # Conversation message archive (one document per message)
+        await conversation_messages.create_index(
+            [("session_id", 1), ("created_at", 1)], name="idx_session_created_at"
+        )
+        # Messages archived by migrations/bound_conversations.py; makes re-running it idempotent
+        await conversation_messages.create_index(
+            [("session_id", 1), ("legacy_seq", 1)],
+            unique=True,
+            partialFilterExpression={"legacy_seq": {"$exists": True}},
+            name="uid_session_legacy_seq",
+        )
+        logger.info("Indexes ensured for 'conversation_messages' collection")
+
+        # Session leases (cross-worker chat ordering); expired leases are removed by the TTL monitor
+        await db.get_collection("session_leases").create_index(
+            "expires_at", expireAfterSeconds=0, name="ttl_expires_at"
+        )
+        logger.info("Indexes ensured for 'session_leases' collection")
+
+        # Spilled chat stream events (resumable /chat/stream turns)
+        stream_events = db.get_collection("stream_events")
+        await stream_events.create_index([("turn_id", 1), ("seq", 1)], unique=True, name="uid_turn_seq")
+        await stream_events.create_index("expires_at", expireAfterSeconds=0, name="ttl_expires_at")
+        logger.info("Indexes ensured for 'stream_events' collection")
     except PyMongoError as e:
         logger.exception("Error creating indexes: %s", e)
         raise
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import logging
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger("campus_admin.intent_router")
+
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "1").lower() in ("1", "true", "yes", "on")
+# Minimum classifier posterior for answering without the LLM
+INTENT_ROUTER_THRESHOLD = float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.9"))
+# Longer messages usually carry qualifiers ("... in the CS department") a template cannot honour
+MAX_ROUTABLE_WORDS = 12
+
+# Words that narrow, negate or act on the question: a template answers the unqualified,
+# campus-wide question only, so any of these sends the message to the agent
+_QUALIFIERS = frozenset(
+    # negation ("aren't" normalizes to "aren t")
+    "not no never without except excluding nor t don doesn didn isn aren wasn weren haven hasn "
+    # filters
+    "only inactive major female male graduate undergraduate "
+    "cs cse ee ece eee mech civil chemical computer science engineering physics chemistry "
+    "biology math maths mathematics economics business commerce law medicine arts history "
+    "english psychology "
+    # actions
+    "cancel delete remove add create update change edit move mark email send notify remind "
+    "book register reschedule postpone".split()
+)
+
+NO_INTENT = "none"
+
+
+@dataclass(frozen=True)
+class Intent:
+    name: str
+    tool: str
+    render: Callable[[Dict[str, Any]], str]
+
+
+@dataclass(frozen=True)
+class Route:
+    intent: Intent
+    confidence: float
+    # "rule" or "classifier"
+    source: str
+
+
+# -----------------------------
+# Answer templates
+# -----------------------------
+
+def _hours(label: str, key: str) -> Callable[[Dict[str, Any]], str]:
+    def render(result: Dict[str, Any]) -> str:
+        hours = result[key]
+        return f"The {label} is open {hours['weekdays']} on weekdays and {hours['weekends']} on weekends."
+    return render
+
+
+def _events(result: Dict[str, Any]) -> str:
+    lines = [f"- {e['title']} ({e['date']})" for e in result["events"]]
+    return "Upcoming campus events:\n" + "\n".join(lines) if lines else "There are no scheduled campus events."
+
+
+def _by_department(result: Dict[str, Any]) -> str:
+    rows = result["by_department"]
+    if not rows:
+        return "There are no students on record yet."
+    return "Students by department:\n" + "\n".join(f"- {dept}: {count}" for dept, count in rows.items())
+
+
+def _recent(result: Dict[str, Any]) -> str:
+    items = result["recent_onboarded"]
+    if not items:
+        return "No students have been onboarded yet."
+    lines = [f"- {s['name']} ({s['student_id']}, {s['department']})" for s in items]
+    return "Most recently onboarded students:\n" + "\n".join(lines)
+
+
+INTENTS: Dict[str, Intent] = {
+    intent.name: intent
+    for intent in (
+        Intent("library_hours", "get_library_hours", _hours("library", "library_hours")),
+        Intent("cafeteria_timings", "get_cafeteria_timings", _hours("cafeteria", "cafeteria_timings")),
+        Intent("event_schedule", "get_event_schedule", _events),
+        Intent(
+            "total_students",
+            "get_total_students",
+            lambda r: f"There are {r['total_students']} students in total.",
+        ),
+        Intent("students_by_department", "get_students_by_department", _by_department),
+        Intent(
+            "active_last_7_days",
+            "get_active_students_last_7_days",
+            lambda r: f"{r['active_last_7_days']} students were active in the last 7 days.",
+        ),
+        Intent("recent_onboarded", "get_recent_onboarded_students", _recent),
+    )
+}
+
+
+# -----------------------------
+# Keyword / pattern rules
+# -----------------------------
+
+_RULES: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r"^(what are |what's |when are |when is )?(the )?library (opening )?(hours|timings?)( today)?\??$"), "library_hours"),
+    (re.compile(r"^when (is|does) the library (open|close)\??$"), "library_hours"),
+    (re.compile(r"^(what are |what's |when are )?(the )?cafeteria (opening )?(hours|timings?)( today)?\??$"), "cafeteria_timings"),
+    (re.compile(r"^when (is|does) the cafeteria (open|close)\??$"), "cafeteria_timings"),
+    (re.compile(r"^(what are |show |list )?(the )?(upcoming |campus )?events( this month| schedule)?\??$"), "event_schedule"),
+    (re.compile(r"^(what is the )?event schedule\??$"), "event_schedule"),
+    (re.compile(r"^how many students( are there| do we have)?( in total| total)?\??$"), "total_students"),
+    (re.compile(r"^(what is the )?total (number of )?students\??$"), "total_students"),
+    (re.compile(r"^(show |list )?students (count )?(by|per) department\??$"), "students_by_department"),
+    (re.compile(r"^how many students (are there )?(in each|per|by) department\??$"), "students_by_department"),
+    (re.compile(r"^how many students (were )?active (in the )?last 7 days\??$"), "active_last_7_days"),
+    (re.compile(r"^(show |list )?(the )?(recently onboarded|recent joiners|newest) students\??$"), "recent_onboarded"),
+]
+
+
+# -----------------------------
+# Naive Bayes classifier
+# -----------------------------
+
+_TRAINING: Dict[str, List[str]] = {
+    "library_hours": [
+        "library hours", "when is the library open", "what time does the library close",
+        "is the library open on weekends", "library timings please", "opening hours of the library",
+        "until when can i stay in the library", "library schedule",
+    ],
+    "cafeteria_timings": [
+        "cafeteria timings", "when does the cafeteria open", "what time does the cafeteria close",
+        "cafeteria hours on weekends", "when can i get lunch at the cafeteria", "is the cafeteria open now",
+        "canteen timings", "mess hall hours",
+    ],
+    "event_schedule": [
+        "events this month", "upcoming events", "what events are happening on campus",
+        "campus event schedule", "any events coming up", "when is the next event", "show the events calendar",
+        "what is happening on campus this week",
+    ],
+    "total_students": [
+        "how many students", "how many students are there", "total number of students",
+        "student count", "what is the total student count", "how many students do we have",
+        "count all students", "number of enrolled students",
+    ],
+    "students_by_department": [
+        "students by department", "how many students per department", "department wise student count",
+        "breakdown of students by department", "which department has the most students",
+        "student distribution across departments", "department counts",
+    ],
+    "active_last_7_days": [
+        "how many students were active in the last 7 days", "active students this week",
+        "students active last week", "weekly active students", "how many students logged in this week",
+        "active users in the past seven days",
+    ],
+    "recent_onboarded": [
+        "recently onboarded students", "who joined recently", "newest students", "latest student signups",
+        "show recent joiners", "who are the new students", "recently added students",
+    ],
+    NO_INTENT: [
+        "add a new student named ali to computer science", "update the email of student s123",
+        "delete student s42", "send an email to all inactive students", "list students in the physics department",
+        "how many students are in the cs department", "how many active students are in biology",
+        "mark these students inactive", "what is the email of student s100", "change year of s12 to 3",
+        "compare department counts and active students", "remind students about the library fine",
+        "is student s55 active", "show me students who joined last year", "hello", "thanks", "who are you",
+        "summarize our conversation", "email the first three of them", "what can you do",
+    ],
+}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(_TOKEN.findall(text.lower()))
+
+
+def _features(words: List[str]) -> List[str]:
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+class _NaiveBayes:
+    """Multinomial naive Bayes over word unigrams and bigrams, trained once at import."""
+
+    def __init__(self, training: Dict[str, List[str]]) -> None:
+        self._priors: Dict[str, float] = {}
+        self._counts: Dict[str, Counter] = {}
+        self._totals: Dict[str, int] = {}
+        self._words: Dict[str, set] = {}
+        total_docs = sum(len(v) for v in training.values())
+        vocab: set = set()
+        for label, examples in training.items():
+            counts: Counter = Counter()
+            words: set = set()
+            for example in examples:
+                tokens = _normalize(example).split()
+                words.update(tokens)
+                counts.update(_features(tokens))
+            self._priors[label] = math.log(len(examples) / total_docs)
+            self._counts[label] = counts
+            self._totals[label] = sum(counts.values())
+            self._words[label] = words
+            vocab.update(counts)
+        self._vocab_size = len(vocab)
+
+    def predict(self, words: List[str]) -> Tuple[str, float, bool]:
+        """Best label, its posterior, and whether every one of ``words`` appears in that label's examples."""
+        feats = _features(words)
+        scores: Dict[str, float] = {}
+        for label, counts in self._counts.items():
+            denom = self._totals[label] + self._vocab_size
+            scores[label] = self._priors[label] + sum(math.log((counts[f] + 1) / denom) for f in feats)
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        norm = sum(math.exp(s - top) for s in scores.values())
+        known = bool(words) and all(w in self._words[best] for w in words)
+        return best, 1.0 / norm, known
+
+
+_classifier = _NaiveBayes(_TRAINING)
+
+router_stats = metrics.Counters()
+metrics.register("intent_router", router_stats.snapshot)
+
+
+def route(message: str) -> Optional[Route]:
+    """Intent for ``message`` if it can be answered from a single tool call, else None."""
+    if not INTENT_ROUTER_ENABLED:
+        return None
+    text = _normalize(message)
+    words = text.split()
+    router_stats.incr("messages")
+    if not words or len(words) > MAX_ROUTABLE_WORDS:
+        router_stats.incr("misses")
+        return None
+    if _QUALIFIERS.intersection(words):
+        router_stats.incr("misses")
+        router_stats.incr("qualified")
+        return None
+
+    raw = message.strip().lower()
+    for pattern, name in _RULES:
+        if pattern.match(raw) or pattern.match(text):
+            router_stats.incr("hits")
+            router_stats.incr(f"hits.{name}")
+            return Route(INTENTS[name], 1.0, "rule")
+
+    label, confidence, known = _classifier.predict(words)
+    # An unseen word is most likely a qualifier the template would silently drop
+    if label != NO_INTENT and confidence >= INTENT_ROUTER_THRESHOLD and known:
+        router_stats.incr("hits")
+        router_stats.incr(f"hits.{label}")
+        return Route(INTENTS[label], confidence, "classifier")
+    router_stats.incr("misses")
+    return None
+
+
+def record_saved_latency(seconds: float) -> None:
+    """Account LLM latency avoided by a fast-path answer."""
+    router_stats.incr("latency_saved_ms", max(0, int(seconds * 1000)))
@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+import openai
+
+import metrics
+import tracing
+
+logger = logging.getLogger("campus_admin.llm_policy")
+
+# Deadline per attempt: a whole completion, or for streams the time to the first chunk
+LLM_CALL_DEADLINE_SECONDS = float(os.getenv("LLM_CALL_DEADLINE_SECONDS", "30"))
+# Longest gap between two chunks of a stream before it is treated as hung
+LLM_STREAM_IDLE_SECONDS = float(os.getenv("LLM_STREAM_IDLE_SECONDS", "20"))
+# Retries after the first attempt, on timeouts, connection errors, 429 and 5xx only
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.25"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "4"))
+# Hedging: start a second identical request when the first is slower than the recent
+# LLM_HEDGE_QUANTILE latency (never sooner than LLM_HEDGE_MIN_DELAY_SECONDS); first response wins
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "0").lower() in ("1", "true", "yes", "on")
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "0.5"))
+LLM_HEDGE_MIN_SAMPLES = 20
+# Circuit breaker: open after this many consecutive provider failures, probe again after the cool-down
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+_RETRYABLE = (
+    asyncio.TimeoutError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class LLMUnavailable(Exception):
+    """The circuit breaker is open: the provider failed repeatedly and is not being called."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, _RETRYABLE):
+        return True
+    # 5xx the SDK has no dedicated class for (e.g. 502/503/504 from a gateway)
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class CircuitBreaker:
+    """Closed -> open after ``threshold`` consecutive failures -> half-open after ``reset_seconds``,
+    when a single probe call decides between closed and open again."""
+
+    def __init__(self, threshold: int, reset_seconds: float) -> None:
+        self._threshold = threshold
+        self._reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.opened_total = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self._reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> None:
+        """Raise LLMUnavailable unless a call may go out now."""
+        state = self.state
+        if state == "open" or (state == "half_open" and self._probing):
+            raise LLMUnavailable("LLM provider circuit is open")
+        if state == "half_open":
+            self._probing = True
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._probing or (self._opened_at is None and self._failures >= self._threshold):
+            self.opened_total += 1
+            self._opened_at = time.monotonic()
+            logger.warning("LLM circuit opened after %d consecutive failure(s)", self._failures)
+        self._probing = False
+
+    def release(self) -> None:
+        """A probe ended without a verdict (cancelled): let the next call probe instead."""
+        self._probing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "opened_total": self.opened_total,
+        }
+
+
+class LLMPolicy:
+    """Deadline, jittered retries, optional hedging and a circuit breaker around LLM calls.
+
+    ``complete`` wraps a non-streamed call; ``stream`` wraps a streamed one, where retries and
+    hedging only apply until the first chunk arrives (nothing has been forwarded yet).
+    The OpenAI client is built with ``max_retries=0`` so this is the only retry layer.
+    """
+
+    def __init__(self) -> None:
+        self.breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+        self.latency = metrics.LatencyStats()
+        self._counters = metrics.Counters()
+        # Attempts abandoned by hedging or cancellation, referenced until they are closed
+        self._losers: Set[asyncio.Task] = set()
+
+    def hedge_delay(self, key: str) -> Optional[float]:
+        if not LLM_HEDGE_ENABLED or self.latency.count(key) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return max(LLM_HEDGE_MIN_DELAY_SECONDS, self.latency.percentile(key, LLM_HEDGE_QUANTILE))
+
+    async def complete(self, create: Callable[[], Awaitable[Any]]) -> Any:
+        async def attempt() -> Any:
+            return await asyncio.wait_for(create(), LLM_CALL_DEADLINE_SECONDS)
+
+        return await self._call("complete", attempt, None)
+
+    async def stream(self, create: Callable[[], Awaitable[Any]]) -> AsyncIterator[Any]:
+        """Yield the chunks of a streamed completion."""
+        stream, iterator, first = await self._call("first_chunk", lambda: _open_stream(create), _close_opened)
+        try:
+            if first is None:
+                return
+            yield first
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), LLM_STREAM_IDLE_SECONDS)
+                except StopAsyncIteration:
+                    return
+                yield chunk
+        except asyncio.TimeoutError:
+            self._counters.incr("stream_idle_timeouts")
+            raise
+        finally:
+            await stream.close()
+
+    async def _call(
+        self,
+        key: str,
+        attempt: Callable[[], Awaitable[Any]],
+        discard: Optional[Callable[[Any], Awaitable[None]]],
+    ) -> Any:
+        self.breaker.before_call()
+        for retry in range(LLM_MAX_RETRIES + 1):
+            started = time.perf_counter()
+            try:
+                result = await self._hedged(key, attempt, discard)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                self._counters.incr(f"errors.{type(e).__name__}")
+                self.latency.observe(f"{key}_failed", time.perf_counter() - started, ok=False)
+                if not is_retryable(e):
+                    # The provider answered (e.g. 400): a caller bug, not an outage
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if retry == LLM_MAX_RETRIES:
+                    raise
+                self.breaker.before_call()
+                self._counters.incr("retries")
+                await asyncio.sleep(self._backoff(retry, e))
+                continue
+            self.breaker.record_success()
+            if retry:
+                tracing.current_span().set(retries=retry)
+            self.latency.observe(key, time.perf_counter() - started)
+            self._counters.incr(f"{key}.ok")
+            return result
+        raise AssertionError("unreachable")
+
+    def _backoff(self, retry: int, error: BaseException) -> float:
+        # Full jitter, honouring a provider's Retry-After within the cap
+        hinted = _retry_after(error)
+        if hinted is not None:
+            return min(hinted, LLM_RETRY_MAX_SECONDS)
+        return random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * (2 ** retry)))
+
+    async def _hedged(
+        self,
+        key: str,
+        attempt: Callable[[], Awaitable[Any]],
+        discard: Optional[Callable[[Any], Awaitable[None]]],
+    ) -> Any:
+        delay = self.hedge_delay(key)
+        if delay is None:
+            return await attempt()
+
+        primary = asyncio.create_task(attempt())
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self._counters.incr("hedges")
+                tasks.append(asyncio.create_task(attempt()))
+            error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winners = [t for t in done if t.exception() is None]
+                if winners:
+                    winner = winners[0] if primary not in winners else primary
+                    if winner is not primary:
+                        self._counters.incr("hedge_wins")
+                        tracing.current_span().set(hedge_won=True)
+                    for other in winners:
+                        if other is not winner and discard is not None:
+                            await discard(other.result())
+                    return winner.result()
+                error = next(iter(done)).exception()
+            assert error is not None
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                    self._losers.add(task)
+                    task.add_done_callback(self._losers.discard)
+
+    def snapshot(self) -> Dict[str, Any]:
+        delays = {key: self.hedge_delay(key) for key in ("complete", "first_chunk")}
+        return {
+            "breaker": self.breaker.snapshot(),
+            "hedging": {
+                "enabled": LLM_HEDGE_ENABLED,
+                "delay_ms": {k: round(v * 1000, 1) for k, v in delays.items() if v is not None},
+            },
+            "counters": self._counters.snapshot(),
+            "latency": self.latency.snapshot(),
+        }
+
+
+async def _open_stream(create: Callable[[], Awaitable[Any]]) -> Tuple[Any, Any, Any]:
+    """Start a stream and wait for its first chunk within the deadline; close it if that fails."""
+    stream = None
+
+    async def opened() -> Tuple[Any, Any, Any]:
+        nonlocal stream
+        stream = await create()
+        iterator = stream.__aiter__()
+        try:
+            first = await iterator.__anext__()
+        except StopAsyncIteration:
+            first = None
+        return stream, iterator, first
+
+    try:
+        return await asyncio.wait_for(opened(), LLM_CALL_DEADLINE_SECONDS)
+    except BaseException:
+        if stream is not None:
+            await stream.close()
+        raise
+
+
+async def _close_opened(opened: Tuple[Any, Any, Any]) -> None:
+    await opened[0].close()
+
+
+llm_policy = LLMPolicy()
+metrics.register("llm", llm_policy.snapshot)
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 from contextlib import asynccontextmanager
@@ -8,11 +9,15 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
+from agent import AGENT_MODEL, close_openai_client
+from context import preload_tokenizer
 from db import close_mongo_connection, connect_to_mongo, ensure_indexes
+import metrics
 from routes.students import router as students_router
 from routes.chat import router as chat_router
 from routes.analytics import router as analytics_router
 from routes.auth import router as auth_router
+from routes.admin import router as admin_router
 
 
 logging.basicConfig(
@@ -32,6 +37,8 @@ SKIP_DB = os.getenv("BACKEND_SKIP_DB", "0").lower() in ("1", "true", "yes", "on"
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Tokenizer files may be fetched on first use; do it once here rather than inside a request
+    await asyncio.to_thread(preload_tokenizer, AGENT_MODEL)
     if not SKIP_DB:
         # Startup
         await connect_to_mongo()
@@ -40,10 +47,14 @@ async def lifespan(app: FastAPI):
             yield
         finally:
             # Shutdown
+            await close_openai_client()
             await close_mongo_connection()
     else:
         logger.warning("BACKEND_SKIP_DB is set; starting without MongoDB connection.")
-        yield
+        try:
+            yield
+        finally:
+            await close_openai_client()
 
 
 app = FastAPI(title="Campus Admin Agent Backend", version="0.1.0", lifespan=lifespan)
@@ -55,6 +66,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Pagination headers of GET /students
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],
 )
 
 # Routers
@@ -62,8 +75,14 @@ app.include_router(auth_router, prefix="/auth", tags=["auth"])  # authentication
 app.include_router(students_router, prefix="/students", tags=["students"])  # RESTful CRUD
 app.include_router(chat_router, prefix="/chat", tags=["chat"])  # chat + streaming
 app.include_router(analytics_router, prefix="/analytics", tags=["analytics"])  # analytics
+app.include_router(admin_router, prefix="/admin", tags=["admin"])  # traces
 
 
 @app.get("/health")
 async def health() -> dict:
     return {"status": "ok"}
+
+
+@app.get("/metrics")
+async def get_metrics() -> dict:
+    return metrics.snapshot()
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict
+
+logger = logging.getLogger("campus_admin.metrics")
+
+# Named collectors; each returns a JSON-serializable snapshot of its own counters
+_collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register(name: str, collector: Callable[[], Dict[str, Any]]) -> None:
+    """Register (or replace) the collector reported under ``name`` by GET /metrics."""
+    _collectors[name] = collector
+
+
+def snapshot() -> Dict[str, Any]:
+    """Collect the current value of every registered collector."""
+    out: Dict[str, Any] = {}
+    for name, collector in _collectors.items():
+        try:
+            out[name] = collector()
+        except Exception as e:
+            logger.exception("Metrics collector '%s' failed: %s", name, e)
+            out[name] = {"error": str(e)}
+    return out
+
+
+class Counters:
+    """Monotonic named counters."""
+
+    def __init__(self) -> None:
+        self._values: Dict[str, int] = {}
+
+    def incr(self, key: str, value: int = 1) -> None:
+        self._values[key] = self._values.get(key, 0) + value
+
+    def get(self, key: str) -> int:
+        return self._values.get(key, 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(sorted(self._values.items()))
+
+
+class LatencyStats:
+    """Per-key call counts, errors and latency percentiles over a bounded window of recent samples."""
+
+    def __init__(self, window: int = 512) -> None:
+        self._window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._total: Dict[str, float] = {}
+
+    def observe(self, key: str, seconds: float, ok: bool = True) -> None:
+        self._samples.setdefault(key, deque(maxlen=self._window)).append(seconds)
+        self._counts[key] = self._counts.get(key, 0) + 1
+        self._total[key] = self._total.get(key, 0.0) + seconds
+        if not ok:
+            self._errors[key] = self._errors.get(key, 0) + 1
+
+    def count(self, key: str) -> int:
+        return self._counts.get(key, 0)
+
+    def mean(self, key: str) -> float:
+        count = self._counts.get(key, 0)
+        return self._total[key] / count if count else 0.0
+
+    def percentile(self, key: str, q: float) -> float:
+        samples = sorted(self._samples.get(key, ()))
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for key in sorted(self._counts):
+            out[key] = {
+                "count": self._counts[key],
+                "errors": self._errors.get(key, 0),
+                "mean_ms": round(self._total[key] / self._counts[key] * 1000, 2),
+                "p50_ms": round(self.percentile(key, 0.50) * 1000, 2),
+                "p95_ms": round(self.percentile(key, 0.95) * 1000, 2),
+                "max_ms": round(max(self._samples[key]) * 1000, 2),
+            }
+        return out
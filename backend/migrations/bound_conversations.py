@@ -0,0 +1,110 @@
+"""
+Migrate conversations to the bounded storage layout.
+
+Older conversation documents keep every message inline. For each of them this
+copies the full history into the conversation_messages archive, trims the
+inline array to the last CONVERSATION_WINDOW messages and stamps
+storage_version.
+
+Archived legacy messages are upserted on (session_id, legacy_seq), so a run
+interrupted between archiving and trimming can simply be repeated. Messages
+appended since the deploy already carry created_at and were archived when
+they were written; they are not copied again.
+
+    cd backend && python -m migrations.bound_conversations [--dry-run]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Any, Dict, List
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / ".env")
+load_dotenv()
+
+from conversations import CONVERSATION_WINDOW, STORAGE_VERSION  # noqa: E402
+from db import close_mongo_connection, connect_to_mongo, ensure_indexes, get_db  # noqa: E402
+
+logger = logging.getLogger("campus_admin.migrations")
+
+BATCH_SIZE = 500
+
+
+async def migrate(dry_run: bool) -> None:
+    await connect_to_mongo()
+    try:
+        if not dry_run:
+            await ensure_indexes()
+        db = get_db()
+        migrated = archived = skipped = 0
+        async for conv in db.conversations.find({"storage_version": {"$exists": False}}):
+            messages = conv.get("messages", [])
+            base = conv.get("created_at") or conv["_id"].generation_time
+            inline: List[Dict[str, Any]] = []
+            legacy: List[Dict[str, Any]] = []
+            for i, m in enumerate(messages):
+                if m.get("created_at") is not None:
+                    inline.append(m)
+                    continue
+                # Legacy messages carry no timestamp; BSON keeps milliseconds, so millisecond
+                # offsets are the smallest that preserve their order in the archive
+                doc = {**m, "created_at": base + timedelta(milliseconds=i)}
+                inline.append(doc)
+                legacy.append({"session_id": conv["session_id"], "legacy_seq": i, **doc})
+            if not dry_run:
+                for start in range(0, len(legacy), BATCH_SIZE):
+                    await db.conversation_messages.bulk_write(
+                        [
+                            UpdateOne(
+                                {"session_id": d["session_id"], "legacy_seq": d["legacy_seq"]},
+                                {"$setOnInsert": d},
+                                upsert=True,
+                            )
+                            for d in legacy[start:start + BATCH_SIZE]
+                        ],
+                        ordered=False,
+                    )
+                res = await db.conversations.update_one(
+                    # Unchanged since it was read: no message was appended in the meantime
+                    {"_id": conv["_id"], "storage_version": {"$exists": False}, "messages": {"$size": len(messages)}},
+                    {
+                        "$set": {
+                            "messages": inline[-CONVERSATION_WINDOW:],
+                            "message_count": len(messages),
+                            "storage_version": STORAGE_VERSION,
+                        }
+                    },
+                )
+                if res.matched_count == 0:
+                    skipped += 1
+                    logger.warning("Conversation %s changed during migration; re-run to finish it", conv["session_id"])
+                    continue
+            migrated += 1
+            archived += len(legacy)
+        logger.info(
+            "%s %d conversation(s), %d message(s) archived, %d skipped",
+            "Would migrate" if dry_run else "Migrated",
+            migrated,
+            archived,
+            skipped,
+        )
+    finally:
+        await close_mongo_connection()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    asyncio.run(migrate(args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
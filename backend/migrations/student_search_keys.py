@@ -0,0 +1,70 @@
+"""
+Backfill the student search keys used by GET /students?q= and list_students_tool.
+
+Students written before indexed search have no search_name / search_email /
+search_id prefix keys and so are invisible to prefix search; without
+search_name_full, queries longer than SEARCH_NGRAM_MAX only match names as
+typed (accents included). This recomputes the keys for every student whose
+keys are missing, or for all of them with
+--all (e.g. after changing SEARCH_NGRAM_MIN / SEARCH_NGRAM_MAX), in unordered
+bulk batches. The text index on name needs no backfill. Safe to re-run.
+
+    cd backend && python -m migrations.student_search_keys [--all] [--dry-run]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / ".env")
+load_dotenv()
+
+from db import close_mongo_connection, connect_to_mongo, ensure_indexes, get_db  # noqa: E402
+from student_search import SEARCH_FIELDS, SEARCH_KEY_SOURCES, search_keys  # noqa: E402
+
+logger = logging.getLogger("campus_admin.migrations")
+
+BATCH_SIZE = 500
+
+
+async def migrate(rebuild_all: bool, dry_run: bool) -> None:
+    await connect_to_mongo()
+    try:
+        if not dry_run:
+            await ensure_indexes()
+        db = get_db()
+        flt = {} if rebuild_all else {"$or": [{key: {"$exists": False}} for key in SEARCH_FIELDS]}
+        projection = {source: 1 for source in SEARCH_KEY_SOURCES.values()}
+        updated = 0
+        batch = []
+        async for doc in db.students.find(flt, projection):
+            batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": search_keys(doc)}))
+            if len(batch) >= BATCH_SIZE:
+                if not dry_run:
+                    await db.students.bulk_write(batch, ordered=False)
+                updated += len(batch)
+                batch = []
+        if batch and not dry_run:
+            await db.students.bulk_write(batch, ordered=False)
+        updated += len(batch)
+        logger.info("%s search keys for %d student(s)", "Would write" if dry_run else "Wrote", updated)
+    finally:
+        await close_mongo_connection()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--all", action="store_true", help="recompute keys for every student, not just missing ones")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    asyncio.run(migrate(args.all, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+
+class ChatBatchItem(BaseModel):
+    message: str = Field(..., min_length=1, max_length=8000)
+    # Overrides the batch's session policy for this item
+    session_id: Optional[str] = Field(None, min_length=1, max_length=200)
+
+
+class ChatBatchRequest(BaseModel):
+    """Messages to run through the agent. ``per_item`` gives every item a fresh session so items
+    run in parallel; ``shared`` runs them in order in one session (``session_id``, generated if
+    omitted) so later instructions can refer to earlier ones."""
+    items: List[ChatBatchItem] = Field(..., min_length=1)
+    session_policy: Literal["per_item", "shared"] = "per_item"
+    session_id: Optional[str] = Field(None, min_length=1, max_length=200)
+    concurrency: Optional[int] = Field(None, ge=1)
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+import tracing
+
+router = APIRouter()
+
+
+@router.get("/traces")
+async def list_traces(
+    limit: int = Query(default=50, ge=1, le=500),
+    name: Optional[str] = Query(default=None, description="root span name, e.g. chat_turn or summary_refresh"),
+    session_id: Optional[str] = None,
+    min_duration_ms: float = Query(default=0.0, ge=0),
+    spans: bool = Query(default=False, description="include every span, not just the root"),
+    format: Literal["json", "otlp"] = "json",
+) -> Dict[str, Any]:
+    """Recent chat turn traces (newest first) with per-phase, per-tool and per-model aggregates
+    over everything still in the buffer."""
+    found = tracing.recent(limit, name, session_id, min_duration_ms)
+    if format == "otlp":
+        return tracing.to_otlp(found)
+    return {
+        "traces": [t.to_dict(with_spans=spans) for t in found],
+        "aggregates": tracing.aggregates(),
+    }
+
+
+@router.get("/traces/{trace_id}")
+async def get_trace(trace_id: str) -> Dict[str, Any]:
+    found = tracing.get_trace(trace_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Trace not found (it may have left the buffer)")
+    return found.to_dict()
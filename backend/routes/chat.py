@@ -1,12 +1,17 @@
 from __future__ import annotations
 
 import json
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
-from fastapi import APIRouter, HTTPException, Request, Query
+from fastapi import APIRouter, Header, HTTPException, Request, Query, Response, WebSocket
 from fastapi.responses import StreamingResponse
 
 from agent import run_chat, stream_chat_tokens
+from chat_batch import run_batch, validate_batch
+from chat_socket import ChatSocket
+from concurrency import admission
+from models.chat import ChatBatchRequest
+from streaming import SSE_HEADERS, resume_stream
 
 router = APIRouter()
 
@@ -22,24 +27,50 @@ async def chat(payload: Dict[str, Any]) -> Dict[str, Any]:
     return {"session_id": session_id, "reply": reply}
 
 
+@router.post("/batch")
+async def chat_batch(payload: ChatBatchRequest):
+    """Run many messages through the agent; streams NDJSON item lines as they finish, then a summary."""
+    concurrency = validate_batch(payload)
+    admission.ensure_capacity()
+    return StreamingResponse(run_batch(payload, concurrency), media_type="application/x-ndjson")
+
+
+async def _stream_response(session_id: str, message: str, last_event_id: Optional[str]) -> Response:
+    """Resume the turn named by ``last_event_id`` if given, otherwise start a new streamed turn."""
+    if last_event_id:
+        frames = await resume_stream(session_id, last_event_id)
+        if frames is None:
+            # Everything was delivered; 204 tells EventSource to stop reconnecting
+            return Response(status_code=204)
+    else:
+        admission.ensure_capacity()
+        frames = stream_chat_tokens(session_id=session_id, user_message=message)
+    return StreamingResponse(frames, media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @router.post("/stream")
-async def chat_stream_post(payload: Dict[str, Any]):
+async def chat_stream_post(
+    payload: Dict[str, Any],
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
     session_id = payload.get("session_id")
     message = payload.get("message")
     if not session_id or not message:
         raise HTTPException(status_code=400, detail="session_id and message are required")
-
-    async def event_gen():
-        async for chunk in stream_chat_tokens(session_id=session_id, user_message=message):
-            yield chunk
-
-    return StreamingResponse(event_gen(), media_type="text/event-stream")
+    return await _stream_response(session_id, message, last_event_id or payload.get("last_event_id"))
 
 
 @router.get("/stream")
-async def chat_stream_get(session_id: str = Query(...), message: str = Query(...)):
-    async def event_gen():
-        async for chunk in stream_chat_tokens(session_id=session_id, user_message=message):
-            yield chunk
+async def chat_stream_get(
+    session_id: str = Query(...),
+    message: str = Query(...),
+    last_event_id: Optional[str] = Query(None),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    # EventSource sends Last-Event-ID itself when it reconnects; the query parameter is for manual resumes
+    return await _stream_response(session_id, message, last_event_id_header or last_event_id)
+
 
-    return StreamingResponse(event_gen(), media_type="text/event-stream")
+@router.websocket("/ws")
+async def chat_ws(websocket: WebSocket):
+    await ChatSocket(websocket).run()
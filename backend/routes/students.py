@@ -1,14 +1,27 @@
 from __future__ import annotations
 
+import copy
+import os
+from datetime import datetime, timezone
 from typing import List, Optional
 
-from bson import ObjectId
-from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from pymongo import ASCENDING, DESCENDING
-from pymongo.errors import DuplicateKeyError
 
 from db import get_db
+from student_export import (
+    EXPORT_BATCH_SIZE,
+    EXPORT_MAX_BATCH_SIZE,
+    MEDIA_TYPES,
+    ExportFormat,
+    check_format,
+    export_columns,
+    export_students,
+)
+from student_import import ImportFormat, StudentImport, detect_format
+from student_repository import StudentError, StudentRepository
+from student_search import SearchMode, encode_cursor, student_query
 from models.student import (
     StudentCreate,
     StudentOut,
@@ -19,117 +32,143 @@ from models.student import (
 
 router = APIRouter()
 
+# include_total on a filtered listing counts at most this many matches (X-Total-Count is then a floor)
+STUDENTS_COUNT_LIMIT = int(os.getenv("STUDENTS_COUNT_LIMIT", "10000"))
+
+
+def _http_error(e: StudentError) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=e.detail)
+
 
 @router.post("/", response_model=StudentOut, status_code=201)
 async def create_student(payload: StudentCreate) -> StudentOut:
-    db: AsyncIOMotorDatabase = get_db()
-    doc = payload.model_dump()
-    result = None
     try:
-        result = await db.students.insert_one(doc)
-    except DuplicateKeyError as e:
-        # Determine which field caused the duplicate
-        detail = "Duplicate key"
-        msg = str(e).lower()
-        if "student_id" in msg:
-            detail = "student_id already exists"
-        elif "email" in msg:
-            detail = "email already exists"
-        raise HTTPException(status_code=409, detail=detail)
+        doc = await StudentRepository(get_db()).create(payload)
+    except StudentError as e:
+        raise _http_error(e)
+    return student_entity(doc)
+
 
-    inserted = await db.students.find_one({"_id": result.inserted_id})
-    return student_entity(inserted)
+@router.post("/import")
+async def import_students(
+    request: Request,
+    format: Optional[ImportFormat] = Query(None, description="csv or ndjson; defaults from Content-Type"),
+    dry_run: bool = Query(False, description="Validate and check duplicates without writing"),
+) -> dict:
+    """Bulk-create students from a CSV (header row required) or NDJSON request body.
+
+    The body is parsed as it arrives and written in unordered insert_many batches, so the
+    upload is never held in memory. Invalid and duplicate rows are reported by row number
+    and skipped; every other row is inserted.
+    """
+    db: AsyncIOMotorDatabase = get_db()
+    fmt = detect_format(format, request.headers.get("content-type"))
+    return await StudentImport(db, fmt, dry_run).run(request.stream())
 
 
 @router.get("/", response_model=List[StudentOut])
 async def list_students(
+    response: Response,
     limit: int = Query(50, ge=1, le=200),
-    skip: int = Query(0, ge=0),
+    skip: int = Query(0, ge=0, description="Offset paging; prefer cursor, which costs the same on every page"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    include_total: bool = Query(False, description="Send X-Total-Count (estimated without filters, capped with them)"),
     department: Optional[str] = None,
     status: Optional[str] = Query(None, pattern="^(active|inactive)$"),
-    q: Optional[str] = Query(None, description="Free-text search on name, email, student_id"),
+    q: Optional[str] = Query(None, max_length=200, description="Search on name, email, student_id"),
+    search_mode: SearchMode = Query(
+        "auto",
+        description="prefix: indexed prefix match on name words, email and student_id; "
+        "text: ranked full-text search on name; regex: unindexed substring match; "
+        "auto: prefix for one term, text for several",
+    ),
 ) -> List[StudentOut]:
+    repo = StudentRepository(get_db())
+    query = student_query(department, status, q, search_mode)
+    # Before any cursor condition, and deep: the cursor is added under "$and", which prefix search may already use
+    count_filter = copy.deepcopy(query.filter)
+    if cursor:
+        if skip:
+            raise HTTPException(status_code=400, detail="Use either cursor or skip, not both")
+        if not query.pageable:
+            raise HTTPException(status_code=400, detail="Cursors are not supported for text search; use skip")
+        try:
+            query.after(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # Keyset paging: one extra row tells whether there is a next page; served by idx_joined_at_id_desc
+    docs = await repo.find(query, limit + 1, skip)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        if query.pageable:
+            response.headers["X-Next-Cursor"] = encode_cursor(docs[-1])
+
+    if include_total:
+        total = await repo.count(count_filter, STUDENTS_COUNT_LIMIT)
+        response.headers["X-Total-Count"] = str(total)
+
+    return [student_entity(doc) for doc in docs]
+
+
+# Declared before /{student_id} so "export" is not taken for an id
+@router.get("/export")
+async def export_students_route(
+    format: ExportFormat = "csv",
+    fields: Optional[str] = Query(None, description="Comma-separated columns, e.g. student_id,name,email"),
+    department: Optional[str] = None,
+    status: Optional[str] = Query(None, pattern="^(active|inactive)$"),
+    q: Optional[str] = Query(None, max_length=200),
+    search_mode: SearchMode = "auto",
+    batch_size: int = Query(EXPORT_BATCH_SIZE, ge=1, le=EXPORT_MAX_BATCH_SIZE),
+) -> StreamingResponse:
+    """Stream every matching student as CSV, NDJSON or Parquet, straight from the cursor:
+    one request for the whole roster, with memory bounded by ``batch_size``."""
     db: AsyncIOMotorDatabase = get_db()
-    flt: dict = {}
-
-    if department:
-        flt["department"] = department
-    if status:
-        flt["status"] = status
-    if q:
-        flt["$or"] = [
-            {"name": {"$regex": q, "$options": "i"}},
-            {"email": {"$regex": q, "$options": "i"}},
-            {"student_id": {"$regex": q, "$options": "i"}},
-        ]
-
-    cursor = (
-        db.students.find(flt)
-        .sort([("joined_at", DESCENDING)])
-        .skip(skip)
-        .limit(limit)
+    check_format(format)
+    columns = export_columns(fields)
+    query = student_query(department, status, q, search_mode)
+    filename = f"students-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.{format}"
+    return StreamingResponse(
+        export_students(db, query, columns, format, batch_size),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
 
-    items: List[StudentOut] = []
-    async for doc in cursor:
-        items.append(student_entity(doc))
-    return items
-
 
 @router.get("/{student_id}", response_model=StudentOut)
 async def get_student_by_id(student_id: str) -> StudentOut:
-    db: AsyncIOMotorDatabase = get_db()
     # Allow both ObjectId and custom student_id lookups
-    flt = {"$or": [{"student_id": student_id}]}
-    if ObjectId.is_valid(student_id):
-        flt["$or"].append({"_id": ObjectId(student_id)})
-
-    doc = await db.students.find_one(flt)
-    if not doc:
-        raise HTTPException(status_code=404, detail="Student not found")
+    try:
+        doc = await StudentRepository(get_db()).get_by_key(student_id)
+    except StudentError as e:
+        raise _http_error(e)
     return student_entity(doc)
 
 
 @router.put("/{id}", response_model=StudentOut)
 async def update_student(id: str, payload: StudentUpdate) -> StudentOut:
-    db: AsyncIOMotorDatabase = get_db()
     try:
         oid = object_id_from_str(id)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid id format")
 
-    updates = {k: v for k, v in payload.model_dump(exclude_unset=True).items()}
-    if not updates:
-        raise HTTPException(status_code=400, detail="No fields to update")
-
     try:
-        res = await db.students.update_one({"_id": oid}, {"$set": updates})
-    except DuplicateKeyError as e:
-        detail = "Duplicate key"
-        msg = str(e).lower()
-        if "student_id" in msg:
-            detail = "student_id already exists"
-        elif "email" in msg:
-            detail = "email already exists"
-        raise HTTPException(status_code=409, detail=detail)
-
-    if res.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Student not found")
-
-    doc = await db.students.find_one({"_id": oid})
+        doc = await StudentRepository(get_db()).update({"_id": oid}, payload)
+    except StudentError as e:
+        raise _http_error(e)
     return student_entity(doc)
 
 
 @router.delete("/{id}", status_code=204)
 async def delete_student(id: str) -> Response:
-    db: AsyncIOMotorDatabase = get_db()
     try:
         oid = object_id_from_str(id)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid id format")
 
-    res = await db.students.delete_one({"_id": oid})
-    if res.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Student not found")
-
+    try:
+        await StudentRepository(get_db()).delete({"_id": oid})
+    except StudentError as e:
+        raise _http_error(e)
     return Response(status_code=204)
@@ -0,0 +1,419 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, status
+
+import metrics
+from concurrency import on_session_wanted
+from db import get_db
+
+logger = logging.getLogger("campus_admin.streaming")
+
+# Consecutive token events are merged into one frame for up to this long...
+STREAM_COALESCE_MS = float(os.getenv("STREAM_COALESCE_MS", "20"))
+# ...or until this many characters are pending, whichever comes first
+STREAM_COALESCE_MAX_CHARS = int(os.getenv("STREAM_COALESCE_MAX_CHARS", "256"))
+# Comment frame sent when nothing else was written for this long (keeps proxies from timing out)
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+
+# Resume: a turn keeps generating this long after its last listener disconnects. It holds the
+# session lock meanwhile, so keep it short; a new message for the session ends the wait early
+STREAM_RESUME_GRACE_SECONDS = float(os.getenv("STREAM_RESUME_GRACE_SECONDS", "5"))
+# Events of each turn kept in memory, and how long finished turns stay resumable
+STREAM_REPLAY_MAX_EVENTS = int(os.getenv("STREAM_REPLAY_MAX_EVENTS", "2000"))
+STREAM_REPLAY_TTL_SECONDS = float(os.getenv("STREAM_REPLAY_TTL_SECONDS", "120"))
+STREAM_REPLAY_MAX_TURNS = int(os.getenv("STREAM_REPLAY_MAX_TURNS", "500"))
+# Also write events to Mongo (stream_events) when they leave memory or the turn ends, so
+# resumes work after eviction and on other workers once the turn has finished
+STREAM_REPLAY_SPILL = os.getenv("STREAM_REPLAY_SPILL", "0").lower() in ("1", "true", "yes", "on")
+STREAM_REPLAY_SPILL_TTL_SECONDS = int(os.getenv("STREAM_REPLAY_SPILL_TTL_SECONDS", "3600"))
+# Client reconnect delay advertised in the first frame
+STREAM_RETRY_MS = 1000
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+HEARTBEAT = ": ping\n\n"
+TERMINAL_EVENTS = ("message_end", "error")
+
+_counters = metrics.Counters()
+metrics.register("streams", _counters.snapshot)
+
+# Background tasks (spills, cancelled producers), referenced until they finish
+_background: Set[asyncio.Task] = set()
+
+
+def _keep(task: asyncio.Task) -> None:
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+def sse_event(event: Dict[str, Any], event_id: Optional[str] = None) -> str:
+    data = f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+    return f"id: {event_id}\n{data}" if event_id else data
+
+
+def parse_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """``"<turn_id>:<seq>"`` from a Last-Event-ID header, or None when absent or malformed."""
+    if not value or ":" not in value:
+        return None
+    turn_id, _, seq = value.strip().rpartition(":")
+    if not turn_id or not seq.isdigit():
+        return None
+    return turn_id, int(seq)
+
+
+# -----------------------------
+# Turn event log
+# -----------------------------
+
+class TurnStream:
+    """Sequence-numbered events of one streamed turn (from 1), the newest kept in memory.
+
+    The producer task publishes into it; any number of listeners follow it from a given
+    sequence number. The turn outlives its listeners for STREAM_RESUME_GRACE_SECONDS, unless
+    another turn of the session is waiting for the session lock: then it stops as soon as no
+    listener is attached.
+    """
+
+    def __init__(self, session_id: str) -> None:
+        self.turn_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.producer: Optional[asyncio.Task] = None
+        self._events: Deque[Tuple[int, Dict[str, Any]]] = deque()
+        self._next_seq = 1
+        self._signal = asyncio.Event()
+        self._listeners = 0
+        self._grace: Optional[asyncio.TimerHandle] = None
+        self._wanted = False
+        self._spill: List[Tuple[int, Dict[str, Any]]] = []
+
+    @property
+    def first_seq(self) -> int:
+        """Oldest event still held in this process (including events waiting to be spilled)."""
+        if self._spill:
+            return self._spill[0][0]
+        return self._events[0][0] if self._events else self._next_seq
+
+    @property
+    def last_seq(self) -> int:
+        return self._next_seq - 1
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        self._events.append((self._next_seq, event))
+        self._next_seq += 1
+        if len(self._events) > STREAM_REPLAY_MAX_EVENTS:
+            evicted = self._events.popleft()
+            if STREAM_REPLAY_SPILL:
+                self._spill.append(evicted)
+                if len(self._spill) >= 100:
+                    self._flush_spill()
+        self._wake()
+
+    def finish(self) -> None:
+        self.done = True
+        self.finished_at = time.monotonic()
+        if STREAM_REPLAY_SPILL:
+            # Store everything not yet spilled, so the finished turn can be resumed after eviction or
+            # on another worker; the events also stay in memory until the turn is pruned
+            batch = self._spill + list(self._events)
+            _keep(asyncio.create_task(_spill(self.turn_id, self.session_id, batch)))
+        self._wake()
+
+    def since(self, seq: int) -> Optional[List[Tuple[int, Dict[str, Any]]]]:
+        """Events after ``seq``; None when some of them have already left memory."""
+        if seq + 1 < self.first_seq:
+            return None
+        held = list(self._spill) + list(self._events) if self._spill else self._events
+        start = seq + 1 - self.first_seq
+        return [held[i] for i in range(start, len(held))]
+
+    async def wait(self, seq: int, timeout: float) -> None:
+        """Return once an event after ``seq`` exists, the turn is done, or ``timeout`` passes."""
+        if self._next_seq - 1 > seq or self.done:
+            return
+        signal = self._signal
+        try:
+            await asyncio.wait_for(signal.wait(), max(timeout, 0.0))
+        except asyncio.TimeoutError:
+            pass
+
+    def attach(self) -> None:
+        self._listeners += 1
+        if self._grace is not None:
+            self._grace.cancel()
+            self._grace = None
+
+    def detach(self) -> None:
+        self._listeners -= 1
+        if self._listeners > 0 or self.done:
+            return
+        if self._wanted:
+            self._abandon("preempted")
+        elif STREAM_RESUME_GRACE_SECONDS <= 0:
+            self._abandon()
+        else:
+            self._grace = asyncio.get_running_loop().call_later(STREAM_RESUME_GRACE_SECONDS, self._abandon)
+
+    def session_wanted(self) -> None:
+        """Another turn of this session is waiting for the lock this turn's producer holds."""
+        self._wanted = True
+        if self._listeners == 0 and not self.done:
+            if self._grace is not None:
+                self._grace.cancel()
+            self._abandon("preempted")
+
+    def _abandon(self, reason: str = "abandoned") -> None:
+        """No listener came back: stop generating (the agent records the partial answer)."""
+        self._grace = None
+        if self._listeners == 0 and self.producer is not None and not self.producer.done():
+            _counters.incr(reason)
+            self.producer.cancel()
+            _keep(self.producer)
+
+    def _wake(self) -> None:
+        self._signal.set()
+        self._signal = asyncio.Event()
+
+    def _flush_spill(self) -> None:
+        batch, self._spill = self._spill, []
+        if batch:
+            _keep(asyncio.create_task(_spill(self.turn_id, self.session_id, batch)))
+
+
+async def _spill(turn_id: str, session_id: str, events: List[Tuple[int, Dict[str, Any]]]) -> None:
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(seconds=STREAM_REPLAY_SPILL_TTL_SECONDS)
+    docs = [
+        {"turn_id": turn_id, "session_id": session_id, "seq": seq, "event": event, "expires_at": expires_at}
+        for seq, event in events
+    ]
+    try:
+        await get_db().stream_events.insert_many(docs, ordered=False)
+        _counters.incr("events_spilled", len(docs))
+    except Exception as e:
+        logger.exception("Failed to spill %d stream event(s) of turn %s: %s", len(docs), turn_id, e)
+
+
+# Live and recently finished turns by id, oldest first
+_turns: "OrderedDict[str, TurnStream]" = OrderedDict()
+
+
+def _prune() -> None:
+    now = time.monotonic()
+    for turn_id in list(_turns):
+        turn = _turns[turn_id]
+        expired = turn.done and now - (turn.finished_at or now) > STREAM_REPLAY_TTL_SECONDS
+        if expired or (len(_turns) > STREAM_REPLAY_MAX_TURNS and turn.done):
+            del _turns[turn_id]
+
+
+async def _pump(events: AsyncIterator[Dict[str, Any]], turn: TurnStream) -> None:
+    try:
+        with on_session_wanted(turn.session_wanted):
+            async for event in events:
+                if event.get("type") == "message_start":
+                    event = {**event, "turn_id": turn.turn_id}
+                turn.publish(event)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.exception("Chat event stream failed: %s", e)
+        turn.publish({"type": "error", "message": "The response stream failed. Please try again."})
+    finally:
+        turn.finish()
+
+
+def start_turn_stream(session_id: str, events: AsyncIterator[Dict[str, Any]]) -> TurnStream:
+    """Run ``events`` in the background as a new resumable turn."""
+    _prune()
+    turn = TurnStream(session_id)
+    _turns[turn.turn_id] = turn
+    turn.producer = asyncio.create_task(_pump(events, turn))
+    _counters.incr("turns")
+    return turn
+
+
+def find_turn(turn_id: str, session_id: str) -> Optional[TurnStream]:
+    # Resumes are the only traffic some workers see, so expire finished turns here too
+    _prune()
+    turn = _turns.get(turn_id)
+    if turn is None or turn.session_id != session_id:
+        return None
+    return turn
+
+
+async def load_spilled(turn_id: str, session_id: str, after: int) -> List[Tuple[int, Dict[str, Any]]]:
+    """Spilled events of a turn after ``after`` (empty when spilling is off or nothing was stored)."""
+    if not STREAM_REPLAY_SPILL:
+        return []
+    cursor = get_db().stream_events.find(
+        {"turn_id": turn_id, "session_id": session_id, "seq": {"$gt": after}},
+        {"_id": 0, "seq": 1, "event": 1},
+    ).sort([("seq", 1)])
+    return [(doc["seq"], doc["event"]) async for doc in cursor]
+
+
+async def _older(turn: TurnStream, after: int) -> Optional[List[Tuple[int, Dict[str, Any]]]]:
+    """Spilled events of ``turn`` after ``after`` that have left memory; None when some are
+    missing (spilling off, or not stored yet), i.e. the turn cannot be followed from ``after``."""
+    spilled = await load_spilled(turn.turn_id, turn.session_id, after)
+    batch = [(seq, ev) for seq, ev in spilled if seq < turn.first_seq]
+    if not batch or batch[0][0] != after + 1:
+        return None
+    return batch
+
+
+# -----------------------------
+# SSE framing
+# -----------------------------
+
+class _Frames:
+    """Coalesces token events into frames; each frame carries the id of its last event."""
+
+    def __init__(self, turn_id: str) -> None:
+        self.turn_id = turn_id
+        self.pending: List[str] = []
+        self.pending_chars = 0
+        self.pending_seq = 0
+        self.flush_at: Optional[float] = None
+
+    def add(self, seq: int, event: Dict[str, Any]) -> List[str]:
+        frames: List[str] = []
+        if event.get("type") == "token":
+            value = event.get("value") or ""
+            self.pending.append(value)
+            self.pending_chars += len(value)
+            self.pending_seq = seq
+            if self.flush_at is None:
+                self.flush_at = time.monotonic() + STREAM_COALESCE_MS / 1000.0
+            if self.pending_chars >= STREAM_COALESCE_MAX_CHARS or STREAM_COALESCE_MS <= 0:
+                frames.append(self.flush())
+            return frames
+        if self.pending:
+            frames.append(self.flush())
+        frames.append(sse_event(event, f"{self.turn_id}:{seq}"))
+        return frames
+
+    def flush(self) -> str:
+        frame = sse_event({"type": "token", "value": "".join(self.pending)}, f"{self.turn_id}:{self.pending_seq}")
+        self.pending, self.pending_chars, self.flush_at = [], 0, None
+        return frame
+
+
+def _replay(turn_id: str, events: List[Tuple[int, Dict[str, Any]]], frames: _Frames) -> List[str]:
+    out: List[str] = []
+    for seq, event in events:
+        out.extend(frames.add(seq, event))
+    if frames.pending:
+        out.append(frames.flush())
+    return out
+
+
+async def follow(turn: TurnStream, after: int = 0) -> AsyncIterator[str]:
+    """SSE frames for ``turn`` from the event after ``after`` until the turn ends.
+
+    Token events are coalesced, heartbeats fill silent periods (tool calls, queueing). Closing
+    the iterator early (client disconnect) detaches from the turn; with no listener left it is
+    cancelled after the resume grace period, or at once when the session has a turn waiting.
+    """
+    frames = _Frames(turn.turn_id)
+    cursor = after
+    last_write = time.monotonic()
+    turn.attach()
+    try:
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        while True:
+            batch = turn.since(cursor)
+            if batch is None:
+                # Reading behind the in-memory window: take older events from the spill. Resumes
+                # are checked up front (resume_stream); this is a listener that fell behind
+                batch = await _older(turn, cursor)
+                if batch is None:
+                    _counters.incr("resume_gaps")
+                    yield sse_event({"type": "error", "message": "This response can no longer be resumed."})
+                    return
+            if batch:
+                for seq, event in batch:
+                    cursor = seq
+                    for frame in frames.add(seq, event):
+                        yield frame
+                        last_write = time.monotonic()
+                continue
+            if turn.done:
+                break
+            deadline = frames.flush_at if frames.flush_at is not None else last_write + STREAM_HEARTBEAT_SECONDS
+            now = time.monotonic()
+            if deadline > now:
+                await turn.wait(cursor, deadline - now)
+                continue
+            # Deadline reached: flush coalesced tokens or keep the connection alive
+            yield frames.flush() if frames.pending else HEARTBEAT
+            last_write = time.monotonic()
+        if frames.pending:
+            yield frames.flush()
+    finally:
+        turn.detach()
+
+
+async def follow_spilled(turn_id: str, events: List[Tuple[int, Dict[str, Any]]]) -> AsyncIterator[str]:
+    """SSE frames for a turn known only from the spill (finished here earlier, or on another worker)."""
+    yield f"retry: {STREAM_RETRY_MS}\n\n"
+    for frame in _replay(turn_id, events, _Frames(turn_id)):
+        yield frame
+    if not events or events[-1][1].get("type") not in TERMINAL_EVENTS:
+        yield sse_event({"type": "error", "message": "This response is still being generated elsewhere or was interrupted."})
+
+
+async def sse_stream(session_id: str, events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """Start ``events`` as a new resumable turn and follow it from the beginning."""
+    turn = start_turn_stream(session_id, events)
+    async for frame in follow(turn):
+        yield frame
+
+
+async def resume_stream(session_id: str, last_event_id: str) -> Optional[AsyncIterator[str]]:
+    """Frames continuing after ``last_event_id``; None when that turn has nothing left to send.
+
+    Raises HTTPException 404 when the turn is unknown, expired or no longer holds the events
+    after ``last_event_id`` (clients should not reconnect).
+    """
+    parsed = parse_event_id(last_event_id)
+    if parsed is None:
+        raise _resume_not_found()
+    turn_id, seq = parsed
+    turn = find_turn(turn_id, session_id)
+    if turn is not None:
+        if turn.done and seq >= turn.last_seq:
+            return None
+        if turn.since(seq) is None and await _older(turn, seq) is None:
+            # Answer before streaming: an error frame followed by EOF would only make the
+            # client reconnect with the same Last-Event-ID, forever
+            _counters.incr("resume_gaps")
+            raise _resume_not_found()
+        _counters.incr("resumed")
+        return follow(turn, seq)
+    spilled = await load_spilled(turn_id, session_id, seq)
+    if spilled:
+        _counters.incr("resumed_from_spill")
+        return follow_spilled(turn_id, spilled)
+    if STREAM_REPLAY_SPILL and await get_db().stream_events.find_one({"turn_id": turn_id, "session_id": session_id}):
+        return None
+    _counters.incr("resume_misses")
+    raise _resume_not_found()
+
+
+def _resume_not_found() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Stream not found or expired; send the message again",
+    )
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional
+
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+import metrics
+from student_search import StudentQuery
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only needed for format=parquet
+    pa = None
+    pq = None
+
+logger = logging.getLogger("campus_admin.student_export")
+
+# Documents fetched per cursor batch (and per Parquet row group); memory use is bounded by it
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_MAX_BATCH_SIZE = 10000
+
+ExportFormat = Literal["csv", "ndjson", "parquet"]
+
+# Exported column -> stored field, in default column order
+EXPORT_FIELDS: Dict[str, str] = {
+    "id": "_id",
+    "student_id": "student_id",
+    "name": "name",
+    "email": "email",
+    "department": "department",
+    "year": "year",
+    "status": "status",
+    "joined_at": "joined_at",
+    "last_active_at": "last_active_at",
+}
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+_counters = metrics.Counters()
+metrics.register("student_export", _counters.snapshot)
+
+
+def export_columns(fields: Optional[str]) -> List[str]:
+    """Columns requested as a comma-separated list (all of EXPORT_FIELDS when empty)."""
+    if not fields:
+        return list(EXPORT_FIELDS)
+    columns = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [c for c in columns if c not in EXPORT_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown field(s): {', '.join(unknown)}; choose from {', '.join(EXPORT_FIELDS)}",
+        )
+    return columns
+
+
+def check_format(fmt: ExportFormat) -> None:
+    if fmt == "parquet" and pa is None:
+        raise HTTPException(status_code=400, detail="Parquet export needs pyarrow installed on the server")
+
+
+def _value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)  # ObjectId
+
+
+async def _batches(
+    db: AsyncIOMotorDatabase, query: StudentQuery, columns: List[str], batch_size: int
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Rows straight from the cursor, one batch at a time, keyed by export column."""
+    projection: Dict[str, Any] = {EXPORT_FIELDS[c]: 1 for c in columns}
+    if "id" not in columns:
+        projection["_id"] = 0
+    if query.projection:
+        projection.update(query.projection)
+    cursor = db.students.find(query.filter, projection, batch_size=batch_size).sort(query.sort)
+    try:
+        while True:
+            docs = await cursor.to_list(length=batch_size)
+            if not docs:
+                return
+            yield [{c: doc.get(EXPORT_FIELDS[c]) for c in columns} for doc in docs]
+    finally:
+        await cursor.close()
+
+
+async def _csv(batches: AsyncIterator[List[Dict[str, Any]]], columns: List[str]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode()
+    async for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            writer.writerow(["" if row[c] is None else _value(row[c]) for c in columns])
+        yield buffer.getvalue().encode()
+
+
+async def _ndjson(batches: AsyncIterator[List[Dict[str, Any]]], columns: List[str]) -> AsyncIterator[bytes]:
+    async for rows in batches:
+        yield "".join(
+            json.dumps({c: _value(row[c]) for c in columns}, ensure_ascii=False) + "\n" for row in rows
+        ).encode()
+
+
+class _Sink:
+    """Write-only file object that hands the Parquet writer's output back in chunks."""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def _parquet_schema(columns: List[str]):
+    types = {
+        "year": pa.int32(),
+        "joined_at": pa.timestamp("us", tz="UTC"),
+        "last_active_at": pa.timestamp("us", tz="UTC"),
+    }
+    return pa.schema([(c, types.get(c, pa.string())) for c in columns])
+
+
+async def _parquet(batches: AsyncIterator[List[Dict[str, Any]]], columns: List[str]) -> AsyncIterator[bytes]:
+    schema = _parquet_schema(columns)
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    try:
+        async for rows in batches:
+            data = {
+                c: [str(r[c]) if c == "id" else r[c] for r in rows]
+                for c in columns
+            }
+            table = pa.Table.from_pydict(data, schema=schema)
+            # Encoding and compression are CPU-bound; keep them off the event loop
+            await asyncio.to_thread(writer.write_table, table)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+async def export_students(
+    db: AsyncIOMotorDatabase,
+    query: StudentQuery,
+    columns: List[str],
+    fmt: ExportFormat,
+    batch_size: int,
+) -> AsyncIterator[bytes]:
+    """The export body, produced one cursor batch at a time."""
+    rows = 0
+
+    async def counted() -> AsyncIterator[List[Dict[str, Any]]]:
+        nonlocal rows
+        async for batch in _batches(db, query, columns, batch_size):
+            rows += len(batch)
+            yield batch
+
+    encode = {"csv": _csv, "ndjson": _ndjson, "parquet": _parquet}[fmt]
+    _counters.incr("exports")
+    try:
+        async for chunk in encode(counted(), columns):
+            yield chunk
+    finally:
+        _counters.incr("rows", rows)
+        logger.info("Student export (%s): %d row(s)", fmt, rows)
@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import asyncio
+import codecs
+import csv
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import ValidationError
+
+import metrics
+from models.student import StudentCreate
+from student_repository import StudentRepository, duplicate_field
+from tool_registry import format_validation_error
+
+logger = logging.getLogger("campus_admin.student_import")
+
+# Rows validated and written per insert_many; the next batch is parsed while one is being written
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+# Per-row errors listed in the response; later ones are only counted
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+# A line (or quoted CSV record) longer than this aborts the import, so a file without
+# newlines cannot be buffered whole
+IMPORT_MAX_LINE_CHARS = int(os.getenv("IMPORT_MAX_LINE_CHARS", "65536"))
+
+ImportFormat = Literal["csv", "ndjson"]
+
+_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/x-jsonlines": "ndjson",
+}
+
+_counters = metrics.Counters()
+metrics.register("student_import", _counters.snapshot)
+
+
+class ImportAborted(Exception):
+    """The body cannot be parsed past this point. Raised mid-stream, when earlier batches may
+    already be written, so it ends the import with a partial report rather than an HTTP error."""
+
+
+def detect_format(explicit: Optional[str], content_type: Optional[str]) -> ImportFormat:
+    if explicit:
+        return explicit  # type: ignore[return-value]
+    media_type = (content_type or "").split(";", 1)[0].strip().lower()
+    if media_type in _CONTENT_TYPES:
+        return _CONTENT_TYPES[media_type]  # type: ignore[return-value]
+    raise HTTPException(
+        status_code=415,
+        detail="Send text/csv or application/x-ndjson, or pass format=csv|ndjson",
+    )
+
+
+# -----------------------------
+# Parsing
+# -----------------------------
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a byte stream as UTF-8 (BOM tolerated) and yield it line by line."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+        if len(pending) > IMPORT_MAX_LINE_CHARS:
+            raise ImportAborted(f"Line longer than {IMPORT_MAX_LINE_CHARS} characters")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def _csv_records(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, Any]]:
+    """(row number, dict or error message) per CSV record; the first record is the header.
+    A quoted field may span lines, so physical lines are joined until the quotes balance."""
+    header: Optional[List[str]] = None
+    record = ""
+    row = 0
+    async for line in lines:
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            if len(record) > IMPORT_MAX_LINE_CHARS:
+                raise ImportAborted("Unterminated quoted CSV field")
+            continue
+        text, record = record, ""
+        if not text.strip():
+            continue
+        try:
+            values = next(csv.reader([text]))
+        except csv.Error as e:
+            row += 1
+            yield row, f"Malformed CSV: {e}"
+            continue
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            missing = [f for f in ("student_id", "name", "email", "department", "year") if f not in header]
+            # The header comes before any write, so this one can still reject the request
+            if missing:
+                raise HTTPException(status_code=400, detail=f"CSV header is missing: {', '.join(missing)}")
+            continue
+        row += 1
+        if len(values) != len(header):
+            yield row, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        # Empty cells are treated as absent so model defaults (status, joined_at) apply
+        yield row, {name: value.strip() for name, value in zip(header, values) if value.strip()}
+    if record:
+        yield row + 1, "Unterminated quoted CSV field"
+
+
+async def _ndjson_records(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, Any]]:
+    row = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            value = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row, f"Invalid JSON: {e}"
+            continue
+        yield row, value if isinstance(value, dict) else "Expected a JSON object"
+
+
+# -----------------------------
+# Import
+# -----------------------------
+
+@dataclass
+class ImportReport:
+    format: str
+    dry_run: bool
+    rows: int = 0
+    # Written, or in a dry run: would be written
+    inserted: int = 0
+    invalid: int = 0
+    duplicates: int = 0
+    batches: int = 0
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    errors_truncated: bool = False
+    # The rest of the body could not be parsed; rows before it were imported as usual
+    aborted: bool = False
+
+    def error(self, row: int, message: str, **extra: Any) -> None:
+        if len(self.errors) < IMPORT_MAX_ERRORS or extra.get("fatal"):
+            self.errors.append({"row": row, "error": message, **extra})
+        else:
+            self.errors_truncated = True
+
+
+class StudentImport:
+    """Validate and insert a stream of student records in batches.
+
+    Rows that fail validation or collide with an existing (or earlier) student_id/email are
+    reported by row number; the rest are inserted. In a dry run nothing is written and
+    duplicates are found with one lookup per batch instead.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, fmt: ImportFormat, dry_run: bool) -> None:
+        self._repo = StudentRepository(db)
+        self.report = ImportReport(format=fmt, dry_run=dry_run)
+        # Dry runs only: keys seen earlier in the file, which a real import would reject
+        self._seen: Dict[str, Set[str]] = {"student_id": set(), "email": set()}
+
+    async def run(self, body: AsyncIterator[bytes]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        lines = _lines(body)
+        records = _csv_records(lines) if self.report.format == "csv" else _ndjson_records(lines)
+        batch: List[Tuple[int, Dict[str, Any]]] = []
+        writing: Optional[asyncio.Task] = None
+        try:
+            try:
+                async for row, record in records:
+                    self.report.rows += 1
+                    doc = self._validate(row, record)
+                    if doc is None:
+                        continue
+                    batch.append((row, doc))
+                    if len(batch) >= IMPORT_BATCH_SIZE:
+                        if writing is not None:
+                            await writing
+                        writing = asyncio.create_task(self._write(batch))
+                        batch = []
+            except ImportAborted as e:
+                # Earlier batches may be written already: report them, and write the rows parsed so far
+                self.report.aborted = True
+                self.report.error(self.report.rows + 1, str(e), fatal=True)
+            if writing is not None:
+                await writing
+                writing = None
+            if batch:
+                await self._write(batch)
+        finally:
+            if writing is not None:
+                writing.cancel()
+            self._record_metrics()
+
+        elapsed = time.perf_counter() - started
+        # Write errors arrive a batch later than validation errors
+        self.report.errors.sort(key=lambda e: e["row"])
+        return {
+            **self.report.__dict__,
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "rows_per_second": round(self.report.rows / elapsed, 1) if elapsed > 0 else None,
+        }
+
+    def _validate(self, row: int, record: Any) -> Optional[Dict[str, Any]]:
+        if isinstance(record, str):
+            self.report.invalid += 1
+            self.report.error(row, record)
+            return None
+        try:
+            student = StudentCreate.model_validate(record)
+        except ValidationError as e:
+            self.report.invalid += 1
+            self.report.error(row, format_validation_error(e), student_id=record.get("student_id"))
+            return None
+        return student.model_dump()
+
+    async def _write(self, batch: List[Tuple[int, Dict[str, Any]]]) -> None:
+        self.report.batches += 1
+        if self.report.dry_run:
+            await self._check_duplicates(batch)
+            return
+        inserted, write_errors = await self._repo.insert_many([doc for _, doc in batch])
+        self.report.inserted += inserted
+        for write_error in write_errors:
+            row, doc = batch[write_error["index"]]
+            if write_error.get("code") == 11000:
+                field_name = duplicate_field(write_error)
+                self.report.duplicates += 1
+                self.report.error(row, f"{field_name} already exists", student_id=doc["student_id"], field=field_name)
+            else:
+                self.report.invalid += 1
+                self.report.error(row, write_error.get("errmsg", "write failed"), student_id=doc["student_id"])
+
+    async def _check_duplicates(self, batch: List[Tuple[int, Dict[str, Any]]]) -> None:
+        existing = await self._repo.existing_keys(
+            [doc["student_id"] for _, doc in batch], [doc["email"] for _, doc in batch]
+        )
+        for row, doc in batch:
+            clash = next(
+                (f for f in ("student_id", "email") if doc[f] in existing[f] or doc[f] in self._seen[f]),
+                None,
+            )
+            if clash:
+                self.report.duplicates += 1
+                self.report.error(row, f"{clash} already exists", student_id=doc["student_id"], field=clash)
+                continue
+            self._seen["student_id"].add(doc["student_id"])
+            self._seen["email"].add(doc["email"])
+            self.report.inserted += 1
+
+    def _record_metrics(self) -> None:
+        _counters.incr("imports")
+        _counters.incr("rows", self.report.rows)
+        _counters.incr("inserted" if not self.report.dry_run else "dry_run_valid", self.report.inserted)
+        _counters.incr("invalid", self.report.invalid)
+        _counters.incr("duplicates", self.report.duplicates)
+        if self.report.aborted:
+            _counters.incr("aborted")
+        logger.info(
+            "Student import (%s%s%s): %d row(s), %d inserted, %d duplicate(s), %d invalid",
+            self.report.format,
+            ", dry run" if self.report.dry_run else "",
+            ", aborted" if self.report.aborted else "",
+            self.report.rows,
+            self.report.inserted,
+            self.report.duplicates,
+            self.report.invalid,
+        )
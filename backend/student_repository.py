@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import logging
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Set, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+import metrics
+from models.student import StudentCreate, StudentUpdate
+from student_search import SEARCH_FIELDS, StudentQuery, with_search_keys
+from tool_cache import students_changed
+
+logger = logging.getLogger("campus_admin.student_repository")
+
+# Search keys are only for matching; never read them back
+STUDENT_PROJECTION: Dict[str, Any] = {key: 0 for key in SEARCH_FIELDS}
+
+latency = metrics.LatencyStats()
+metrics.register("student_repository", latency.snapshot)
+
+
+def _stored(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """``doc`` as MongoDB will store it: BSON datetimes keep milliseconds, not microseconds,
+    so a locally built insert result matches what a later read returns."""
+    return {
+        k: v.replace(microsecond=v.microsecond // 1000 * 1000) if isinstance(v, datetime) else v
+        for k, v in doc.items()
+    }
+
+
+class StudentError(Exception):
+    """A student operation that failed for a reason the caller should report."""
+
+    status_code = 400
+
+    def __init__(self, detail: str) -> None:
+        super().__init__(detail)
+        self.detail = detail
+
+
+class StudentNotFound(StudentError):
+    status_code = 404
+
+    def __init__(self, detail: str = "Student not found") -> None:
+        super().__init__(detail)
+
+
+class DuplicateStudent(StudentError):
+    status_code = 409
+
+    def __init__(self, field: str) -> None:
+        super().__init__(f"{field} already exists" if field != "key" else "Duplicate key")
+        self.field = field
+
+
+def duplicate_field(error: Any) -> str:
+    """Which unique field a duplicate-key error (DuplicateKeyError or a bulk writeError) hit."""
+    details = error if isinstance(error, dict) else (getattr(error, "details", None) or {})
+    key = details.get("keyValue") or {}
+    if key:
+        return next(iter(key))
+    message = str(details.get("errmsg") or error).lower()
+    for field in ("student_id", "email"):
+        if field in message:
+            return field
+    return "key"
+
+
+class StudentRepository:
+    """Every read and write of ``students`` used by the REST routes, the agent tools and bulk import.
+
+    Each single-student mutation is one round trip: inserts return the document built locally,
+    updates use ``find_one_and_update`` returning the new version. Duplicate keys raise
+    DuplicateStudent, missing students StudentNotFound. Successful writes invalidate the
+    caches derived from students, and every operation is timed under "student_repository"
+    in GET /metrics.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase) -> None:
+        self._students = db.students
+
+    @asynccontextmanager
+    async def _op(self, name: str) -> AsyncIterator[None]:
+        started = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        except StudentError:
+            # Not found / duplicate are answers, not failures
+            ok = True
+            raise
+        finally:
+            latency.observe(name, time.perf_counter() - started, ok)
+
+    # -----------------------------
+    # Reads
+    # -----------------------------
+
+    async def get(self, student_id: str) -> Dict[str, Any]:
+        async with self._op("get"):
+            doc = await self._students.find_one({"student_id": student_id}, STUDENT_PROJECTION)
+            if doc is None:
+                raise StudentNotFound()
+            return doc
+
+    async def get_by_key(self, key: str) -> Dict[str, Any]:
+        """By student_id, or by document id when ``key`` is a valid ObjectId."""
+        flt: Dict[str, Any] = {"student_id": key}
+        if ObjectId.is_valid(key):
+            flt = {"$or": [flt, {"_id": ObjectId(key)}]}
+        async with self._op("get"):
+            doc = await self._students.find_one(flt, STUDENT_PROJECTION)
+            if doc is None:
+                raise StudentNotFound()
+            return doc
+
+    async def get_many(self, student_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Documents for ``student_ids`` in one ``$in`` query, keyed by student_id."""
+        async with self._op("get_many"):
+            docs: Dict[str, Dict[str, Any]] = {}
+            async for doc in self._students.find({"student_id": {"$in": student_ids}}, STUDENT_PROJECTION):
+                docs[doc["student_id"]] = doc
+            return docs
+
+    async def existing_keys(self, student_ids: List[str], emails: List[str]) -> Dict[str, Set[str]]:
+        """Which of ``student_ids`` / ``emails`` are already taken, in one ``$or`` of ``$in`` queries."""
+        existing: Dict[str, Set[str]] = {"student_id": set(), "email": set()}
+        async with self._op("existing_keys"):
+            cursor = self._students.find(
+                {"$or": [{"student_id": {"$in": student_ids}}, {"email": {"$in": emails}}]},
+                {"_id": 0, "student_id": 1, "email": 1},
+            )
+            async for doc in cursor:
+                existing["student_id"].add(doc["student_id"])
+                existing["email"].add(doc["email"])
+        return existing
+
+    async def find(self, query: StudentQuery, limit: int, skip: int = 0) -> List[Dict[str, Any]]:
+        async with self._op("find"):
+            projection = {**STUDENT_PROJECTION, **(query.projection or {})}
+            cursor = self._students.find(query.filter, projection).sort(query.sort).skip(skip).limit(limit)
+            return await cursor.to_list(length=limit)
+
+    async def count(self, flt: Dict[str, Any], limit: int) -> int:
+        """Matches of ``flt`` up to ``limit``; the collection's estimated size when unfiltered."""
+        async with self._op("count"):
+            if not flt:
+                return await self._students.estimated_document_count()
+            return await self._students.count_documents(flt, limit=limit)
+
+    # -----------------------------
+    # Writes
+    # -----------------------------
+
+    async def create(self, payload: StudentCreate) -> Dict[str, Any]:
+        doc = with_search_keys(_stored(payload.model_dump()))
+        async with self._op("create"):
+            try:
+                result = await self._students.insert_one(doc)
+            except DuplicateKeyError as e:
+                raise DuplicateStudent(duplicate_field(e))
+        students_changed()
+        created = {k: v for k, v in doc.items() if k not in STUDENT_PROJECTION}
+        created["_id"] = result.inserted_id
+        return created
+
+    async def insert_many(self, docs: List[Dict[str, Any]]) -> Tuple[int, List[Dict[str, Any]]]:
+        """Unordered bulk insert of validated documents (search keys added here).
+        Returns the number inserted and the per-document write errors (``index`` into ``docs``)."""
+        async with self._op("insert_many"):
+            try:
+                result = await self._students.insert_many([with_search_keys(d) for d in docs], ordered=False)
+                inserted, errors = len(result.inserted_ids), []
+            except BulkWriteError as e:
+                inserted, errors = e.details.get("nInserted", 0), e.details.get("writeErrors", [])
+        if inserted:
+            students_changed()
+        return inserted, errors
+
+    async def update(self, flt: Dict[str, Any], updates: StudentUpdate) -> Dict[str, Any]:
+        """Apply a partial update to one student and return the updated document."""
+        fields = updates.model_dump(exclude_unset=True)
+        if not fields:
+            raise StudentError("No fields to update")
+        async with self._op("update"):
+            try:
+                doc = await self._students.find_one_and_update(
+                    flt,
+                    {"$set": with_search_keys(fields)},
+                    projection=STUDENT_PROJECTION,
+                    return_document=ReturnDocument.AFTER,
+                )
+            except DuplicateKeyError as e:
+                raise DuplicateStudent(duplicate_field(e))
+            if doc is None:
+                raise StudentNotFound()
+        students_changed()
+        return doc
+
+    async def update_many(self, student_ids: List[str], updates: StudentUpdate) -> Tuple[int, int]:
+        """Apply the same partial update to several students; returns (matched, modified)."""
+        fields = updates.model_dump(exclude_unset=True)
+        if not fields:
+            raise StudentError("No fields to update")
+        async with self._op("update_many"):
+            try:
+                res = await self._students.update_many(
+                    {"student_id": {"$in": student_ids}}, {"$set": with_search_keys(fields)}
+                )
+            except DuplicateKeyError as e:
+                raise DuplicateStudent(duplicate_field(e))
+        if res.matched_count:
+            students_changed()
+        return res.matched_count, res.modified_count
+
+    async def delete(self, flt: Dict[str, Any]) -> None:
+        async with self._op("delete"):
+            res = await self._students.delete_one(flt)
+            if res.deleted_count == 0:
+                raise StudentNotFound()
+        students_changed()
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+import os
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import DESCENDING
+
+# Edge n-grams (prefixes) of each name word, the email and the student_id are stored on the
+# student in search_name / search_email / search_id, so type-ahead is an indexed equality match
+SEARCH_NGRAM_MIN = int(os.getenv("SEARCH_NGRAM_MIN", "1"))
+SEARCH_NGRAM_MAX = int(os.getenv("SEARCH_NGRAM_MAX", "24"))
+
+SearchMode = Literal["auto", "prefix", "text", "regex"]
+
+# Student fields each search key is derived from
+SEARCH_KEY_SOURCES = {"search_name": "name", "search_email": "email", "search_id": "student_id"}
+# The whole normalized name, for confirming prefixes longer than SEARCH_NGRAM_MAX accent-insensitively
+SEARCH_NAME_FULL = "search_name_full"
+# Every derived field stored on a student for search
+SEARCH_FIELDS = (*SEARCH_KEY_SOURCES, SEARCH_NAME_FULL)
+
+_WORD = re.compile(r"[^\W_]+")
+_EDGE_PUNCT = re.compile(r"^[\W_]+|[\W_]+$")
+
+
+def normalize(text: str) -> str:
+    """Lower-case and strip accents, so "José" and "jose" share keys."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower().strip()
+
+
+def _prefixes(term: str) -> List[str]:
+    return [term[:n] for n in range(SEARCH_NGRAM_MIN, min(len(term), SEARCH_NGRAM_MAX) + 1)]
+
+
+def _keys(source: str, value: str) -> List[str]:
+    value = normalize(value)
+    if source == "name":
+        terms = _WORD.findall(value)
+    elif source == "email":
+        # The whole address plus its local part's words: "ana.lopez@x.edu" matches "lop"
+        terms = [value] + _WORD.findall(value.split("@", 1)[0])
+    else:
+        terms = [value]
+    return sorted({p for term in terms for p in _prefixes(term)})
+
+
+def search_keys(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Search fields for whichever of name/email/student_id ``fields`` sets."""
+    keys: Dict[str, Any] = {
+        key: _keys(source, str(fields[source]))
+        for key, source in SEARCH_KEY_SOURCES.items()
+        if fields.get(source) is not None
+    }
+    if fields.get("name") is not None:
+        keys[SEARCH_NAME_FULL] = normalize(str(fields["name"]))
+    return keys
+
+
+def with_search_keys(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """``fields`` (a new student document or a ``$set``) plus the search keys it changes."""
+    return {**fields, **search_keys(fields)}
+
+
+@dataclass
+class StudentQuery:
+    """A students ``find``: filter, sort and (for text search) the relevance projection."""
+
+    filter: Dict[str, Any] = field(default_factory=dict)
+    # (joined_at, _id) is unique, so keyset cursors over it never skip or repeat a student
+    sort: List[Tuple[str, Any]] = field(default_factory=lambda: [("joined_at", DESCENDING), ("_id", DESCENDING)])
+    projection: Optional[Dict[str, Any]] = None
+    mode: Optional[str] = None
+
+    @property
+    def pageable(self) -> bool:
+        """Whether cursors apply: everything but relevance-ranked text search."""
+        return self.mode != "text"
+
+    def after(self, cursor: str) -> None:
+        """Restrict to students after ``cursor`` in (joined_at desc, _id desc) order.
+        Raises ValueError for a malformed cursor."""
+        joined_at, oid = decode_cursor(cursor)
+        # A new list, so copies of the filter taken earlier keep their own "$and"
+        self.filter["$and"] = [*self.filter.get("$and", []), {"$or": [
+            {"joined_at": {"$lt": joined_at}},
+            {"joined_at": joined_at, "_id": {"$lt": oid}},
+        ]}]
+
+
+# -----------------------------
+# Cursors
+# -----------------------------
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    """Opaque cursor pointing just past ``doc``."""
+    payload = {"j": doc["joined_at"].isoformat(), "i": str(doc["_id"])}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        return datetime.fromisoformat(payload["j"]), ObjectId(payload["i"])
+    except (binascii.Error, InvalidId, ValueError, TypeError, KeyError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def resolve_mode(q: str, mode: SearchMode) -> str:
+    """``auto`` uses prefix keys for a single term (type-ahead, ids, emails) and the ranked
+    text index for several words."""
+    if mode != "auto":
+        return mode
+    return "text" if len(q.split()) > 1 else "prefix"
+
+
+def student_query(
+    department: Optional[str] = None,
+    status: Optional[str] = None,
+    q: Optional[str] = None,
+    mode: SearchMode = "auto",
+) -> StudentQuery:
+    """Filter and sort for listing/searching students, shared by GET /students and the agent tools."""
+    query = StudentQuery()
+    if department:
+        query.filter["department"] = department
+    if status:
+        query.filter["status"] = status
+    q = (q or "").strip()
+    if not q:
+        return query
+
+    query.mode = resolve_mode(q, mode)
+    if query.mode == "prefix":
+        term = normalize(q)
+        # Name keys are single words, so surrounding punctuation ("(ana", "lopez,") cannot match
+        word = _EDGE_PUNCT.sub("", term) or term
+        query.filter["$or"] = [
+            {"search_name": word[:SEARCH_NGRAM_MAX]},
+            {"search_email": term[:SEARCH_NGRAM_MAX]},
+            {"search_id": term[:SEARCH_NGRAM_MAX]},
+        ]
+        if len(term) > SEARCH_NGRAM_MAX:
+            # Keys stop at SEARCH_NGRAM_MAX characters; the index narrows, the anchored regex confirms.
+            # Names are confirmed against the normalized copy so "francoise-eleonore..." finds
+            # "Françoise-Éléonore..."; students not yet backfilled with it still match as typed
+            escaped = re.escape(q.strip())
+            raw_word = _EDGE_PUNCT.sub("", q) or q
+            query.filter["$and"] = [{"$or": [
+                {SEARCH_NAME_FULL: {"$regex": r"(^|\W)" + re.escape(word)}},
+                {"name": {"$regex": r"(^|\W)" + re.escape(raw_word), "$options": "i"}},
+                {"email": {"$regex": "^" + escaped, "$options": "i"}},
+                {"student_id": {"$regex": "^" + escaped, "$options": "i"}},
+            ]}]
+    elif query.mode == "text":
+        query.filter["$text"] = {"$search": q}
+        query.projection = {"score": {"$meta": "textScore"}}
+        query.sort = [("score", {"$meta": "textScore"}), ("joined_at", DESCENDING)]
+    else:
+        # Substring match for the odd query the keys cannot answer; escaped and unindexed
+        pattern = {"$regex": re.escape(q), "$options": "i"}
+        query.filter["$or"] = [{source: pattern} for source in SEARCH_KEY_SOURCES.values()]
+    return query
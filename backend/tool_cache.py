@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger("campus_admin.tool_cache")
+
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "512"))
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "1").lower() in ("1", "true", "yes", "on")
+
+
+class ToolResultCache:
+    """TTL + LRU cache for read-only tool results, keyed by tool name and normalized arguments.
+
+    Entries are stamped with a generation number. ``invalidate()`` bumps the generation, so a
+    result computed before a write cannot be stored after it.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._generation = 0
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+        self._evictions = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def make_key(name: str, arguments: Dict[str, Any]) -> Tuple[str, str]:
+        normalized = {k: v for k, v in arguments.items() if v is not None}
+        return name, json.dumps(normalized, sort_keys=True, separators=(",", ":"), default=str)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, name: str, arguments: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        key = self.make_key(name, arguments)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self._hits[name] = self._hits.get(name, 0) + 1
+            return entry[1]
+        if entry is not None:
+            del self._entries[key]
+        self._misses[name] = self._misses.get(name, 0) + 1
+        return None
+
+    def put(self, name: str, arguments: Dict[str, Any], value: Dict[str, Any], ttl: float, generation: int) -> None:
+        if generation != self._generation:
+            return  # a write happened while this result was being computed
+        key = self.make_key(name, arguments)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._invalidations += 1
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        hits = sum(self._hits.values())
+        misses = sum(self._misses.values())
+        return {
+            "enabled": TOOL_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "max_entries": self._max_entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "evictions": self._evictions,
+            "invalidations": self._invalidations,
+            "by_tool": {
+                name: {"hits": self._hits.get(name, 0), "misses": self._misses.get(name, 0)}
+                for name in sorted(set(self._hits) | set(self._misses))
+            },
+        }
+
+
+tool_cache = ToolResultCache(TOOL_CACHE_MAX_ENTRIES)
+metrics.register("tool_cache", tool_cache.stats)
+
+
+_students_listeners: List[Callable[[], None]] = []
+
+
+def on_students_changed(listener: Callable[[], None]) -> None:
+    """Register another cache to be invalidated by student writes."""
+    _students_listeners.append(listener)
+
+
+def students_changed() -> None:
+    """Drop cached data derived from ``students``; call after every successful student write."""
+    tool_cache.invalidate()
+    for listener in _students_listeners:
+        try:
+            listener()
+        except Exception as e:
+            logger.exception("students_changed listener failed: %s", e)
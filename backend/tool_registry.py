@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import inspect
+import os
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Type, get_type_hints
+
+from pydantic import BaseModel, ValidationError, create_model
+
+ToolFn = Callable[..., Awaitable[Dict[str, Any]]]
+
+DEFAULT_TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "10"))
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    """A registered agent tool: its implementation, argument model and scheduling metadata."""
+
+    name: str
+    description: str
+    fn: ToolFn
+    args_model: Type[BaseModel]
+    parameters: Dict[str, Any]
+    needs_db: bool
+    # Name of the single parameter that receives the whole validated model, if the tool takes one
+    model_param: Optional[str]
+    read_only: bool
+    cacheable: bool
+    ttl: float
+    timeout: float
+
+    def schema(self) -> Dict[str, Any]:
+        """OpenAI function-calling schema for this tool."""
+        return {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": self.parameters,
+            },
+        }
+
+    def validate(self, arguments: Dict[str, Any]) -> BaseModel:
+        """Validate raw model-supplied arguments; raises pydantic.ValidationError."""
+        return self.args_model.model_validate(arguments)
+
+    def bind(self, validated: BaseModel) -> Dict[str, Any]:
+        """Keyword arguments for ``fn`` (excluding ``db``) from validated arguments."""
+        if self.model_param:
+            return {self.model_param: validated}
+        return {field: getattr(validated, field) for field in self.args_model.model_fields}
+
+
+TOOL_REGISTRY: Dict[str, ToolSpec] = {}
+
+
+def tool(
+    *,
+    read_only: bool = False,
+    cacheable: bool = False,
+    ttl: float = 0,
+    timeout: float = DEFAULT_TOOL_TIMEOUT_SECONDS,
+    name: Optional[str] = None,
+) -> Callable[[ToolFn], ToolFn]:
+    """Register a coroutine as an agent tool.
+
+    The docstring becomes the tool description and the signature becomes its argument model:
+    every parameter except ``db`` is a field, with its annotation and default. A tool whose only
+    parameter is a pydantic model takes that model's fields as its top-level arguments.
+    ``cacheable`` tools must also be ``read_only``; their results are kept for ``ttl`` seconds.
+    """
+    if cacheable and not read_only:
+        raise ValueError("cacheable tools must be read_only")
+
+    def decorator(fn: ToolFn) -> ToolFn:
+        tool_name = name or fn.__name__
+        if tool_name in TOOL_REGISTRY:
+            raise ValueError(f"Tool '{tool_name}' is already registered")
+
+        hints = get_type_hints(fn, include_extras=True)
+        params = [p for p in inspect.signature(fn).parameters.values() if p.name != "db"]
+        model_param: Optional[str] = None
+        if len(params) == 1 and _is_model(hints.get(params[0].name)):
+            model_param = params[0].name
+            args_model = hints[model_param]
+        else:
+            fields: Dict[str, Any] = {}
+            for p in params:
+                default = ... if p.default is inspect.Parameter.empty else p.default
+                fields[p.name] = (hints.get(p.name, Any), default)
+            args_model = create_model(f"{tool_name}_args", **fields)
+
+        TOOL_REGISTRY[tool_name] = ToolSpec(
+            name=tool_name,
+            description=inspect.cleandoc(fn.__doc__ or "").split("\n\n")[0].replace("\n", " "),
+            fn=fn,
+            args_model=args_model,
+            parameters=_parameters_schema(args_model),
+            needs_db="db" in inspect.signature(fn).parameters,
+            model_param=model_param,
+            read_only=read_only,
+            cacheable=cacheable,
+            ttl=ttl,
+            timeout=timeout,
+        )
+        return fn
+
+    return decorator
+
+
+def get_tool(name: str) -> Optional[ToolSpec]:
+    return TOOL_REGISTRY.get(name)
+
+
+def tool_schemas() -> List[Dict[str, Any]]:
+    """Function-calling schemas for every registered tool, in registration order."""
+    return [spec.schema() for spec in TOOL_REGISTRY.values()]
+
+
+def format_validation_error(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc']) or 'arguments'}: {err['msg']}" for err in e.errors()
+    )
+
+
+def _is_model(annotation: Any) -> bool:
+    return inspect.isclass(annotation) and issubclass(annotation, BaseModel)
+
+
+def _parameters_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """JSON schema for ``model`` in the compact shape function-calling expects:
+    ``$ref``s inlined, titles dropped and ``Optional[X]`` reported as plain ``X``.
+    """
+    schema = model.model_json_schema()
+    defs = schema.pop("$defs", {})
+
+    def clean(node: Any) -> Any:
+        if isinstance(node, list):
+            return [clean(item) for item in node]
+        if not isinstance(node, dict):
+            return node
+        if "$ref" in node:
+            return clean(defs[node["$ref"].rsplit("/", 1)[-1]])
+        out: Dict[str, Any] = {}
+        for key, value in node.items():
+            if key == "title":
+                continue
+            if key == "properties":
+                out[key] = {prop: clean(sub) for prop, sub in value.items()}
+            else:
+                out[key] = clean(value)
+        variants = out.get("anyOf")
+        if variants is not None:
+            non_null = [v for v in variants if v.get("type") != "null"]
+            if len(non_null) == 1:
+                del out["anyOf"]
+                out.update(non_null[0])
+        if out.get("default", 0) is None:
+            del out["default"]
+        return out
+
+    parameters = clean(schema)
+    parameters.setdefault("properties", {})
+    return parameters
@@ -2,100 +2,138 @@ from __future__ import annotations
 
 import logging
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List, Optional
+from typing import Annotated, Any, Dict, List, Literal, Optional
 
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from pymongo.errors import DuplicateKeyError
+from pydantic import Field
 
 from models.student import StudentCreate, StudentUpdate, student_entity
+from student_repository import StudentError, StudentRepository
+from student_search import student_query
+from tool_registry import tool, tool_schemas
 
 logger = logging.getLogger("campus_admin.tools")
 
+# Upper bound on ids per batch tool call (one $in query each)
+MAX_BATCH_IDS = 100
+StudentIds = Annotated[List[str], Field(min_length=1, max_length=MAX_BATCH_IDS)]
+
+
+def _unique(ids: List[str]) -> List[str]:
+    """Ids in first-seen order without duplicates."""
+    return list(dict.fromkeys(ids))
+
 
 # -----------------------------
 # Student Management Tools
 # -----------------------------
 
-async def add_student(db: AsyncIOMotorDatabase, payload: Dict[str, Any]) -> Dict[str, Any]:
-    data = StudentCreate(**payload).model_dump()
+@tool()
+async def add_student(db: AsyncIOMotorDatabase, payload: StudentCreate) -> Dict[str, Any]:
+    """Add a new student to the database."""
     try:
-        result = await db.students.insert_one(data)
-        doc = await db.students.find_one({"_id": result.inserted_id})
-        return {"ok": True, "student": student_entity(doc).model_dump()}
-    except DuplicateKeyError as e:
-        detail = "Duplicate key"
-        msg = str(e).lower()
-        if "student_id" in msg:
-            detail = "student_id already exists"
-        elif "email" in msg:
-            detail = "email already exists"
-        return {"ok": False, "error": detail}
+        doc = await StudentRepository(db).create(payload)
+    except StudentError as e:
+        return {"ok": False, "error": e.detail}
+    return {"ok": True, "student": student_entity(doc).model_dump()}
 
 
+@tool(read_only=True)
 async def get_student(db: AsyncIOMotorDatabase, student_id: str) -> Dict[str, Any]:
-    doc = await db.students.find_one({"student_id": student_id})
-    if not doc:
-        return {"ok": False, "error": "Student not found"}
+    """Fetch one student's details by student_id. For several students use get_students."""
+    try:
+        doc = await StudentRepository(db).get(student_id)
+    except StudentError as e:
+        return {"ok": False, "error": e.detail}
     return {"ok": True, "student": student_entity(doc).model_dump()}
 
 
-async def update_student_tool(db: AsyncIOMotorDatabase, student_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
-    upd = StudentUpdate(**updates).model_dump(exclude_unset=True)
-    if not upd:
-        return {"ok": False, "error": "No fields to update"}
+@tool()
+async def update_student_tool(db: AsyncIOMotorDatabase, student_id: str, updates: StudentUpdate) -> Dict[str, Any]:
+    """Update an existing student by student_id with partial fields.
+    To apply the same change to several students use update_students."""
     try:
-        res = await db.students.update_one({"student_id": student_id}, {"$set": upd})
-    except DuplicateKeyError as e:
-        detail = "Duplicate key"
-        msg = str(e).lower()
-        if "student_id" in msg:
-            detail = "student_id already exists"
-        elif "email" in msg:
-            detail = "email already exists"
-        return {"ok": False, "error": detail}
-
-    if res.matched_count == 0:
-        return {"ok": False, "error": "Student not found"}
-    doc = await db.students.find_one({"student_id": student_id})
+        doc = await StudentRepository(db).update({"student_id": student_id}, updates)
+    except StudentError as e:
+        return {"ok": False, "error": e.detail}
     return {"ok": True, "student": student_entity(doc).model_dump()}
 
 
+@tool(read_only=True)
+async def get_students(db: AsyncIOMotorDatabase, student_ids: StudentIds) -> Dict[str, Any]:
+    """Fetch several students by student_id in one call. Prefer this over repeated get_student
+    calls whenever a request mentions more than one student."""
+    ids = _unique(student_ids)
+    docs = await StudentRepository(db).get_many(ids)
+    return {
+        "ok": True,
+        "students": [student_entity(docs[i]).model_dump() for i in ids if i in docs],
+        "not_found": [i for i in ids if i not in docs],
+    }
+
+
+@tool()
+async def update_students(db: AsyncIOMotorDatabase, student_ids: StudentIds, updates: StudentUpdate) -> Dict[str, Any]:
+    """Apply the same partial update to several students in one call (e.g. mark them all inactive
+    or move them to a department). Prefer this over repeated update_student_tool calls."""
+    ids = _unique(student_ids)
+    if "email" in updates.model_fields_set and len(ids) > 1:
+        return {"ok": False, "error": "email is unique per student; update it with update_student_tool"}
+    repo = StudentRepository(db)
+    try:
+        matched, modified = await repo.update_many(ids, updates)
+    except StudentError as e:
+        return {"ok": False, "error": e.detail}
+    # update_many cannot return documents; one $in read reports them all
+    docs = await repo.get_many(ids) if matched else {}
+    return {
+        "ok": matched > 0,
+        "updated": modified,
+        "students": [student_entity(docs[i]).model_dump() for i in ids if i in docs],
+        "not_found": [i for i in ids if i not in docs],
+        **({} if matched else {"error": "No matching students"}),
+    }
+
+
+@tool()
 async def delete_student_tool(db: AsyncIOMotorDatabase, student_id: str) -> Dict[str, Any]:
-    res = await db.students.delete_one({"student_id": student_id})
-    if res.deleted_count == 0:
-        return {"ok": False, "error": "Student not found"}
+    """Delete a student by student_id."""
+    try:
+        await StudentRepository(db).delete({"student_id": student_id})
+    except StudentError as e:
+        return {"ok": False, "error": e.detail}
     return {"ok": True}
 
 
+@tool(read_only=True)
 async def list_students_tool(
     db: AsyncIOMotorDatabase,
     department: Optional[str] = None,
-    status: Optional[str] = None,
-    limit: int = 20,
+    status: Optional[Literal["active", "inactive"]] = None,
+    q: Annotated[Optional[str], Field(max_length=200)] = None,
+    limit: Annotated[int, Field(ge=1, le=100)] = 20,
 ) -> Dict[str, Any]:
-    flt: Dict[str, Any] = {}
-    if department:
-        flt["department"] = department
-    if status:
-        flt["status"] = status
-
-    cursor = db.students.find(flt).sort([("joined_at", -1)]).limit(max(1, min(100, limit)))
-    items: List[Dict[str, Any]] = []
-    async for doc in cursor:
-        items.append(student_entity(doc).model_dump())
-    return {"ok": True, "students": items}
+    """List students with optional filters. q searches names, emails and student_ids: one word
+    matches by prefix (e.g. "jo", "cs-10"), several words rank by name relevance."""
+    query = student_query(department, status, q)
+    docs = await StudentRepository(db).find(query, max(1, min(100, limit)))
+    return {"ok": True, "students": [student_entity(doc).model_dump() for doc in docs]}
 
 
 # -----------------------------
 # Analytics Tools
 # -----------------------------
 
+@tool(read_only=True, cacheable=True, ttl=30)
 async def get_total_students(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    """Get total number of students."""
     count = await db.students.estimated_document_count()
     return {"ok": True, "total_students": count}
 
 
+@tool(read_only=True, cacheable=True, ttl=60)
 async def get_students_by_department(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    """Get counts of students grouped by department."""
     pipeline = [
         {"$group": {"_id": "$department", "count": {"$sum": 1}}},
         {"$sort": {"count": -1}}
@@ -106,7 +144,12 @@ async def get_students_by_department(db: AsyncIOMotorDatabase) -> Dict[str, Any]
     return {"ok": True, "by_department": out}
 
 
-async def get_recent_onboarded_students(db: AsyncIOMotorDatabase, limit: int = 5) -> Dict[str, Any]:
+@tool(read_only=True, cacheable=True, ttl=30)
+async def get_recent_onboarded_students(
+    db: AsyncIOMotorDatabase,
+    limit: Annotated[int, Field(ge=1, le=20)] = 5,
+) -> Dict[str, Any]:
+    """Get most recently onboarded students."""
     cursor = db.students.find({}).sort([("joined_at", -1)]).limit(max(1, min(20, limit)))
     items: List[Dict[str, Any]] = []
     async for doc in cursor:
@@ -114,7 +157,9 @@ async def get_recent_onboarded_students(db: AsyncIOMotorDatabase, limit: int = 5
     return {"ok": True, "recent_onboarded": items}
 
 
+@tool(read_only=True, cacheable=True, ttl=60)
 async def get_active_students_last_7_days(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    """Get number of students active in the last 7 days."""
     since = datetime.now(timezone.utc) - timedelta(days=7)
     count = await db.students.count_documents({"last_active_at": {"$gte": since}})
     return {"ok": True, "active_last_7_days": count}
@@ -124,7 +169,9 @@ async def get_active_students_last_7_days(db: AsyncIOMotorDatabase) -> Dict[str,
 # FAQ (Optional) and Notifications
 # -----------------------------
 
+@tool(read_only=True, cacheable=True, ttl=3600)
 async def get_cafeteria_timings() -> Dict[str, Any]:
+    """Get cafeteria opening hours."""
     return {
         "ok": True,
         "cafeteria_timings": {
@@ -134,7 +181,9 @@ async def get_cafeteria_timings() -> Dict[str, Any]:
     }
 
 
+@tool(read_only=True, cacheable=True, ttl=3600)
 async def get_library_hours() -> Dict[str, Any]:
+    """Get library opening hours."""
     return {
         "ok": True,
         "library_hours": {
@@ -144,7 +193,9 @@ async def get_library_hours() -> Dict[str, Any]:
     }
 
 
+@tool(read_only=True, cacheable=True, ttl=3600)
 async def get_event_schedule() -> Dict[str, Any]:
+    """Get campus event schedule."""
     return {
         "ok": True,
         "events": [
@@ -154,168 +205,30 @@ async def get_event_schedule() -> Dict[str, Any]:
     }
 
 
+@tool()
 async def send_email(student_id: str, message: str) -> Dict[str, Any]:
+    """Send a notification email to one student (mock). For several students use send_emails."""
     # Mock email: log only
     logger.info("[MOCK EMAIL] to student_id=%s: %s", student_id, message)
     return {"ok": True, "sent": True}
 
 
-# JSON Schemas for OpenAI function-calling
-TOOL_SCHEMAS: List[Dict[str, Any]] = [
-    {
-        "type": "function",
-        "function": {
-            "name": "add_student",
-            "description": "Add a new student to the database.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "student_id": {"type": "string"},
-                    "name": {"type": "string"},
-                    "email": {"type": "string", "format": "email"},
-                    "department": {"type": "string"},
-                    "year": {"type": "integer", "minimum": 1, "maximum": 8},
-                    "status": {"type": "string", "enum": ["active", "inactive"]},
-                },
-                "required": ["student_id", "name", "email", "department", "year"],
-            },
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_student",
-            "description": "Fetch a student's details by student_id.",
-            "parameters": {
-                "type": "object",
-                "properties": {"student_id": {"type": "string"}},
-                "required": ["student_id"],
-            },
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "update_student_tool",
-            "description": "Update an existing student by student_id with partial fields.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "student_id": {"type": "string"},
-                    "updates": {
-                        "type": "object",
-                        "properties": {
-                            "name": {"type": "string"},
-                            "email": {"type": "string", "format": "email"},
-                            "department": {"type": "string"},
-                            "year": {"type": "integer", "minimum": 1, "maximum": 8},
-                            "status": {"type": "string", "enum": ["active", "inactive"]},
-                        },
-                    },
-                },
-                "required": ["student_id", "updates"],
-            },
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "delete_student_tool",
-            "description": "Delete a student by student_id.",
-            "parameters": {
-                "type": "object",
-                "properties": {"student_id": {"type": "string"}},
-                "required": ["student_id"],
-            },
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "list_students_tool",
-            "description": "List students with optional filters.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "department": {"type": "string"},
-                    "status": {"type": "string", "enum": ["active", "inactive"]},
-                    "limit": {"type": "integer", "minimum": 1, "maximum": 100, "default": 20},
-                },
-            },
-        },
-    },
-    {  # Analytics
-        "type": "function",
-        "function": {
-            "name": "get_total_students",
-            "description": "Get total number of students.",
-            "parameters": {"type": "object", "properties": {}},
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_students_by_department",
-            "description": "Get counts of students grouped by department.",
-            "parameters": {"type": "object", "properties": {}},
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_recent_onboarded_students",
-            "description": "Get most recently onboarded students.",
-            "parameters": {
-                "type": "object",
-                "properties": {"limit": {"type": "integer", "minimum": 1, "maximum": 20, "default": 5}},
-            },
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_active_students_last_7_days",
-            "description": "Get number of students active in the last 7 days.",
-            "parameters": {"type": "object", "properties": {}},
-        },
-    },
-    {  # FAQ & Notifications
-        "type": "function",
-        "function": {
-            "name": "get_cafeteria_timings",
-            "description": "Get cafeteria opening hours.",
-            "parameters": {"type": "object", "properties": {}},
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_library_hours",
-            "description": "Get library opening hours.",
-            "parameters": {"type": "object", "properties": {}},
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_event_schedule",
-            "description": "Get campus event schedule.",
-            "parameters": {"type": "object", "properties": {}},
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "send_email",
-            "description": "Send a notification email to a student (mock).",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "student_id": {"type": "string"},
-                    "message": {"type": "string"},
-                },
-                "required": ["student_id", "message"],
-            },
-        },
-    },
-]
+@tool()
+async def send_emails(db: AsyncIOMotorDatabase, student_ids: StudentIds, message: str) -> Dict[str, Any]:
+    """Send the same notification email to several students in one call (mock). Prefer this over
+    repeated send_email calls. Unknown student_ids are reported and skipped."""
+    ids = _unique(student_ids)
+    docs = await StudentRepository(db).get_many(ids)
+    recipients = [i for i in ids if i in docs]
+    # Mock email: log only
+    if recipients:
+        logger.info("[MOCK EMAIL] to %d student(s) %s: %s", len(recipients), ",".join(recipients), message)
+    return {
+        "ok": bool(recipients),
+        "sent": len(recipients),
+        "not_found": [i for i in ids if i not in docs],
+    }
+
+
+# JSON Schemas for OpenAI function-calling, generated from the registered signatures
+TOOL_SCHEMAS: List[Dict[str, Any]] = tool_schemas()
@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+import metrics
+
+logger = logging.getLogger("campus_admin.tracing")
+
+# Per-turn span timing; finished traces are kept in memory for GET /admin/traces
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "1").lower() in ("1", "true", "yes", "on")
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+# Append each finished trace to this file as one OTLP/JSON ExportTraceServiceRequest per line
+# (the OpenTelemetry collector file format); empty = no export
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "campus-admin-backend")
+
+_counters = metrics.Counters()
+metrics.register("tracing", _counters.snapshot)
+
+
+class Span:
+    """One timed phase. Attributes are plain JSON values (str, int, float, bool)."""
+
+    def __init__(self, trace: Optional["Trace"], name: str, parent_id: Optional[str], attributes: Dict[str, Any]) -> None:
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        # "ok", "error" or "cancelled"
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def fail(self, error: str) -> None:
+        self.status = "error"
+        self.error = error
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_dict(self, origin_ns: int) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "offset_ms": round((self.start_ns - origin_ns) / 1e6, 2),
+            "duration_ms": round(self.duration_ms, 2),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+        if self.error:
+            out["error"] = self.error
+        return out
+
+
+class _NoopSpan(Span):
+    """Returned when tracing is off or no trace is active, so call sites need no checks."""
+
+    def __init__(self) -> None:
+        super().__init__(None, "noop", None, {})
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def fail(self, error: str) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Trace:
+    def __init__(self, name: str, attributes: Dict[str, Any]) -> None:
+        self.trace_id = os.urandom(16).hex()
+        self.root = Span(self, name, None, attributes)
+        self.spans: List[Span] = []
+
+    def to_dict(self, with_spans: bool = True) -> Dict[str, Any]:
+        root = self.root
+        out: Dict[str, Any] = {
+            "trace_id": self.trace_id,
+            "name": root.name,
+            "started_at": root.start_ns / 1e9,
+            "duration_ms": round(root.duration_ms, 2),
+            "status": root.status,
+            "attributes": root.attributes,
+        }
+        if root.error:
+            out["error"] = root.error
+        if with_spans:
+            out["spans"] = [s.to_dict(root.start_ns) for s in self.spans]
+        else:
+            out["span_count"] = len(self.spans)
+        return out
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("campus_admin_span", default=None)
+_traces: Deque[Trace] = deque(maxlen=TRACE_BUFFER_SIZE)
+
+
+@contextmanager
+def _activate(span: Span) -> Iterator[Span]:
+    token = _current.set(span)
+    try:
+        yield span
+    except (asyncio.CancelledError, GeneratorExit):
+        span.status = "cancelled"
+        raise
+    except BaseException as e:
+        span.fail(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        span.end_ns = time.time_ns()
+        try:
+            _current.reset(token)
+        except ValueError:
+            # An async generator finalized from another context (e.g. closed by the GC)
+            pass
+
+
+@contextmanager
+def trace(name: str, **attributes: Any) -> Iterator[Span]:
+    """Start a new trace (even inside another one) and record it when the block ends."""
+    if not TRACE_ENABLED:
+        yield _NOOP
+        return
+    current = Trace(name, attributes)
+    try:
+        with _activate(current.root) as root:
+            yield root
+    finally:
+        _finish(current)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """Time a phase as a child of the current span; a no-op outside a trace."""
+    parent = _current.get()
+    if parent is None or parent.trace is None:
+        yield _NOOP
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    parent.trace.spans.append(child)
+    with _activate(child):
+        yield child
+
+
+def add_span(name: str, seconds: float, **attributes: Any) -> None:
+    """Record a phase that just ended and took ``seconds``, e.g. a queue wait measured elsewhere."""
+    parent = _current.get()
+    if parent is None or parent.trace is None:
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    child.end_ns = child.start_ns
+    child.start_ns -= int(seconds * 1e9)
+    parent.trace.spans.append(child)
+
+
+def current_span() -> Span:
+    return _current.get() or _NOOP
+
+
+def _finish(finished: Trace) -> None:
+    _traces.append(finished)
+    _counters.incr("traces")
+    _counters.incr("spans", len(finished.spans))
+    if TRACE_EXPORT_PATH:
+        line = json.dumps(to_otlp([finished]), separators=(",", ":"))
+        try:
+            asyncio.get_running_loop().run_in_executor(None, _append_export, line)
+        except RuntimeError:
+            _append_export(line)
+
+
+# -----------------------------
+# Queries
+# -----------------------------
+def recent(limit: int = 50, name: Optional[str] = None, session_id: Optional[str] = None,
+           min_duration_ms: float = 0.0) -> List[Trace]:
+    """Newest-first finished traces matching the filters."""
+    out: List[Trace] = []
+    for t in reversed(_traces):
+        if name and t.root.name != name:
+            continue
+        if session_id and t.root.attributes.get("session_id") != session_id:
+            continue
+        if t.root.duration_ms < min_duration_ms:
+            continue
+        out.append(t)
+        if len(out) >= limit:
+            break
+    return out
+
+
+def get_trace(trace_id: str) -> Optional[Trace]:
+    for t in _traces:
+        if t.trace_id == trace_id:
+            return t
+    return None
+
+
+def _durations(values: List[float]) -> Dict[str, Any]:
+    values = sorted(values)
+    n = len(values)
+    return {
+        "count": n,
+        "mean_ms": round(sum(values) / n, 2),
+        "p50_ms": round(values[n // 2], 2),
+        "p95_ms": round(values[min(n - 1, int(0.95 * n))], 2),
+        "max_ms": round(values[-1], 2),
+    }
+
+
+def aggregates() -> Dict[str, Any]:
+    """Per-phase, per-tool and per-model timing over the buffered traces."""
+    turns: Dict[str, List[float]] = {}
+    phases: Dict[str, List[float]] = {}
+    tools: Dict[str, List[Span]] = {}
+    models: Dict[str, List[Span]] = {}
+    for t in list(_traces):
+        turns.setdefault(str(t.root.attributes.get("route", t.root.name)), []).append(t.root.duration_ms)
+        for s in t.spans:
+            phases.setdefault(s.name, []).append(s.duration_ms)
+            if s.name == "tool":
+                tools.setdefault(str(s.attributes.get("tool")), []).append(s)
+            elif s.name == "llm":
+                models.setdefault(str(s.attributes.get("model")), []).append(s)
+
+    def errors(spans: List[Span]) -> int:
+        return sum(1 for s in spans if s.status == "error" or s.attributes.get("ok") is False)
+
+    def tokens(spans: List[Span], key: str) -> int:
+        return sum(int(s.attributes.get(key) or 0) for s in spans)
+
+    return {
+        "traces": len(_traces),
+        "turns": {route: _durations(d) for route, d in sorted(turns.items())},
+        "phases": {name: _durations(d) for name, d in sorted(phases.items())},
+        "tools": {
+            tool: {**_durations([s.duration_ms for s in spans]), "errors": errors(spans)}
+            for tool, spans in sorted(tools.items())
+        },
+        "models": {
+            model: {
+                **_durations([s.duration_ms for s in spans]),
+                "errors": errors(spans),
+                "prompt_tokens": tokens(spans, "prompt_tokens"),
+                "completion_tokens": tokens(spans, "completion_tokens"),
+            }
+            for model, spans in sorted(models.items())
+        },
+    }
+
+
+# -----------------------------
+# OTLP/JSON export
+# -----------------------------
+_export_lock = threading.Lock()
+
+
+def _append_export(line: str) -> None:
+    try:
+        with _export_lock, open(TRACE_EXPORT_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+        _counters.incr("exported")
+    except OSError as e:
+        _counters.incr("export_failures")
+        logger.warning("Failed to export trace to %s: %s", TRACE_EXPORT_PATH, e)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(trace_id: str, s: Span) -> Dict[str, Any]:
+    out: Dict[str, Any] = {
+        "traceId": trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns or s.start_ns),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items() if v is not None],
+        # STATUS_CODE_OK = 1, STATUS_CODE_ERROR = 2; a cancelled span is left unset
+        "status": {"code": {"ok": 1, "error": 2}.get(s.status, 0), **({"message": s.error} if s.error else {})},
+    }
+    if s.parent_id:
+        out["parentSpanId"] = s.parent_id
+    return out
+
+
+def to_otlp(traces: List[Trace]) -> Dict[str, Any]:
+    spans = [_otlp_span(t.trace_id, s) for t in traces for s in [t.root, *t.spans]]
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "campus_admin"}, "spans": spans}],
+        }]
+    }
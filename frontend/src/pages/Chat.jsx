@@ -26,7 +26,7 @@ function useSSE(url, onMessage, onOpen, onError) {
     source.onmessage = (ev) => {
       try {
         const data = JSON.parse(ev.data);
-        onMessage && onMessage(data);
+        onMessage && onMessage(data, source);
       } catch (e) {
         // ignore malformed chunk
       }
@@ -69,9 +69,30 @@ export default function Chat() {
     ? `${import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000'}/chat/stream?session_id=${encodeURIComponent(sessionId)}&message=${encodeURIComponent(currentMessage)}`
     : null;
 
+  // Move the streamed exchange into history and reset the typing view
+  const finishStream = (finalText) => {
+    const newUserMessage = {
+      id: Date.now().toString(),
+      role: 'user',
+      content: currentMessage,
+      timestamp: new Date().toISOString()
+    };
+    const newAssistantMessage = {
+      id: (Date.now() + 1).toString(),
+      role: 'assistant',
+      content: finalText,
+      timestamp: new Date().toISOString()
+    };
+    setHistory((h) => [...h, newUserMessage, newAssistantMessage]);
+    setLoading(false);
+    setPartial('');
+    partialRef.current = '';
+    setCurrentMessage('');
+  };
+
   useSSE(
     sseUrl,
-    (data) => {
+    (data, source) => {
       if (data.type === 'message_start') {
         // reset accumulators at the start of a streamed message
         partialRef.current = '';
@@ -84,35 +105,26 @@ export default function Chat() {
           setPartial((p) => p + chunk);
         }
       } else if (data.type === 'message_end') {
-        const finalText = partialRef.current;
+        finishStream(partialRef.current);
 
-        const newUserMessage = {
-          id: Date.now().toString(),
-          role: 'user',
-          content: currentMessage,
-          timestamp: new Date().toISOString()
-        };
-        const newAssistantMessage = {
-          id: (Date.now() + 1).toString(),
-          role: 'assistant',
-          content: finalText,
-          timestamp: new Date().toISOString()
-        };
-        setHistory((h) => [...h, newUserMessage, newAssistantMessage]);
-        setLoading(false);
-        setPartial('');
-        partialRef.current = '';
-        setCurrentMessage('');
-        
         // Update stats
         setChatStats(prev => ({
           ...prev,
           totalMessages: prev.totalMessages + 1
         }));
+      } else if (data.type === 'error') {
+        // The reply failed or can no longer be resumed: stop EventSource from reconnecting
+        // and keep whatever text arrived, followed by the server's message
+        source.close();
+        const received = partialRef.current;
+        finishStream(received ? `${received}\n\n${data.message}` : data.message);
       }
     },
     null,
-    () => {
+    (e) => {
+      // A dropped connection is retried by EventSource with Last-Event-ID and resumes the same
+      // reply on the server; only give up once the browser has closed the stream for good
+      if (e && e.target && e.target.readyState !== EventSource.CLOSED) return;
       // onError: end loading and clear partial typing view but do not mutate history
       setLoading(false);
       setPartial('');